@@ -0,0 +1,104 @@
+"""
+Account number allocation.
+
+Numbers are 11 digits taken from the account_number sequence in the
+number_sequences table, followed by a Luhn check digit, so they are 12
+digits long like the random numbers issued before.
+
+Each worker process reserves ACCOUNT_NUMBER_BLOCK_SIZE sequence values at
+a time in its own short transaction and then hands them out from memory,
+so opening an account normally costs no query at all. When a block is
+reserved, numbers in its range that already exist (left over from the
+old random generator) are skipped with one range query. Values reserved
+but never used leave gaps, which is fine for account numbers.
+
+Callers allocate before they start writing: on SQLite the reservation
+needs the writer lock, which the caller's own open write would hold.
+
+The allocator's asyncio.Lock is created for the running event loop on
+first use and replaced when a later loop uses it, so the module-level
+allocator works across separate asyncio.run() calls (scripts, test
+clients) instead of failing with "bound to a different event loop".
+"""
+from collections import deque
+from typing import List, Optional
+from sqlalchemy import select, update
+import asyncio
+import os
+
+from models import Account, NumberSequence
+
+SEQUENCE_NAME = "account_number"
+SEQUENCE_START = 10_000_000_000  # first 11-digit body
+BLOCK_SIZE = int(os.getenv("ACCOUNT_NUMBER_BLOCK_SIZE", "100"))
+
+def luhn_check_digit(body: str) -> str:
+    total = 0
+    # Doubling starts from the rightmost body digit, since the check digit goes after it
+    for position, digit in enumerate(reversed(body)):
+        value = int(digit)
+        if position % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str((10 - total % 10) % 10)
+
+def is_valid_account_number(number: str) -> bool:
+    return len(number) == 12 and number.isdigit() and luhn_check_digit(number[:-1]) == number[-1]
+
+def account_number(value: int) -> str:
+    body = str(value)
+    return body + luhn_check_digit(body)
+
+class AccountNumberAllocator:
+    def __init__(self, bind=None, block_size: int = BLOCK_SIZE):
+        self.bind = bind
+        self.block_size = block_size
+        self._available = deque()
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.blocks_reserved = 0
+
+    def _loop_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    async def _reserve_block(self, size: int):
+        if self.bind is None:
+            from database import async_engine
+            self.bind = async_engine
+        async with self.bind.begin() as conn:
+            # The UPDATE takes the row lock, so the read below sees this
+            # transaction's own increment and no other worker's.
+            await conn.execute(
+                update(NumberSequence)
+                .where(NumberSequence.name == SEQUENCE_NAME)
+                .values(next_value=NumberSequence.next_value + size)
+            )
+            end = await conn.scalar(select(NumberSequence.next_value).where(NumberSequence.name == SEQUENCE_NAME))
+            start = end - size
+            numbers = [account_number(value) for value in range(start, end)]
+            taken = set(await conn.scalars(
+                select(Account.account_number)
+                .where(Account.account_number.between(numbers[0], numbers[-1]))
+            ))
+        self._available.extend(number for number in numbers if number not in taken)
+        self.blocks_reserved += 1
+
+    async def allocate(self, count: int = 1) -> List[str]:
+        async with self._loop_lock():
+            while len(self._available) < count:
+                await self._reserve_block(max(self.block_size, count - len(self._available)))
+            return [self._available.popleft() for _ in range(count)]
+
+allocator = AccountNumberAllocator()
+
+async def next_account_number() -> str:
+    return (await allocator.allocate(1))[0]
+
+async def allocate_account_numbers(count: int) -> List[str]:
+    return await allocator.allocate(count)
@@ -1,13 +1,15 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from database import get_db
-from models import User
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_write_db
+from models import Customer, User
 from schemas import TokenData
+from principal_cache import Principal, cache as principal_cache
+import hashing
 import os
 
 # Security configuration
@@ -15,14 +17,14 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production-min-3
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    valid, _ = await hashing.verify_password(plain_password, hashed_password)
+    return valid
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    return await hashing.hash_password(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -34,20 +36,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
-    user = db.query(User).filter(User.email == email).first()
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
+    user = await db.scalar(select(User).where(User.email == email))
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    valid, new_hash = await hashing.verify_password(password, user.password_hash)
+    if not valid:
         return None
     if user.is_active == 0:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Account is blocked"
         )
+    if new_hash is not None:
+        # Stored with an outdated cost; saved by the caller's commit
+        user.password_hash = new_hash
     return user
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_write_db)) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -62,18 +68,26 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.email == token_data.email).first()
-    if user is None:
-        raise credentials_exception
-    if user.is_active == 0:
+    principal = principal_cache.get(token_data.email)
+    if principal is None:
+        row = (await db.execute(
+            select(User, Customer.id)
+            .outerjoin(Customer, Customer.user_id == User.id)
+            .where(User.email == token_data.email)
+        )).first()
+        if row is None:
+            raise credentials_exception
+        principal = Principal.from_user(*row)
+        principal_cache.put(token_data.email, principal)
+    if principal.is_active == 0:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Account is blocked"
         )
-    return user
+    return principal
 
 def require_role(allowed_roles: list):
-    def role_checker(current_user: User = Depends(get_current_user)):
+    def role_checker(current_user: Principal = Depends(get_current_user)):
         if current_user.role.value not in allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -83,7 +97,7 @@ def require_role(allowed_roles: list):
     return role_checker
 
 # Role-specific dependencies
-def require_admin(current_user: User = Depends(get_current_user)):
+def require_admin(current_user: Principal = Depends(get_current_user)):
     if current_user.role.value != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -91,7 +105,7 @@ def require_admin(current_user: User = Depends(get_current_user)):
         )
     return current_user
 
-def require_staff(current_user: User = Depends(get_current_user)):
+def require_staff(current_user: Principal = Depends(get_current_user)):
     if current_user.role.value not in ["admin", "staff"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -99,7 +113,7 @@ def require_staff(current_user: User = Depends(get_current_user)):
         )
     return current_user
 
-def require_customer(current_user: User = Depends(get_current_user)):
+def require_customer(current_user: Principal = Depends(get_current_user)):
     if current_user.role.value != "customer":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -0,0 +1,122 @@
+"""
+End-of-day balance snapshots.
+
+balance_snapshots holds an account's balance at the end of each day on
+which it had transactions. Between two such days its balance did not
+move, so the balance at any moment is the nearest earlier snapshot plus
+at most one day of transactions (services.balance_as_of).
+
+run() is incremental: it snapshots each complete day after the newest one
+already stored (on the first run, just yesterday; --since backfills from
+an earlier date). Each day costs one grouped query over that day's
+transactions, one lookup of the active accounts' previous snapshots and
+one insert, in a single transaction. An account's first snapshot is
+derived backwards from its live balance in the same statement that sums
+its later transactions, so it is consistent even though writes continue.
+A day is only snapshotted once it ended SETTLE_MINUTES ago, so
+transactions still committing around midnight are not missed.
+
+Transactions are read from both the hot table and the archive.
+
+Usage: python balance_snapshots.py [--since 2024-01-01]
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Sequence
+from sqlalchemy import and_, delete, func, insert, select, union_all
+from sqlalchemy.engine import Connection, Engine
+
+from models import Account, ArchivedTransaction, BalanceSnapshot, Transaction
+
+SETTLE_MINUTES = 5
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+def deltas(start: Optional[datetime] = None, end: Optional[datetime] = None,
+           account_ids: Optional[Sequence[int]] = None):
+    """(account_id, delta) for every ledger posting in [start, end), hot and archived."""
+    branches = []
+    for ledger in (Transaction, ArchivedTransaction):
+        for column, sign in ((ledger.to_account_id, 1), (ledger.from_account_id, -1)):
+            criteria = [column.isnot(None)]
+            if account_ids is not None:
+                criteria.append(column.in_(account_ids))
+            if start is not None:
+                criteria.append(ledger.timestamp >= start)
+            if end is not None:
+                criteria.append(ledger.timestamp < end)
+            branches.append(select(column.label("account_id"), (sign * ledger.amount).label("delta")).where(*criteria))
+    return union_all(*branches).subquery()
+
+def net_change(account_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """SELECT of the account's net change over [start, end)."""
+    postings = deltas(start, end, [account_id])
+    return select(func.coalesce(func.sum(postings.c.delta), 0.0))
+
+# ================= JOB =================
+
+def snapshot_day(conn: Connection, day: date) -> int:
+    """Write the end-of-day snapshots of every account active on day."""
+    start, end = day_start(day), day_start(day + timedelta(days=1))
+    postings = deltas(start, end)
+    net = dict(conn.execute(select(postings.c.account_id, func.sum(postings.c.delta)).group_by(postings.c.account_id)).all())
+    conn.execute(delete(BalanceSnapshot).where(BalanceSnapshot.day == day))
+    if not net:
+        return 0
+
+    latest = (
+        select(BalanceSnapshot.account_id, func.max(BalanceSnapshot.day).label("day"))
+        .where(BalanceSnapshot.account_id.in_(net), BalanceSnapshot.day < day)
+        .group_by(BalanceSnapshot.account_id)
+        .subquery()
+    )
+    balances = {
+        account_id: balance + net[account_id]
+        for account_id, balance in conn.execute(
+            select(BalanceSnapshot.account_id, BalanceSnapshot.balance)
+            .join(latest, and_(BalanceSnapshot.account_id == latest.c.account_id, BalanceSnapshot.day == latest.c.day))
+        )
+    }
+
+    first = [account_id for account_id in net if account_id not in balances]
+    if first:
+        # Live balance minus everything posted after the day ended
+        later = deltas(end, None, first)
+        after = select(later.c.account_id, func.sum(later.c.delta).label("delta")).group_by(later.c.account_id).subquery()
+        balances.update(conn.execute(
+            select(Account.id, Account.balance - func.coalesce(after.c.delta, 0.0))
+            .outerjoin(after, after.c.account_id == Account.id)
+            .where(Account.id.in_(first))
+        ).all())
+
+    conn.execute(insert(BalanceSnapshot), [
+        {"account_id": account_id, "day": day, "balance": balance} for account_id, balance in balances.items()
+    ])
+    return len(balances)
+
+def run(bind: Optional[Engine] = None, since: Optional[date] = None, now: Optional[datetime] = None) -> dict:
+    """Snapshot every complete day not snapshotted yet; since overrides the first day."""
+    if bind is None:
+        from database import engine as bind
+    last_day = ((now or datetime.utcnow()) - timedelta(minutes=SETTLE_MINUTES)).date() - timedelta(days=1)
+    if since is None:
+        with bind.connect() as conn:
+            newest = conn.scalar(select(func.max(BalanceSnapshot.day)))
+        since = newest + timedelta(days=1) if newest is not None else last_day
+    days = snapshots = 0
+    day = since
+    while day <= last_day:
+        with bind.begin() as conn:
+            snapshots += snapshot_day(conn, day)
+        days += 1
+        day += timedelta(days=1)
+    return {"days": days, "snapshots": snapshots, "through": last_day.isoformat()}
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Write end-of-day balance snapshots.")
+    parser.add_argument("--since", type=date.fromisoformat, help="first day to (re)snapshot")
+    args = parser.parse_args()
+    print(json.dumps(run(since=args.since)))
@@ -0,0 +1,6 @@
+"""
+Benchmarks for the banking backend.
+
+Run from the backend directory, e.g. `python -m benchmarks.async_db`.
+They need httpx on top of requirements.txt (see benchmarks/requirements.txt).
+"""
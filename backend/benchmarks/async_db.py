@@ -0,0 +1,109 @@
+"""
+Throughput of async handlers on sync vs async database sessions.
+
+Two minimal FastAPI apps serve the same transaction-page query against a
+seeded SQLite file. The "sync" app calls a sync Session from an async def
+handler, as every endpoint did before the AsyncSession port, so each query
+blocks the event loop. The "async" app uses AsyncSession. Requests are
+driven in-process at a fixed concurrency.
+
+SQLite answers in microseconds, which hides the cost of blocking the loop;
+--latency-ms adds a simulated network round-trip to every statement, as a
+MySQL or PostgreSQL server would. Both pools are sized to the concurrency:
+with a smaller sync pool the old pattern deadlocks, because a handler
+waiting for a connection blocks the loop that would return one.
+
+Usage: python -m benchmarks.async_db [--rows 100000] [--requests 2000] [--concurrency 50] [--latency-ms 0 2]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from fastapi import Depends, FastAPI
+import httpx
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from transaction_queries import to_response, transaction_listing
+from benchmarks.common import async_sessions, create_engines, seed_accounts, seed_transactions
+
+ACCOUNTS = 100
+
+def build_apps(engine, async_engine, latency: list):
+    SyncSession = sessionmaker(bind=engine)
+    AsyncSessionMaker = async_sessions(async_engine)
+
+    def round_trip(*args):
+        if latency[0]:
+            time.sleep(latency[0])
+
+    for _engine in (engine, async_engine.sync_engine):
+        event.listen(_engine, "before_cursor_execute", round_trip)
+
+    def get_sync_db():
+        db = SyncSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_async_db():
+        async with AsyncSessionMaker() as db:
+            yield db
+
+    sync_app, async_app = FastAPI(), FastAPI()
+
+    @sync_app.get("/page/{account_id}")
+    async def sync_page(account_id: int, db=Depends(get_sync_db)):
+        stmt = transaction_listing(account_ids=[account_id % ACCOUNTS + 1], limit=50)
+        return [to_response(*row) for row in db.execute(stmt)]
+
+    @async_app.get("/page/{account_id}")
+    async def async_page(account_id: int, db: AsyncSession = Depends(get_async_db)):
+        stmt = transaction_listing(account_ids=[account_id % ACCOUNTS + 1], limit=50)
+        return [to_response(*row) for row in await db.execute(stmt)]
+
+    return sync_app, async_app
+
+async def drive(app, requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        counter = iter(range(requests))
+
+        async def worker():
+            for n in counter:
+                response = await client.get(f"/page/{n}")
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return requests / (time.perf_counter() - started)
+
+async def main(rows: int, requests: int, concurrency: int, latencies_ms: list):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        latency = [0.0]
+        engine, async_engine = create_engines(path, pool_size=concurrency)
+        seed_accounts(engine, ACCOUNTS)
+        seed_transactions(engine, rows, ACCOUNTS)
+        sync_app, async_app = build_apps(engine, async_engine, latency)
+        print(f"Seeded {rows} transactions; {requests} requests at concurrency {concurrency}")
+        for latency_ms in latencies_ms:
+            latency[0] = latency_ms / 1000
+            print(f"round-trip {latency_ms} ms")
+            for name, app in (("sync session", sync_app), ("async session", async_app)):
+                await drive(app, min(requests, 100), concurrency)  # warm up
+                throughput = await drive(app, requests, concurrency)
+                print(f"  {name:>14}: {throughput:8.1f} req/s")
+        await async_engine.dispose()
+        engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, nargs="+", default=[0, 2])
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.requests, args.concurrency, args.latency_ms))
@@ -0,0 +1,72 @@
+"""
+Throughput of per-call transfers vs the batch transfer service.
+
+Seeds a scratch SQLite file with funded accounts, then applies the same
+list of random transfers twice: once through services.transfer_money (one
+commit per transfer, as /api/customer/transfer does) and once through
+services.transfer_batch in batches of --batch-size. Total balance is
+checked after each run.
+
+Usage: python -m benchmarks.batch_transfers [--accounts 1000] [--transfers 5000] [--batch-size 1000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from sqlalchemy import func, select
+from models import Account
+from schemas import BatchTransferRequest, TransferRequest
+from services import transfer_batch, transfer_money
+from benchmarks.common import async_sessions, create_engines, seed_accounts
+
+def random_transfers(count: int, accounts: int):
+    rng = random.Random(42)
+    transfers = []
+    for _ in range(count):
+        source, target = rng.sample(range(accounts), 2)
+        transfers.append(TransferRequest(
+            from_account_id=source + 1, to_account_number=f"{target:012d}", amount=rng.randint(1, 100)
+        ))
+    return transfers
+
+async def per_call(Session, transfers):
+    for item in transfers:
+        async with Session() as db:
+            await transfer_money(db, item)
+
+async def batched(Session, transfers, batch_size: int):
+    for start in range(0, len(transfers), batch_size):
+        async with Session() as db:
+            result = await transfer_batch(db, BatchTransferRequest(transfers=transfers[start:start + batch_size]))
+            assert result.committed, result.results[:5]
+
+async def total_balance(Session) -> float:
+    async with Session() as db:
+        return await db.scalar(select(func.sum(Account.balance)))
+
+async def main(accounts: int, count: int, batch_size: int):
+    transfers = random_transfers(count, accounts)
+    for name, run in (("per call", lambda S: per_call(S, transfers)),
+                      ("batch", lambda S: batched(S, transfers, batch_size))):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine, async_engine = create_engines(os.path.join(tmp, "bench.db"))
+            seed_accounts(engine, accounts, balance=1_000_000.0)
+            Session = async_sessions(async_engine)
+            before = await total_balance(Session)
+            started = time.perf_counter()
+            await run(Session)
+            elapsed = time.perf_counter() - started
+            assert await total_balance(Session) == before
+            print(f"{name:>9}: {count / elapsed:9.1f} transfers/s ({elapsed:.2f} s)")
+            await async_engine.dispose()
+            engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--transfers", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.accounts, args.transfers, args.batch_size))
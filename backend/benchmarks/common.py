@@ -0,0 +1,40 @@
+"""Scratch databases for the benchmarks."""
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from migrations import run_migrations
+from models import Account, AccountType, AccountStatus, Customer, Transaction, TransactionType, User, UserRole
+
+def create_engines(path: str, pool_size: int = 5):
+    """Sync and async engines on one SQLite file, with the schema applied."""
+    pool_args = {"pool_size": pool_size, "max_overflow": 0}
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, **pool_args)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=AsyncAdaptedQueuePool, **pool_args)
+    run_migrations(engine)
+    return engine, async_engine
+
+def async_sessions(async_engine):
+    return async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def seed_accounts(engine, accounts: int, balance: float = 1000.0):
+    """One customer with one active savings account each; account numbers are the zero-padded index."""
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"name": f"user{i}", "email": f"user{i}@bench.example.com", "password_hash": "x",
+             "role": UserRole.CUSTOMER, "is_active": 1}
+            for i in range(accounts)
+        ])
+        conn.execute(insert(Customer), [{"user_id": i + 1} for i in range(accounts)])
+        conn.execute(insert(Account), [
+            {"customer_id": i + 1, "account_number": f"{i:012d}", "balance": balance,
+             "account_type": AccountType.SAVINGS, "status": AccountStatus.ACTIVE}
+            for i in range(accounts)
+        ])
+
+def seed_transactions(engine, rows: int, accounts: int):
+    with engine.begin() as conn:
+        conn.execute(insert(Transaction), [
+            {"from_account_id": i % accounts + 1, "to_account_id": (i * 7) % accounts + 1, "amount": 1.0,
+             "transaction_type": TransactionType.TRANSFER, "description": "bench"}
+            for i in range(rows)
+        ])
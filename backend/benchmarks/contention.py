@@ -0,0 +1,122 @@
+"""
+Concurrent transfers over a few hot accounts.
+
+Several threads, each with its own event loop and engine, move money
+between --accounts accounts at random. Two implementations are compared:
+
+- read-modify-write: the transfer path before conditional updates, which
+  loads both accounts, checks the balance in Python and assigns the new
+  values;
+- conditional: services.transfer_money, where each debit and credit is one
+  UPDATE ... WHERE balance >= amount.
+
+Afterwards every account's balance is checked against its opening balance
+plus the ledger; any difference is a lost update.
+
+Usage: python -m benchmarks.contention [--threads 8] [--transfers 300] [--accounts 10]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+from models import Account, Transaction, TransactionType
+from schemas import TransferRequest
+from services import transfer_money
+from benchmarks.common import async_sessions, create_engines, seed_accounts
+
+OPENING_BALANCE = 1000.0
+
+async def read_modify_write_transfer(db, item: TransferRequest):
+    from_account = await db.get(Account, item.from_account_id)
+    to_account = await db.scalar(select(Account).where(Account.account_number == item.to_account_number))
+    if from_account.balance < item.amount:
+        raise HTTPException(status_code=400, detail="Insufficient balance")
+    from_account.balance -= item.amount
+    to_account.balance += item.amount
+    db.add(Transaction(
+        from_account_id=from_account.id,
+        to_account_id=to_account.id,
+        amount=item.amount,
+        transaction_type=TransactionType.TRANSFER,
+    ))
+    await db.commit()
+
+def worker(path: str, transfer, transfers: int, accounts: int, seed: int, counts: dict, lock: threading.Lock):
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        Session = async_sessions(engine)
+        rng = random.Random(seed)
+        done = declined = failed = 0
+        for _ in range(transfers):
+            source, target = rng.sample(range(accounts), 2)
+            item = TransferRequest(from_account_id=source + 1, to_account_number=f"{target:012d}",
+                                   amount=rng.randint(1, 50))
+            async with Session() as db:
+                try:
+                    await transfer(db, item)
+                    done += 1
+                except HTTPException as e:
+                    if e.status_code >= 500:
+                        failed += 1
+                    else:
+                        declined += 1
+                except OperationalError:
+                    failed += 1
+        await engine.dispose()
+        with lock:
+            counts["done"] += done
+            counts["declined"] += declined
+            counts["failed"] += failed
+
+    asyncio.run(run())
+
+def lost_updates(engine, accounts: int) -> int:
+    """Accounts whose balance disagrees with opening balance plus ledger."""
+    with engine.connect() as conn:
+        balances = dict(conn.execute(select(Account.id, Account.balance)).all())
+        sent = dict(conn.execute(select(Transaction.from_account_id, func.sum(Transaction.amount))
+                                 .group_by(Transaction.from_account_id)).all())
+        received = dict(conn.execute(select(Transaction.to_account_id, func.sum(Transaction.amount))
+                                     .group_by(Transaction.to_account_id)).all())
+    return sum(
+        1 for account_id in range(1, accounts + 1)
+        if abs(OPENING_BALANCE + received.get(account_id, 0) - sent.get(account_id, 0) - balances[account_id]) > 1e-6
+    )
+
+def main(threads: int, transfers: int, accounts: int):
+    for name, transfer in (("read-modify-write", read_modify_write_transfer), ("conditional", transfer_money)):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            engine, async_engine = create_engines(path)
+            seed_accounts(engine, accounts, balance=OPENING_BALANCE)
+            counts = {"done": 0, "declined": 0, "failed": 0}
+            lock = threading.Lock()
+            pool = [
+                threading.Thread(target=worker, args=(path, transfer, transfers, accounts, seed, counts, lock))
+                for seed in range(threads)
+            ]
+            started = time.perf_counter()
+            for thread in pool:
+                thread.start()
+            for thread in pool:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            print(f"{name:>17}: {counts['done'] / elapsed:7.1f} transfers/s, "
+                  f"{counts['done']} applied, {counts['declined']} declined, {counts['failed']} failed, "
+                  f"{lost_updates(engine, accounts)} accounts with lost updates")
+            engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--transfers", type=int, default=300, help="per thread")
+    parser.add_argument("--accounts", type=int, default=10)
+    args = parser.parse_args()
+    main(args.threads, args.transfers, args.accounts)
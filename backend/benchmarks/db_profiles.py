@@ -0,0 +1,89 @@
+"""
+Transfer throughput under each database profile.
+
+--concurrency tasks each apply --transfers random transfers through
+services.transfer_money (one commit per transfer, as
+/api/customer/transfer does) against:
+
+- sqlite-default: rollback journal, synchronous=FULL, SQLite's default
+  page cache and no memory map, as the old hardcoded engine ran;
+- sqlite-tuned: the PRAGMAs from settings.DatabaseSettings (WAL,
+  synchronous=NORMAL, mmap_size, cache_size, busy_timeout);
+- server: --server-url, a MySQL or Postgres URL, with the configured
+  pool settings. It must point at an empty scratch database: the schema
+  is created and accounts are seeded in it.
+
+Total balance is checked after each run.
+
+Usage: python -m benchmarks.db_profiles [--concurrency 20] [--transfers 50] [--server-url mysql+pymysql://...]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from database import create_async_db_engine, create_db_engine
+from migrations import run_migrations
+from models import Account
+from schemas import TransferRequest
+from services import transfer_money
+from settings import DatabaseSettings
+from benchmarks.common import async_sessions, seed_accounts
+
+ACCOUNTS = 1000
+
+def profiles(tmp: str, server_url: str, concurrency: int):
+    pool = {"pool_size": concurrency, "max_overflow": 0}
+    yield "sqlite-default", DatabaseSettings(
+        url=f"sqlite:///{os.path.join(tmp, 'default.db')}",
+        sqlite_journal_mode="DELETE", sqlite_synchronous="FULL", sqlite_mmap_size=0, sqlite_cache_size=-2000, sqlite_busy_timeout_ms=5000, **pool,
+    )
+    yield "sqlite-tuned", DatabaseSettings(url=f"sqlite:///{os.path.join(tmp, 'tuned.db')}", **pool)
+    if server_url:
+        yield "server", DatabaseSettings(url=server_url, **pool)
+
+async def client(Session, transfers: int, seed: int, counts: dict):
+    rng = random.Random(seed)
+    for _ in range(transfers):
+        source, target = rng.sample(range(ACCOUNTS), 2)
+        item = TransferRequest(from_account_id=source + 1, to_account_number=f"{target:012d}",
+                               amount=rng.randint(1, 50))
+        async with Session() as db:
+            try:
+                await transfer_money(db, item)
+                counts["done"] += 1
+            except HTTPException:
+                counts["failed"] += 1
+
+async def total_balance(Session) -> float:
+    async with Session() as db:
+        return await db.scalar(select(func.sum(Account.balance)))
+
+async def main(concurrency: int, transfers: int, server_url: str):
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, config in profiles(tmp, server_url, concurrency):
+            engine = create_db_engine(config)
+            async_engine = create_async_db_engine(config)
+            run_migrations(engine)
+            seed_accounts(engine, ACCOUNTS, balance=1_000_000.0)
+            Session = async_sessions(async_engine)
+            before = await total_balance(Session)
+            counts = {"done": 0, "failed": 0}
+            started = time.perf_counter()
+            await asyncio.gather(*(client(Session, transfers, seed, counts) for seed in range(concurrency)))
+            elapsed = time.perf_counter() - started
+            assert await total_balance(Session) == before
+            print(f"{name:>14}: {counts['done'] / elapsed:8.1f} transfers/s, {counts['failed']} failed")
+            await async_engine.dispose()
+            engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--transfers", type=int, default=50, help="per task")
+    parser.add_argument("--server-url", help="empty scratch MySQL/Postgres database")
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.transfers, args.server_url))
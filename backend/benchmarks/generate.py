@@ -0,0 +1,284 @@
+"""
+Synthetic bank data at volume.
+
+Adds to the configured database (DATABASE_URL, or --database-url):
+
+- --customers customers, each with a savings account and, for
+  --second-account-share of them, a checking account as well;
+- --merchants business customers with one checking account each;
+- --transactions ledger rows spread over the last --days days, after an
+  initial deposit into every account.
+
+Activity is skewed the way a real ledger is:
+
+- how often an account pays or withdraws follows a Zipf law (exponent
+  --zipf), so a few customers are very active and most form a long tail
+  with a handful of transactions;
+- --merchant-share of transfers go to the merchants, which are Zipf
+  weighted too, so the top merchants are hot accounts;
+- the mix is 70% transfers, 20% deposits and 10% withdrawals with
+  log-normal amounts. A payment larger than the balance is scaled down,
+  or becomes a deposit, so balances never go negative.
+
+The ledger is simulated once to get each account's final balance, so
+accounts are inserted with it, and then regenerated from the same seed
+while its rows are inserted, --batch-size rows per transaction. Account
+numbers are reserved from the account_number sequence and the dashboard
+counters are recomputed at the end. Running it again adds more data.
+
+Every generated user can log in as user<id>@load.example.com with
+--password. The id range and the hottest merchant accounts are written to
+--manifest, which benchmarks.load reads.
+
+Usage: python -m benchmarks.generate [--customers 10000] [--merchants 20] [--transactions 200000] [--days 365]
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Iterator, List
+from sqlalchemy import func, insert, select, text, update
+
+from account_numbers import SEQUENCE_NAME, account_number
+from database import create_db_engine, engine as default_engine
+from hashing import pwd_context
+from migrations import run_migrations
+from models import (
+    Account, AccountStatus, AccountType, ArchivedTransaction, Customer, NumberSequence,
+    Transaction, TransactionType, User, UserRole
+)
+import stats
+
+EMAIL = "user{id}@load.example.com"
+HOT_MERCHANTS_IN_MANIFEST = 20
+
+def zipf_cum_weights(n: int, exponent: float) -> List[float]:
+    total, weights = 0.0, []
+    for rank in range(1, n + 1):
+        total += rank ** -exponent
+        weights.append(total)
+    return weights
+
+def money(value: float) -> float:
+    return round(value, 2)
+
+class Bank:
+    """The generated customers and accounts, by position; ids are offsets from what the database holds."""
+    def __init__(self, args, first_user_id: int, first_customer_id: int, first_account_id: int, first_sequence_value: int):
+        rng = random.Random(args.seed)
+        self.args = args
+        self.first_user_id = first_user_id
+        self.first_customer_id = first_customer_id
+        self.first_account_id = first_account_id
+        self.first_sequence_value = first_sequence_value
+        self.now = datetime.utcnow()
+        self.window_start = self.now - timedelta(days=args.days)
+
+        # (customer position, account type) per account; merchants come last
+        self.accounts = []
+        for position in range(args.customers):
+            self.accounts.append((position, AccountType.SAVINGS))
+            if rng.random() < args.second_account_share:
+                self.accounts.append((position, AccountType.CHECKING))
+        self.merchant_accounts = list(range(len(self.accounts), len(self.accounts) + args.merchants))
+        self.accounts.extend((args.customers + index, AccountType.CHECKING) for index in range(args.merchants))
+
+        # Zipf rank decides activity; shuffled so hot accounts are not simply the lowest ids
+        self.customer_accounts = list(range(len(self.accounts) - args.merchants))
+        rng.shuffle(self.customer_accounts)
+        rng.shuffle(self.merchant_accounts)
+        self.customer_weights = zipf_cum_weights(len(self.customer_accounts), args.zipf)
+        self.merchant_weights = zipf_cum_weights(len(self.merchant_accounts), args.zipf)
+
+    def account_id(self, index: int) -> int:
+        return self.first_account_id + index
+
+    def account_number(self, index: int) -> str:
+        return account_number(self.first_sequence_value + index)
+
+    def opened_at(self, index: int) -> datetime:
+        # Accounts open over the 30 days before the window, in id order
+        return self.window_start - timedelta(days=30) * (1 - index / len(self.accounts))
+
+    def ledger(self, balances: List[float]) -> Iterator[dict]:
+        """Ledger rows in id order; balances (one per account) is updated as they are generated."""
+        args = self.args
+        rng = random.Random(args.seed + 1)
+
+        def pick_customer() -> int:
+            return rng.choices(self.customer_accounts, cum_weights=self.customer_weights)[0]
+
+        def pick_merchant() -> int:
+            return rng.choices(self.merchant_accounts, cum_weights=self.merchant_weights)[0]
+
+        for index in range(len(self.accounts)):
+            amount = money(rng.lognormvariate(7, 1))
+            balances[index] = money(balances[index] + amount)
+            yield self.row(None, index, amount, TransactionType.DEPOSIT, self.opened_at(index), "Initial deposit")
+
+        seconds = (self.now - self.window_start).total_seconds()
+        offset = 0.0
+        for _ in range(args.transactions):
+            offset = min(offset + rng.expovariate(args.transactions / seconds), seconds)
+            at = self.window_start + timedelta(seconds=offset)
+            kind = rng.random()
+            source = pick_customer()
+            if kind < 0.2:
+                amount = money(rng.lognormvariate(6, 0.8))
+                balances[source] = money(balances[source] + amount)
+                yield self.row(None, source, amount, TransactionType.DEPOSIT, at, "Salary")
+                continue
+            if kind < 0.3:
+                amount, target, description = money(rng.lognormvariate(4, 1)), None, "ATM withdrawal"
+            elif args.merchants and rng.random() < args.merchant_share:
+                amount, target, description = money(rng.lognormvariate(3.5, 1)), pick_merchant(), "Card payment"
+            else:
+                target = pick_customer()
+                if target == source:
+                    target = pick_customer()
+                amount, description = money(rng.lognormvariate(4.5, 1)), "Transfer"
+            if amount > balances[source]:
+                amount = money(balances[source] / 2)
+            if amount < 0.01 or target == source:
+                amount = money(rng.lognormvariate(6, 0.8))
+                balances[source] = money(balances[source] + amount)
+                yield self.row(None, source, amount, TransactionType.DEPOSIT, at, "Salary")
+                continue
+            balances[source] = money(balances[source] - amount)
+            if target is None:
+                yield self.row(source, None, amount, TransactionType.WITHDRAW, at, description)
+            else:
+                balances[target] = money(balances[target] + amount)
+                yield self.row(source, target, amount, TransactionType.TRANSFER, at, description)
+
+    def row(self, source, target, amount, transaction_type, at, description) -> dict:
+        return {
+            "from_account_id": None if source is None else self.account_id(source),
+            "to_account_id": None if target is None else self.account_id(target),
+            "amount": amount,
+            "transaction_type": transaction_type,
+            "timestamp": at,
+            "description": description,
+        }
+
+def batches(rows, size: int) -> Iterator[list]:
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def next_ids(conn):
+    """First free user, customer, account and transaction ids and account-number sequence value."""
+    last_transaction = max(
+        conn.scalar(select(func.max(Transaction.id))) or 0,
+        conn.scalar(select(func.max(ArchivedTransaction.id))) or 0,
+    )
+    return (
+        (conn.scalar(select(func.max(User.id))) or 0) + 1,
+        (conn.scalar(select(func.max(Customer.id))) or 0) + 1,
+        (conn.scalar(select(func.max(Account.id))) or 0) + 1,
+        last_transaction + 1,
+        conn.scalar(select(NumberSequence.next_value).where(NumberSequence.name == SEQUENCE_NAME)),
+    )
+
+def reset_postgres_sequences(conn):
+    """Explicit ids do not advance PostgreSQL serial sequences; move them past the new rows."""
+    for table in ("users", "customers", "accounts", "transactions"):
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+        ))
+
+def generate(bind, args) -> dict:
+    started = time.perf_counter()
+    with bind.begin() as conn:
+        first_user_id, first_customer_id, first_account_id, first_transaction_id, first_number = next_ids(conn)
+        # Reserve the account numbers now so the running app never hands them out
+        conn.execute(
+            update(NumberSequence).where(NumberSequence.name == SEQUENCE_NAME)
+            .values(next_value=NumberSequence.next_value + args.customers * 2 + args.merchants)
+        )
+    bank = Bank(args, first_user_id, first_customer_id, first_account_id, first_number)
+
+    balances = [0.0] * len(bank.accounts)
+    for _ in bank.ledger(balances):
+        pass
+    print(f"simulated {len(bank.accounts)} accounts in {time.perf_counter() - started:.1f}s")
+
+    password_hash = pwd_context().hash(args.password)
+    people = args.customers + args.merchants
+    for batch in batches(range(people), args.batch_size):
+        with bind.begin() as conn:
+            conn.execute(insert(User), [
+                {"id": first_user_id + position, "email": EMAIL.format(id=first_user_id + position),
+                 "name": f"Merchant {position - args.customers + 1}" if position >= args.customers else f"Customer {first_user_id + position}",
+                 "password_hash": password_hash, "role": UserRole.CUSTOMER, "is_active": 1}
+                for position in batch
+            ])
+            conn.execute(insert(Customer), [
+                {"id": first_customer_id + position, "user_id": first_user_id + position} for position in batch
+            ])
+    for batch in batches(range(len(bank.accounts)), args.batch_size):
+        with bind.begin() as conn:
+            conn.execute(insert(Account), [
+                {"id": bank.account_id(index), "customer_id": first_customer_id + bank.accounts[index][0],
+                 "account_number": bank.account_number(index), "balance": balances[index],
+                 "account_type": bank.accounts[index][1], "status": AccountStatus.ACTIVE,
+                 "created_at": bank.opened_at(index)}
+                for index in batch
+            ])
+    print(f"inserted {people} customers in {time.perf_counter() - started:.1f}s")
+
+    rows = 0
+    replay = [0.0] * len(bank.accounts)
+    for batch in batches(bank.ledger(replay), args.batch_size):
+        for offset, row in enumerate(batch):
+            row["id"] = first_transaction_id + rows + offset
+        with bind.begin() as conn:
+            conn.execute(insert(Transaction), batch)
+        rows += len(batch)
+    print(f"inserted {rows} transactions in {time.perf_counter() - started:.1f}s")
+
+    with bind.begin() as conn:
+        if bind.dialect.name == "postgresql":
+            reset_postgres_sequences(conn)
+        stats.recompute(conn)
+
+    hot_merchants = bank.merchant_accounts[:HOT_MERCHANTS_IN_MANIFEST]
+    return {
+        "generated_at": bank.now.isoformat(),
+        "email": EMAIL,
+        "password": args.password,
+        "customer_user_ids": [first_user_id, first_user_id + args.customers - 1],
+        "merchant_account_numbers": [bank.account_number(index) for index in hot_merchants],
+        "accounts": len(bank.accounts),
+        "transactions": rows,
+        "seconds": round(time.perf_counter() - started, 1),
+        "options": vars(args),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the database with synthetic customers, accounts and transactions.")
+    parser.add_argument("--customers", type=int, default=10_000)
+    parser.add_argument("--merchants", type=int, default=20)
+    parser.add_argument("--transactions", type=int, default=200_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--second-account-share", type=float, default=0.3)
+    parser.add_argument("--merchant-share", type=float, default=0.5)
+    parser.add_argument("--zipf", type=float, default=1.1, help="skew of account activity")
+    parser.add_argument("--password", default="loadtest")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", help="defaults to DATABASE_URL")
+    parser.add_argument("--manifest", default="loadgen.json")
+    args = parser.parse_args()
+
+    bind = create_db_engine(url=args.database_url) if args.database_url else default_engine
+    run_migrations(bind)
+    manifest = generate(bind, args)
+    with open(args.manifest, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(json.dumps({key: manifest[key] for key in ("customer_user_ids", "accounts", "transactions", "seconds")}))
@@ -0,0 +1,80 @@
+"""
+Throughput of per-request commits vs the group-commit ledger writer.
+
+--concurrency tasks on one event loop each apply --transfers random
+transfers through services.transfer_money, first with one commit per
+transfer and then through a LedgerWriter with the given --max-batch and
+--flush-interval-ms. Total balance is checked after each run.
+
+Usage: python -m benchmarks.group_commit [--concurrency 50] [--transfers 40] [--max-batch 100] [--flush-interval-ms 2]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from fastapi import HTTPException
+from sqlalchemy import func, select
+import ledger_writer
+from models import Account
+from schemas import TransferRequest
+from services import transfer_money
+from benchmarks.common import async_sessions, create_engines, seed_accounts
+
+ACCOUNTS = 1000
+
+async def client(Session, transfers: int, seed: int, counts: dict):
+    rng = random.Random(seed)
+    for _ in range(transfers):
+        source, target = rng.sample(range(ACCOUNTS), 2)
+        item = TransferRequest(from_account_id=source + 1, to_account_number=f"{target:012d}",
+                               amount=rng.randint(1, 50))
+        async with Session() as db:
+            try:
+                await transfer_money(db, item)
+                counts["done"] += 1
+            except HTTPException:
+                counts["failed"] += 1
+
+async def total_balance(Session) -> float:
+    async with Session() as db:
+        return await db.scalar(select(func.sum(Account.balance)))
+
+async def main(concurrency: int, transfers: int, max_batch: int, flush_interval_ms: float):
+    for name in ("per commit", "group commit"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            engine, async_engine = create_engines(path, pool_size=concurrency)
+            seed_accounts(engine, ACCOUNTS, balance=1_000_000.0)
+            Session = async_sessions(async_engine)
+            if name == "group commit":
+                ledger_writer.writer = ledger_writer.LedgerWriter(
+                    bind=ledger_writer.create_writer_engine(f"sqlite+aiosqlite:///{path}"),
+                    max_batch=max_batch, flush_interval=flush_interval_ms / 1000,
+                )
+            before = await total_balance(Session)
+            counts = {"done": 0, "failed": 0}
+            started = time.perf_counter()
+            await asyncio.gather(*(client(Session, transfers, seed, counts) for seed in range(concurrency)))
+            elapsed = time.perf_counter() - started
+            assert await total_balance(Session) == before
+            line = f"{name:>12}: {counts['done'] / elapsed:8.1f} transfers/s, {counts['failed']} failed"
+            if ledger_writer.writer is not None:
+                snapshot = ledger_writer.writer.snapshot()
+                line += f", {snapshot['batches']} commits, {snapshot['batch_size_avg']:.1f} per commit"
+                await ledger_writer.writer.stop()
+                await ledger_writer.writer.bind.dispose()
+                ledger_writer.writer = None
+            print(line)
+            await async_engine.dispose()
+            engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--transfers", type=int, default=40, help="per task")
+    parser.add_argument("--max-batch", type=int, default=ledger_writer.MAX_BATCH)
+    parser.add_argument("--flush-interval-ms", type=float, default=ledger_writer.FLUSH_INTERVAL_SECONDS * 1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.transfers, args.max_batch, args.flush_interval_ms))
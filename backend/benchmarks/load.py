@@ -0,0 +1,225 @@
+"""
+End-to-end load benchmark of the API.
+
+Runs each scenario for --duration seconds with --concurrency clients,
+each sending its next request as soon as the previous one is answered:
+
+- login: POST /api/auth/login as a random generated customer;
+- transfer: POST /api/customer/transfer of 1.00 to one of the hot
+  merchant accounts;
+- listing: GET /api/customer/transactions, first page of 50;
+- dashboard: GET /api/admin/dashboard;
+- statement: GET /api/customer/statement/{id}, JSON, last 30 days;
+- statement_pdf: the same statement as a PDF. A --pdf-render-ratio share
+  of requests asks for a window starting a random 31-365 days back,
+  which is rarely cached and so is rendered in the statement process
+  pool; the rest repeat the client's 30-day window, served from the
+  statement cache once rendered. The renderer and cache counters
+  (renders, rejections, hits, misses) for the scenario are reported with
+  its latencies.
+
+Customers come from the --manifest written by benchmarks.generate, so
+generate data first, and the dashboard scenario logs in as the default
+admin, so run init_db.py on the database too. Each client logs in once, as a different customer,
+before the scenarios start.
+
+By default the app runs in this process (httpx ASGI transport, startup
+and shutdown handlers included) on the configured DATABASE_URL, which
+measures the app without network or server overhead but shares the CPU
+with the clients. --base-url targets a running server instead, e.g.
+uvicorn with several workers, and the database it uses must hold the
+generated data.
+
+Per scenario it reports requests, errors by status code, throughput and
+p50/p95/p99/max latency, and writes them with the options to --output as JSON so runs
+can be compared.
+
+Usage: python -m benchmarks.load [--concurrency 16] [--duration 20] [--scenarios login,transfer,...] [--base-url http://localhost:8000]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+import httpx
+from settings import settings
+
+SCENARIOS = ("login", "transfer", "listing", "dashboard", "statement", "statement_pdf")
+ADMIN = ("admin@bank.com", "admin123")
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+class Client:
+    """One logged-in customer and the account it uses."""
+    def __init__(self, http: httpx.AsyncClient, headers: dict, account_id: int):
+        self.http = http
+        self.headers = headers
+        self.account_id = account_id
+
+async def login(http: httpx.AsyncClient, email: str, password: str) -> dict:
+    response = await http.post("/api/auth/login", json={"email": email, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+class LoadRun:
+    def __init__(self, http: httpx.AsyncClient, manifest: dict, args):
+        self.http = http
+        self.manifest = manifest
+        self.args = args
+        self.rng = random.Random(args.seed)
+        first, last = manifest["customer_user_ids"]
+        self.user_ids = range(first, last + 1)
+        self.statement_start = date.today() - timedelta(days=30)
+        self.clients: List[Client] = []
+        self.admin: Optional[dict] = None
+
+    def email(self, user_id: int) -> str:
+        return self.manifest["email"].format(id=user_id)
+
+    async def setup(self):
+        self.admin = await login(self.http, *ADMIN)
+        for user_id in self.rng.sample(self.user_ids, min(self.args.concurrency, len(self.user_ids))):
+            headers = await login(self.http, self.email(user_id), self.manifest["password"])
+            accounts = (await self.http.get("/api/customer/accounts", headers=headers)).json()
+            self.clients.append(Client(self.http, headers, accounts[0]["id"]))
+
+    def request(self, scenario: str, client: Client):
+        if scenario == "login":
+            email = self.email(self.rng.choice(self.user_ids))
+            return self.http.post("/api/auth/login", json={"email": email, "password": self.manifest["password"]})
+        if scenario == "transfer":
+            return self.http.post("/api/customer/transfer", headers=client.headers, json={
+                "from_account_id": client.account_id,
+                "to_account_number": self.rng.choice(self.manifest["merchant_account_numbers"]),
+                "amount": 1.0,
+            })
+        if scenario == "listing":
+            return self.http.get("/api/customer/transactions", params={"limit": 50}, headers=client.headers)
+        if scenario == "dashboard":
+            return self.http.get("/api/admin/dashboard", headers=self.admin)
+        params = {"start_date": self.statement_start.isoformat()}
+        if scenario == "statement_pdf":
+            params["format"] = "pdf"
+            if self.rng.random() < self.args.pdf_render_ratio:
+                params["start_date"] = (date.today() - timedelta(days=self.rng.randint(31, 365))).isoformat()
+        return self.http.get(f"/api/customer/statement/{client.account_id}", params=params, headers=client.headers)
+
+    async def statement_counters(self) -> dict:
+        response = await self.http.get("/api/admin/statements/metrics", headers=self.admin)
+        response.raise_for_status()
+        metrics = response.json()
+        return {
+            "rendered": metrics["rendered"],
+            "render_failed": metrics["failed"],
+            "render_rejected": metrics["rejected"],
+            "cache_hits": metrics["cache"]["hits"],
+            "cache_misses": metrics["cache"]["misses"],
+        }
+
+    async def worker(self, scenario: str, client: Client, deadline: float, latencies: List[float],
+                     counts: Dict[str, int], statuses: Dict[str, int]):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                status_code = (await self.request(scenario, client)).status_code
+                outcome = "ok" if status_code < 400 else ("client_errors" if status_code < 500 else "server_errors")
+            except httpx.HTTPError as e:
+                status_code, outcome = type(e).__name__, "server_errors"
+            latencies.append(time.perf_counter() - started)
+            counts[outcome] += 1
+            statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+
+    async def scenario(self, scenario: str) -> dict:
+        latencies: List[float] = []
+        counts = {"ok": 0, "client_errors": 0, "server_errors": 0}
+        statuses: Dict[str, int] = {}
+        counters = await self.statement_counters() if scenario == "statement_pdf" else None
+        started = time.perf_counter()
+        deadline = started + self.args.duration
+        await asyncio.gather(*(
+            self.worker(scenario, client, deadline, latencies, counts, statuses) for client in self.clients
+        ))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        summary = {
+            "requests": len(latencies),
+            **counts,
+            "statuses": statuses,
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.50) * 1000, 2),
+                "p95": round(percentile(latencies, 0.95) * 1000, 2),
+                "p99": round(percentile(latencies, 0.99) * 1000, 2),
+                "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            },
+        }
+        if counters is not None:
+            after = await self.statement_counters()
+            summary["statements"] = {name: after[name] - counters[name] for name in counters}
+        return summary
+
+async def run(args, manifest: dict) -> dict:
+    if args.base_url:
+        http = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout)
+        app = None
+    else:
+        import main
+        app = main.app
+        await app.router.startup()
+        http = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load", timeout=args.timeout)
+    try:
+        load = LoadRun(http, manifest, args)
+        await load.setup()
+        results = {}
+        for scenario in args.scenarios:
+            results[scenario] = await load.scenario(scenario)
+            summary = results[scenario]
+            print(f"{scenario:>13}: {summary['throughput_rps']:8.1f} req/s  "
+                  f"p50 {summary['latency_ms']['p50']:7.1f} ms  p95 {summary['latency_ms']['p95']:7.1f} ms  "
+                  f"p99 {summary['latency_ms']['p99']:7.1f} ms  errors {summary['client_errors'] + summary['server_errors']}")
+            if "statements" in summary:
+                print(" " * 15 + "  ".join(f"{name} {value}" for name, value in summary["statements"].items()))
+        return results
+    finally:
+        await http.aclose()
+        if app is not None:
+            await app.router.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive the API at fixed concurrency and report latency percentiles.")
+    parser.add_argument("--manifest", default="loadgen.json")
+    parser.add_argument("--base-url", help="running server to target; default: the app in this process")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20, help="seconds per scenario")
+    parser.add_argument("--scenarios", type=lambda value: value.split(","), default=list(SCENARIOS))
+    parser.add_argument("--pdf-render-ratio", type=float, default=0.2,
+                        help="share of statement_pdf requests for a rarely cached window")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="JSON results file; default load-<timestamp>.json")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    started_at = datetime.utcnow()
+    results = asyncio.run(run(args, manifest))
+    output = args.output or f"load-{started_at:%Y%m%d-%H%M%S}.json"
+    with open(output, "w") as f:
+        json.dump({
+            "started_at": started_at.isoformat(),
+            "target": args.base_url or "in-process",
+            "database": None if args.base_url else settings.report(),
+            "options": vars(args),
+            "data": {key: manifest[key] for key in ("accounts", "transactions", "generated_at")},
+            "results": results,
+        }, f, indent=2)
+    print(f"results written to {output}")
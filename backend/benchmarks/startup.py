@@ -0,0 +1,119 @@
+"""
+Startup time of the API, and a budget for it.
+
+Each of --runs runs starts a fresh `uvicorn main:app` process on a scratch
+SQLite database (set up once with init_db.py) and measures:
+
+- import: wall time of `python -c "import main"`, interpreter start
+  included;
+- first request: from spawning uvicorn until GET /api/health answers 200,
+  i.e. imports, startup handlers and binding the socket.
+
+Importing main is also checked to have no side effects: run against a
+database path that does not exist, it must not create it.
+
+Medians are printed as JSON (and written to --output if given). Exits
+non-zero when the median time to first request exceeds --budget-ms or
+the import touched the database, so it can gate CI alongside
+query_budget.py.
+
+Usage: python -m benchmarks.startup [--runs 5] [--budget-ms 5000]
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def environment(database_path: str) -> dict:
+    return {**os.environ, "DATABASE_URL": f"sqlite:///{database_path}", "DATABASE_REPLICA_URLS": ""}
+
+def import_seconds(env: dict) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import main"], cwd=BACKEND, env=env, check=True)
+    return time.perf_counter() - started
+
+def first_request_seconds(env: dict, timeout: float) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with {server.returncode}: {server.stderr.read().decode()[-2000:]}")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/api/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"no response within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+def measure(args, scratch: str) -> dict:
+    database = os.path.join(scratch, "startup.db")
+    env = environment(database)
+    subprocess.run([sys.executable, "init_db.py"], cwd=BACKEND, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    untouched = os.path.join(scratch, "untouched.db")
+    import_seconds(environment(untouched))
+    import_side_effects = os.path.exists(untouched)
+
+    imports, first_requests = [], []
+    for _ in range(args.runs):
+        imports.append(import_seconds(env))
+        first_requests.append(first_request_seconds(env, args.timeout))
+    return {
+        "runs": args.runs,
+        "import_ms": round(statistics.median(imports) * 1000, 1),
+        "first_request_ms": round(statistics.median(first_requests) * 1000, 1),
+        "first_request_max_ms": round(max(first_requests) * 1000, 1),
+        "budget_ms": args.budget_ms,
+        "import_side_effects": import_side_effects,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure time to first request and check it against a budget.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=5000, help="maximum median time to first request")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for a server to answer")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="startup-")
+    try:
+        results = measure(args, scratch)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    problems = []
+    if results["import_side_effects"]:
+        problems.append("importing main created the database")
+    if results["first_request_ms"] > args.budget_ms:
+        problems.append(f"median time to first request {results['first_request_ms']} ms is over the {args.budget_ms} ms budget")
+    if problems:
+        print("\n".join(problems))
+        sys.exit(1)
+    print("✅ Startup is side-effect free and within its budget")
@@ -0,0 +1,263 @@
+"""
+Bulk customer onboarding from CSV or NDJSON.
+
+Rows are parsed lazily and processed in chunks of IMPORT_CHUNK_SIZE. Each
+chunk costs one query for already registered emails, at most one account
+number block reservation, one executemany INSERT per table (users,
+customers, accounts, initial deposits) and one commit. Passwords are
+hashed in parallel on the hashing pool, on at most half of its workers
+so the logins it also verifies are not stalled behind the import; rows
+may instead carry an existing bcrypt password_hash, which is stored as
+is and upgraded on the user's first login.
+
+import_customers() yields one event per rejected row and a final summary,
+so the endpoint and the CLI can report progress while the import runs.
+
+CLI usage: python bulk_import.py customers.csv [--format ndjson] [--hash-workers 8]
+"""
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+import asyncio
+import csv
+import json
+import os
+
+from models import User, Customer, Account, Transaction, UserRole, TransactionType, AccountStatus
+from schemas import ImportCustomerRow
+from account_numbers import allocate_account_numbers
+import hashing
+import stats
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+FORMATS = ("csv", "ndjson")
+
+# (line number, parsed row or None, error or None)
+ParsedRow = Tuple[int, Optional[ImportCustomerRow], Optional[str]]
+
+def format_for(content_type: Optional[str]) -> Optional[str]:
+    content_type = (content_type or "").lower()
+    if "csv" in content_type:
+        return "csv"
+    if "ndjson" in content_type or "jsonl" in content_type or "json" in content_type:
+        return "ndjson"
+    return None
+
+def validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'row'}: {e['msg']}" for e in error.errors()
+    )
+
+def csv_records(lines: Iterable[str]) -> Iterator[Tuple[int, dict]]:
+    """CSV records with the line each one starts on; quoted fields may span lines."""
+    reader = csv.DictReader(lines)
+    reader.fieldnames  # reads the header row
+    end = reader.line_num
+    for record in reader:
+        start, end = end + 1, reader.line_num
+        yield start, record
+
+def parse_rows(lines: Iterable[str], fmt: str) -> Iterator[ParsedRow]:
+    """Lazily turn CSV (with a header row) or NDJSON lines into validated rows."""
+    if fmt == "csv":
+        records = csv_records(lines)
+    else:
+        records = ((number, line) for number, line in enumerate(lines, start=1) if line.strip())
+    try:
+        for line, record in records:
+            try:
+                if fmt == "csv":
+                    # Empty cells mean "not given", not empty strings
+                    record = {key: value for key, value in record.items() if key and value not in ("", None)}
+                else:
+                    record = json.loads(record)
+                yield line, ImportCustomerRow.model_validate(record), None
+            except ValidationError as e:
+                yield line, None, validation_message(e)
+            except ValueError as e:
+                yield line, None, f"Invalid JSON: {e}"
+    except (csv.Error, UnicodeDecodeError) as e:
+        yield -1, None, f"Unreadable input, import stopped: {e}"
+
+# Hashing pool slots an import may hold at once; None means half the pool
+# (at least one), which leaves workers free for logins. The pool runs jobs
+# in order, so even with a single worker a login waits for at most one
+# import hash. The CLI serves no logins and gives the import every worker.
+IMPORT_HASH_WORKERS: Optional[int] = None
+
+def import_hash_workers() -> int:
+    if IMPORT_HASH_WORKERS is not None:
+        return IMPORT_HASH_WORKERS
+    return max(1, hashing.HASH_WORKERS // 2)
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    """Hash on the shared pool without taking more than import_hash_workers() slots."""
+    limit = asyncio.Semaphore(import_hash_workers())
+
+    async def hash_one(password: str) -> str:
+        async with limit:
+            while True:
+                try:
+                    return await hashing.hash_password(password)
+                except hashing.HashingBusy:
+                    await asyncio.sleep(hashing.RETRY_AFTER_SECONDS)
+
+    return await asyncio.gather(*(hash_one(password) for password in passwords))
+
+def row_error(line: int, email: Optional[str], error: str) -> dict:
+    return {"line": line, "email": email, "error": error}
+
+async def insert_chunk(db, rows: List[Tuple[ImportCustomerRow, str, str]],
+                       created_by_id: Optional[int]) -> List[Tuple[ImportCustomerRow, str]]:
+    """
+    Insert (row, password hash, account number) triples with one executemany
+    per table; returns the (row, account number) pairs that got a deposit.
+    Generated ids are read back through each table's natural key, which
+    works the same on every backend.
+    """
+    emails = [row.email for row, _, _ in rows]
+    await db.execute(insert(User), [
+        {
+            "name": row.name,
+            "email": row.email,
+            "password_hash": password_hash,
+            "role": UserRole.CUSTOMER,
+            "is_active": 1,
+            "created_by_id": created_by_id,
+        }
+        for row, password_hash, _ in rows
+    ])
+    user_ids = dict((await db.execute(select(User.email, User.id).where(User.email.in_(emails)))).all())
+    await db.execute(insert(Customer), [
+        {"user_id": user_ids[row.email], "phone": row.phone, "address": row.address}
+        for row, _, _ in rows
+    ])
+    customer_ids = dict((await db.execute(
+        select(Customer.user_id, Customer.id).where(Customer.user_id.in_(user_ids.values()))
+    )).all())
+    await db.execute(insert(Account), [
+        {
+            "customer_id": customer_ids[user_ids[row.email]],
+            "account_number": account_number,
+            "balance": row.initial_balance,
+            "account_type": row.account_type,
+            "status": AccountStatus.ACTIVE,
+        }
+        for row, _, account_number in rows
+    ])
+    funded = [(row, account_number) for row, _, account_number in rows if row.initial_balance > 0]
+    if funded:
+        account_ids = dict((await db.execute(
+            select(Account.account_number, Account.id)
+            .where(Account.account_number.in_([account_number for _, account_number in funded]))
+        )).all())
+        await db.execute(insert(Transaction), [
+            {
+                "from_account_id": None,
+                "to_account_id": account_ids[account_number],
+                "amount": row.initial_balance,
+                "transaction_type": TransactionType.DEPOSIT,
+                "description": "Initial deposit",
+            }
+            for row, account_number in funded
+        ])
+    return funded
+
+async def import_chunk(db, chunk: List[Tuple[int, ImportCustomerRow]], created_by_id: Optional[int]) -> Tuple[int, List[dict]]:
+    """Insert one chunk of rows in one transaction; returns (imported, row errors)."""
+    errors = []
+    existing = set(await db.scalars(select(User.email).where(User.email.in_([row.email for _, row in chunk]))))
+    accepted = []
+    for line, row in chunk:
+        if row.email in existing:
+            errors.append(row_error(line, row.email, "User with this email already exists"))
+        elif row.password_hash and not row.password and not hashing.pwd_context().identify(row.password_hash):
+            errors.append(row_error(line, row.email, "password_hash is not a supported hash"))
+        else:
+            existing.add(row.email)
+            accepted.append((line, row))
+    if not accepted:
+        return 0, errors
+
+    hashes = iter(await hash_passwords([row.password for _, row in accepted if row.password]))
+    numbers = await allocate_account_numbers(len(accepted))
+    rows = [(row, next(hashes) if row.password else row.password_hash, number)
+            for (_, row), number in zip(accepted, numbers)]
+    count = len(rows)
+    try:
+        funded = await insert_chunk(db, rows, created_by_id)
+        await stats.bump(
+            db,
+            total_users=count,
+            total_customers=count,
+            total_accounts=count,
+            total_balance=sum(row.initial_balance for row, _ in funded),
+            total_transactions=len(funded),
+        )
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        errors.extend(row_error(line, row.email, f"Import failed: {e}") for line, row in accepted)
+        return 0, errors
+    return count, errors
+
+async def import_customers(db, rows: Iterable[ParsedRow], created_by_id: Optional[int] = None,
+                           chunk_size: int = IMPORT_CHUNK_SIZE) -> AsyncIterator[dict]:
+    """Import parsed rows chunk by chunk, yielding row errors and a final summary."""
+    imported = failed = 0
+    chunk = []
+
+    async def flush():
+        nonlocal imported, failed
+        count, errors = await import_chunk(db, chunk, created_by_id)
+        imported += count
+        failed += len(errors)
+        chunk.clear()
+        return errors
+
+    for line, row, error in rows:
+        if error:
+            failed += 1
+            yield row_error(line, None, error)
+            continue
+        chunk.append((line, row))
+        if len(chunk) >= chunk_size:
+            for event in await flush():
+                yield event
+    if chunk:
+        for event in await flush():
+            yield event
+    yield {"imported": imported, "failed": failed}
+
+# ================= CLI =================
+
+async def main(path: str, fmt: str, chunk_size: int, created_by_id: Optional[int]):
+    from database import AsyncSessionLocal, async_engine, engine
+    from migrations import run_migrations
+
+    run_migrations(engine)
+    try:
+        # utf-8-sig drops the byte order mark spreadsheet exports start with
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            async with AsyncSessionLocal() as db:
+                async for event in import_customers(db, parse_rows(f, fmt), created_by_id, chunk_size):
+                    print(json.dumps(event), flush=True)
+    finally:
+        hashing.shutdown_pool()
+        await async_engine.dispose()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk-import customers from CSV or NDJSON.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    parser.add_argument("--hash-workers", type=int, default=os.cpu_count() or 1,
+                        help="bcrypt threads; the CLI is not serving requests, so default to every core")
+    parser.add_argument("--created-by-id", type=int, help="staff user recorded as creator")
+    args = parser.parse_args()
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    hashing.HASH_WORKERS = args.hash_workers
+    IMPORT_HASH_WORKERS = args.hash_workers
+    asyncio.run(main(args.path, fmt, args.chunk_size, args.created_by_id))
@@ -0,0 +1,254 @@
+"""
+Consistency checks for the money paths and account numbers.
+
+Each check runs the services against a scratch SQLite database and
+verifies an invariant that must hold however requests interleave or
+reuse a session:
+
+- batch vs transfer: a batch transfer and a single transfer race to
+  debit the same account; money is conserved, no balance goes negative
+  and every balance matches the ledger rows that were committed;
+- failed batch items: in a best-effort batch, items refused halfway (the
+  debit applied, then the credit to a blocked account refused) leave no
+  change behind, while the valid items are committed;
+- reported balances: after a transfer in a session that had already
+  loaded the source account (as /api/customer/transfer does to check
+  ownership), the returned account shows the debited balance;
+- ledger writer batches: mutations of one account that the group-commit
+  writer applies in the same batch each report the balance they left,
+  not the balance after the last mutation of the batch;
+- concurrent compactions: two stats compactions that start together,
+  while another writer holds the write lock, fold pending counter deltas
+  into bank_stats exactly once;
+- account numbers across event loops: the allocator hands out distinct
+  numbers under contention in one asyncio.run() and then in another,
+  as separate scripts and test clients do.
+
+Exits non-zero on any problem, so it can gate CI alongside
+query_budget.py. Run it from backend/.
+
+Usage: python consistency_checks.py [--rounds 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from typing import List
+from sqlalchemy import func, select, update
+from fastapi import HTTPException
+from account_numbers import AccountNumberAllocator
+import stats
+from models import Account, AccountStatus, BankStatDelta, Transaction
+from ledger_writer import LedgerWriter, create_writer_engine
+from schemas import BatchMode, BatchTransferRequest, DepositWithdrawRequest, TransferRequest
+from services import apply_deposit, apply_transfer, transfer_batch, transfer_money
+from benchmarks.common import async_sessions, create_engines, seed_accounts
+
+ACCOUNTS = 3
+BALANCE = 100.0
+
+def account_number(account_id: int) -> str:
+    # seed_accounts numbers accounts by their zero-padded index
+    return f"{account_id - 1:012d}"
+
+async def ledger_balances(Session) -> dict:
+    """Every account's balance as implied by its committed ledger rows."""
+    async with Session() as db:
+        credits = dict((await db.execute(
+            select(Transaction.to_account_id, func.sum(Transaction.amount)).group_by(Transaction.to_account_id)
+        )).all())
+        debits = dict((await db.execute(
+            select(Transaction.from_account_id, func.sum(Transaction.amount)).group_by(Transaction.from_account_id)
+        )).all())
+    return {
+        account_id: BALANCE + credits.get(account_id, 0.0) - debits.get(account_id, 0.0)
+        for account_id in range(1, ACCOUNTS + 1)
+    }
+
+async def settle(coroutine):
+    """Run a service call, treating a refused transfer as a normal outcome."""
+    try:
+        return await coroutine
+    except HTTPException as e:
+        return e
+
+async def check_batch_vs_transfer(Session, rounds: int) -> List[str]:
+    problems = []
+    for round_number in range(rounds):
+        async with Session() as db:
+            await db.execute(update(Account).values(balance=BALANCE))
+            await db.execute(Transaction.__table__.delete())
+            await db.commit()
+
+        async def batch():
+            async with Session() as db:
+                return await transfer_batch(db, BatchTransferRequest(mode=BatchMode.BEST_EFFORT, transfers=[
+                    TransferRequest(from_account_id=1, to_account_number=account_number(2), amount=BALANCE),
+                ]))
+
+        async def single():
+            async with Session() as db:
+                return await transfer_money(db, TransferRequest(
+                    from_account_id=1, to_account_number=account_number(3), amount=BALANCE
+                ))
+
+        await asyncio.gather(settle(batch()), settle(single()))
+        async with Session() as db:
+            balances = dict((await db.execute(select(Account.id, Account.balance))).all())
+        expected = await ledger_balances(Session)
+        total = sum(balances.values())
+        if abs(total - BALANCE * ACCOUNTS) > 1e-9:
+            problems.append(f"batch vs transfer, round {round_number}: total money {total}, expected {BALANCE * ACCOUNTS}")
+        if any(balance < 0 for balance in balances.values()):
+            problems.append(f"batch vs transfer, round {round_number}: negative balance in {balances}")
+        if balances != expected:
+            problems.append(f"batch vs transfer, round {round_number}: balances {balances} but ledger implies {expected}")
+    return problems
+
+async def check_failed_batch_items(Session) -> List[str]:
+    async with Session() as db:
+        await db.execute(update(Account).values(balance=BALANCE, status=AccountStatus.ACTIVE))
+        await db.execute(update(Account).where(Account.id == 3).values(status=AccountStatus.BLOCKED))
+        await db.execute(Transaction.__table__.delete())
+        await db.commit()
+        result = await transfer_batch(db, BatchTransferRequest(mode=BatchMode.BEST_EFFORT, transfers=[
+            TransferRequest(from_account_id=1, to_account_number=account_number(3), amount=10),
+            TransferRequest(from_account_id=1, to_account_number=account_number(2), amount=10),
+            TransferRequest(from_account_id=2, to_account_number=account_number(1), amount=BALANCE * 5),
+        ]))
+    async with Session() as db:
+        balances = dict((await db.execute(select(Account.id, Account.balance))).all())
+        await db.execute(update(Account).values(status=AccountStatus.ACTIVE))
+        await db.commit()
+    problems = []
+    outcomes = [item.success for item in result.results]
+    if not result.committed or outcomes != [False, True, False]:
+        problems.append(f"failed batch items: expected only the second item to apply, got {result}")
+    if balances != {1: BALANCE - 10, 2: BALANCE + 10, 3: BALANCE}:
+        problems.append(f"failed batch items: balances {balances} after a batch that moved 10 from 1 to 2")
+    return problems
+
+async def check_reported_balance(Session) -> List[str]:
+    async with Session() as db:
+        await db.execute(update(Account).values(balance=BALANCE, status=AccountStatus.ACTIVE))
+        await db.commit()
+    async with Session() as db:
+        # Held like the handler's ownership check; the identity map only keeps weak references
+        owned = await db.scalar(select(Account).where(Account.id == 1, Account.customer_id == 1))
+        from_account, to_account, _ = await transfer_money(db, TransferRequest(
+            from_account_id=1, to_account_number=account_number(2), amount=10
+        ))
+    if from_account is not owned or (from_account.balance, to_account.balance) != (BALANCE - 10, BALANCE + 10):
+        return [f"reported balances: transfer of 10 returned {from_account.balance} and {to_account.balance}, "
+                f"expected {BALANCE - 10} and {BALANCE + 10}"]
+    return []
+
+async def check_ledger_writer_batch(Session, async_engine) -> List[str]:
+    async with Session() as db:
+        await db.execute(update(Account).values(balance=BALANCE, status=AccountStatus.ACTIVE))
+        await db.commit()
+    writer_engine = create_writer_engine(async_engine.url.render_as_string(hide_password=False))
+    # A flush interval long enough that all three land in one batch
+    writer = LedgerWriter(bind=writer_engine, flush_interval=0.2)
+    try:
+        first, refused, last = await asyncio.gather(
+            writer.submit(apply_deposit, DepositWithdrawRequest(account_id=1, amount=10)),
+            settle(writer.submit(apply_transfer, TransferRequest(
+                from_account_id=1, to_account_number=account_number(2), amount=BALANCE * 5
+            ))),
+            writer.submit(apply_deposit, DepositWithdrawRequest(account_id=1, amount=1)),
+        )
+    finally:
+        await writer.stop()
+        await writer_engine.dispose()
+    if writer.batches != 1 or not isinstance(refused, HTTPException):
+        return [f"ledger writer batch: expected one batch with the transfer refused, got {writer.batches} and {refused}"]
+    if (first[0].balance, last[0].balance) != (BALANCE + 10, BALANCE + 11):
+        return [f"ledger writer batch: deposits of 10 then 1 reported {first[0].balance} and {last[0].balance}, "
+                f"expected {BALANCE + 10} and {BALANCE + 11}"]
+    return []
+
+async def check_concurrent_compaction(Session) -> List[str]:
+    async with Session() as db:
+        await db.run_sync(stats.recompute)
+        before = await stats.read_stats(db)
+        await stats.bump(db, total_balance=BALANCE)
+        await db.commit()
+
+    async def compact():
+        async with Session() as db:
+            folded = await db.run_sync(stats.compact)
+            await db.commit()
+            return folded
+
+    async with Session() as blocker:
+        # Hold the write lock so both compactions have read what they need
+        # before either can write, as two workers' compactors on one timer do
+        await blocker.execute(update(Account).where(Account.id == 1).values(balance=Account.balance))
+        compactions = [asyncio.create_task(compact()) for _ in range(2)]
+        await asyncio.sleep(0.2)
+        await blocker.commit()
+        folded = await asyncio.gather(*compactions)
+    async with Session() as db:
+        after = await stats.read_stats(db)
+        pending = await db.scalar(select(func.count()).select_from(BankStatDelta))
+    if after["total_balance"] != before["total_balance"] + BALANCE or pending or sorted(folded) != [0, 1]:
+        return [f"concurrent compaction: {BALANCE} in pending deltas moved total_balance from "
+                f"{before['total_balance']} to {after['total_balance']} (folded {folded}, {pending} left)"]
+    return []
+
+async def money_checks(async_engine, rounds: int) -> List[str]:
+    Session = async_sessions(async_engine)
+    try:
+        return (
+            await check_batch_vs_transfer(Session, rounds)
+            + await check_failed_batch_items(Session)
+            + await check_reported_balance(Session)
+            + await check_ledger_writer_batch(Session, async_engine)
+            + await check_concurrent_compaction(Session)
+        )
+    finally:
+        await async_engine.dispose()
+
+def check_allocator_across_loops(async_engine) -> List[str]:
+    allocator = AccountNumberAllocator(bind=async_engine, block_size=5)
+
+    async def allocate_concurrently():
+        # More than a block, so callers wait on the lock while one reserves;
+        # every call finishes before the engine is disposed, even on failure
+        results = await asyncio.gather(*(allocator.allocate(2) for _ in range(4)), return_exceptions=True)
+        await async_engine.dispose()
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return [number for numbers in results for number in numbers]
+
+    numbers = []
+    for loop_number in range(2):
+        try:
+            numbers += asyncio.run(allocate_concurrently())
+        except RuntimeError as e:
+            return [f"account numbers, event loop {loop_number + 1}: {e}"]
+    if len(set(numbers)) != len(numbers):
+        return [f"account numbers: duplicates handed out in {numbers}"]
+    return []
+
+def run_checks(rounds: int) -> List[str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, async_engine = create_engines(os.path.join(tmp, "checks.db"))
+        seed_accounts(engine, ACCOUNTS, balance=BALANCE)
+        try:
+            return asyncio.run(money_checks(async_engine, rounds)) + check_allocator_across_loops(async_engine)
+        finally:
+            engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that concurrent money movements keep the ledger consistent.")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+    problems = run_checks(args.rounds)
+    if problems:
+        print("\n".join(problems))
+        sys.exit(1)
+    print("✅ Money is conserved, balances match the ledger, counters fold once and account numbers are unique")
@@ -1,28 +1,163 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import os
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from contextvars import ContextVar
+from typing import Optional
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
-print("hello")
-DATABASE_URL = "sqlite:///./banking.db"
-print("DB URL =", DATABASE_URL)
 
+from settings import DatabaseSettings, settings  # reads the environment, so after load_dotenv
+import slow_queries
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},  # required for SQLite
-    pool_pre_ping=True,
-    pool_recycle=300
-)
+DATABASE_URL = settings.url
 
+# Async drivers used by the request handlers for each sync driver URL
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    return parsed.set(drivername=ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = async_database_url(DATABASE_URL)
+
+# ==================== ENGINE FACTORY ====================
+
+def apply_sqlite_pragmas(engine, config: DatabaseSettings):
+    pragmas = config.sqlite_pragmas()
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def engine_options(config: DatabaseSettings, is_async: bool) -> dict:
+    options = {"echo": config.echo}
+    if config.is_sqlite_memory:
+        # One shared connection; pool settings do not apply
+        return options
+    options.update(
+        pool_size=config.pool_size,
+        max_overflow=config.max_overflow,
+        pool_timeout=config.pool_timeout,
+        pool_recycle=config.pool_recycle,
+        pool_pre_ping=config.pool_pre_ping,
+    )
+    if config.is_sqlite and is_async:
+        # aiosqlite would otherwise open (and re-tune) a connection per session
+        options["poolclass"] = AsyncAdaptedQueuePool
+    return options
+
+def create_db_engine(config: DatabaseSettings = settings, url: Optional[str] = None):
+    """Sync engine for url (default: the configured one) tuned by config."""
+    url = url or config.url
+    options = engine_options(config, is_async=False)
+    if config.is_sqlite:
+        options["connect_args"] = {"check_same_thread": False}
+    db_engine = create_engine(url, **options)
+    if config.is_sqlite:
+        apply_sqlite_pragmas(db_engine, config)
+    return db_engine
+
+def create_async_db_engine(config: DatabaseSettings = settings, url: Optional[str] = None):
+    """Async engine for url (default: the async form of the configured one) tuned by config."""
+    url = url or async_database_url(config.url)
+    db_engine = create_async_engine(url, **engine_options(config, is_async=True))
+    if config.is_sqlite:
+        apply_sqlite_pragmas(db_engine.sync_engine, config)
+    return db_engine
+
+def effective_settings(db_engine=None) -> dict:
+    """The configured settings plus what the database actually reports."""
+    db_engine = db_engine or engine
+    report = settings.report()
+    report["dialect"] = db_engine.dialect.name
+    if settings.is_sqlite:
+        with db_engine.connect() as conn:
+            report["pragmas"] = {
+                name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+                for name in settings.sqlite_pragmas()
+            }
+    else:
+        report["pool_status"] = db_engine.pool.status()
+    return report
+
+engine = create_db_engine()
+async_engine = create_async_db_engine()
+
+# Sync sessions serve scripts, migrations and the statement render workers;
+# request handlers use AsyncSessionLocal through get_write_db.
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+# ==================== QUERY COUNTING ====================
+
+class QueryCounter:
+    """SQL statements issued, and seconds spent executing them, while handling one request."""
+    __slots__ = ("statements", "db_seconds", "scope")
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.statements = 0
+        self.db_seconds = 0.0
+        # The request's ASGI scope, for attributing slow queries to a route
+        self.scope = scope
+
+# Set per request by the middleware in request_metrics.py; the counter object
+# is shared by reference so statements issued from worker threads are counted too.
+query_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = query_counter.get()
+    if counter is not None:
+        counter.statements += 1
+    if context is not None:
+        context._counter_started = time.perf_counter()
+
+def _time_statement(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_counter_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    counter = query_counter.get()
+    if counter is not None:
+        counter.db_seconds += elapsed
+    if elapsed >= slow_queries.log.threshold:
+        slow_queries.log.record(conn, statement, parameters, executemany, elapsed,
+                                counter.scope if counter is not None else None)
+
+def count_statements(db_engine):
+    event.listen(db_engine, "before_cursor_execute", _count_statement)
+    event.listen(db_engine, "after_cursor_execute", _time_statement)
+
+for _engine in (engine, async_engine.sync_engine):
+    count_statements(_engine)
+
+# ==================== SESSION DEPENDENCIES ====================
+
+async def get_write_db():
+    """Session on the primary, for handlers that write or must read their own writes."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_read_db():
+    """
+    Session for read-only reporting handlers: a replica within the lag
+    bound when one is configured, otherwise the primary.
+    """
+    from replicas import router
+    async with router.session() as db:
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,130 @@
+"""
+Password hashing off the event loop.
+
+A bcrypt hash or verify costs a few hundred milliseconds of CPU, so it
+runs on a small dedicated thread pool (bcrypt releases the GIL while it
+works) instead of inside the request handler.
+
+Admission is bounded: at most PASSWORD_HASH_WORKERS jobs run and
+PASSWORD_HASH_QUEUE more may wait. Beyond that hash_password() and
+verify_password() raise HashingBusy, which main.py answers with 503 and
+Retry-After.
+
+The bcrypt cost comes from BCRYPT_ROUNDS. Hashes made with a different
+cost are flagged by passlib's needs_update and replaced on the next
+successful login. passlib (and with it the bcrypt backend) is imported on
+first use rather than at import, so starting the app does not pay for it.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
+import asyncio
+import os
+import time
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE", "64"))
+RETRY_AFTER_SECONDS = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "2"))
+
+@lru_cache(maxsize=None)
+def pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full."""
+
+class HashMetrics:
+    def __init__(self):
+        self.in_flight = 0
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+        self.rejected = 0
+        self.hash_seconds_total = 0.0
+        self.hash_seconds_max = 0.0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def observe(self, hash_seconds: float, wait_seconds: float):
+        self.hash_seconds_total += hash_seconds
+        self.hash_seconds_max = max(self.hash_seconds_max, hash_seconds)
+        self.wait_seconds_total += wait_seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+    def snapshot(self) -> dict:
+        completed = (self.hashed + self.verified) or 1
+        return {
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "workers": HASH_WORKERS,
+            "queue_capacity": HASH_QUEUE_SIZE,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - HASH_WORKERS),
+            "hashed": self.hashed,
+            "verified": self.verified,
+            "rehashed": self.rehashed,
+            "rejected": self.rejected,
+            "hash_seconds_avg": self.hash_seconds_total / completed,
+            "hash_seconds_max": self.hash_seconds_max,
+            "wait_seconds_avg": self.wait_seconds_total / completed,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
+
+metrics = HashMetrics()
+_pool: Optional[ThreadPoolExecutor] = None
+
+def get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password-hash")
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, started, time.perf_counter()
+
+async def _run(fn, *args):
+    if metrics.in_flight >= HASH_WORKERS + HASH_QUEUE_SIZE:
+        metrics.rejected += 1
+        raise HashingBusy()
+    metrics.in_flight += 1
+    submitted = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        result, started, finished = await loop.run_in_executor(get_pool(), _timed, fn, *args)
+    finally:
+        metrics.in_flight -= 1
+    metrics.observe(finished - started, started - submitted)
+    return result
+
+def _verify(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    context = pwd_context()
+    if not context.verify(plain_password, hashed_password):
+        return False, None
+    if context.needs_update(hashed_password):
+        return True, context.hash(plain_password)
+    return True, None
+
+async def hash_password(password: str) -> str:
+    hashed = await _run(pwd_context().hash, password)
+    metrics.hashed += 1
+    return hashed
+
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Check a password. Returns (valid, new_hash) where new_hash is a fresh
+    hash at the current cost when the stored one is out of date.
+    """
+    valid, new_hash = await _run(_verify, plain_password, hashed_password)
+    metrics.verified += 1
+    if new_hash is not None:
+        metrics.rehashed += 1
+    return valid, new_hash
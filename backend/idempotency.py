@@ -0,0 +1,191 @@
+"""
+Idempotency keys for the money-moving endpoints.
+
+A client that sends an Idempotency-Key header with a deposit, withdrawal
+or transfer can safely retry it: the first request with a key runs the
+operation and stores its response, later requests with the same key get
+that stored response (marked Idempotent-Replayed: true) without running
+it again. Keys are scoped to the endpoint and the authenticated user,
+and stored responses expire after IDEMPOTENCY_TTL_SECONDS.
+
+Reusing a key with a different request body is answered with 422.
+Requests with the same key that arrive while the first one is still
+running wait for it in this process; one arriving at another worker
+process gets 409 with Retry-After. Successful and 4xx responses are
+stored; a 5xx or an unexpected error releases the key so the client can
+retry.
+
+The key is claimed in its own transaction before the operation runs and
+the response is stored after it commits. If the process dies in between,
+the claim is taken over once it is IDEMPOTENCY_LOCK_SECONDS old, so the
+operation may run a second time in that (rare) case.
+"""
+from datetime import datetime, timedelta
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from database import AsyncSessionLocal
+from models import IdempotencyKey
+
+TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 60 * 60)))
+LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+PURGE_INTERVAL_SECONDS = 300
+MAX_KEY_LENGTH = 255
+
+def digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class IdempotencyStore:
+    def __init__(self, ttl_seconds: int = TTL_SECONDS, lock_seconds: int = LOCK_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        # Key -> future resolved when the request holding the key finishes
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._purged_at = 0.0
+        self.executed = 0
+        self.replayed = 0
+        self.coalesced = 0
+        self.conflicts = 0
+        self.mismatched = 0
+
+    async def run(self, client_key: Optional[str], scope: str, payload: Any,
+                  operation: Callable[[], Awaitable[Any]]):
+        """Run operation() once per (scope, client_key) and replay its response."""
+        if client_key is None:
+            return await operation()
+        if not client_key or len(client_key) > MAX_KEY_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"
+            )
+        key = digest(f"{scope}\n{client_key}")
+        request_hash = digest(json.dumps(jsonable_encoder(payload), sort_keys=True))
+
+        if key in self._in_flight:
+            self.coalesced += 1
+        while key in self._in_flight:
+            # Same key already running in this process: wait, then replay its stored response
+            await asyncio.shield(self._in_flight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            stored = await self._claim(key, request_hash)
+            if stored is not None:
+                self.replayed += 1
+                return JSONResponse(stored[1], status_code=stored[0], headers={"Idempotent-Replayed": "true"})
+            status_code, body = await self._execute(key, operation)
+            return JSONResponse(body, status_code=status_code)
+        finally:
+            del self._in_flight[key]
+            future.set_result(None)
+
+    async def _claim(self, key: str, request_hash: str) -> Optional[Tuple[int, Any]]:
+        """Claim key for this request, or return the (status, body) stored for it."""
+        async with AsyncSessionLocal() as db:
+            await self._purge_expired(db)
+            now = datetime.utcnow()
+            record = await db.get(IdempotencyKey, key)
+            if record is not None and record.expires_at <= now:
+                await db.delete(record)
+                await db.flush()
+                record = None
+            if record is None:
+                db.add(IdempotencyKey(
+                    key=key,
+                    request_hash=request_hash,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=self.ttl_seconds),
+                ))
+                try:
+                    await db.commit()
+                    return None
+                except IntegrityError:
+                    # Another process claimed it first
+                    await db.rollback()
+                    record = await db.get(IdempotencyKey, key)
+                    if record is None:
+                        raise self._conflict()
+            if record.request_hash != request_hash:
+                self.mismatched += 1
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Idempotency-Key was already used with a different request"
+                )
+            if record.status_code is not None:
+                return record.status_code, json.loads(record.response_body)
+            if record.created_at > now - timedelta(seconds=self.lock_seconds):
+                raise self._conflict()
+            # Abandoned by a process that died mid-request: take it over
+            taken = await db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key, IdempotencyKey.created_at == record.created_at)
+                .values(created_at=now)
+            )
+            await db.commit()
+            if taken.rowcount != 1:
+                raise self._conflict()
+            return None
+
+    def _conflict(self) -> HTTPException:
+        self.conflicts += 1
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still being processed",
+            headers={"Retry-After": "1"}
+        )
+
+    async def _execute(self, key: str, operation: Callable[[], Awaitable[Any]]) -> Tuple[int, Any]:
+        self.executed += 1
+        try:
+            status_code, body = status.HTTP_200_OK, jsonable_encoder(await operation())
+        except HTTPException as e:
+            if e.status_code >= 500:
+                await self._release(key)
+                raise
+            status_code, body = e.status_code, {"detail": e.detail}
+        except BaseException:
+            await self._release(key)
+            raise
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key)
+                .values(status_code=status_code, response_body=json.dumps(body))
+            )
+            await db.commit()
+        return status_code, body
+
+    async def _release(self, key: str):
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+            await db.commit()
+
+    async def _purge_expired(self, db):
+        if time.monotonic() - self._purged_at < PURGE_INTERVAL_SECONDS:
+            return
+        self._purged_at = time.monotonic()
+        await db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow()))
+        await db.commit()
+
+    def snapshot(self) -> dict:
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "in_flight": len(self._in_flight),
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "coalesced": self.coalesced,
+            "conflicts": self.conflicts,
+            "mismatched": self.mismatched,
+        }
+
+store = IdempotencyStore()
@@ -1,54 +1,61 @@
 """
-Initialize database with admin user
-Run this script once to create the admin user
+Initialize the database: apply pending migrations and create the default
+admin and staff users.
+
+The app does neither when it starts (it only refuses to start while
+migrations are pending), so run this once per database and again after
+every upgrade, before starting uvicorn. It is safe to run repeatedly.
+
+Usage: python init_db.py
 """
-from database import SessionLocal, engine, Base
+from sqlalchemy import select
+from database import AsyncSessionLocal, async_engine, engine
+from migrations import run_migrations
 from models import User, UserRole
 from auth import get_password_hash
+import asyncio
+import stats
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
-    db = SessionLocal()
-    
-    try:
-        # Check if admin exists
-        admin = db.query(User).filter(User.email == "admin@bank.com").first()
-        if not admin:
-            admin_user = User(
-                name="Admin User",
-                email="admin@bank.com",
-                password_hash=get_password_hash("admin123"),
-                role=UserRole.ADMIN,
+# (name, email, password, role)
+DEFAULT_USERS = [
+    ("Bank Admin", "admin@bank.com", "admin123", UserRole.ADMIN),
+    ("Bank Staff", "staff@bank.com", "staff123", UserRole.STAFF),
+]
+
+async def seed_default_users() -> list:
+    """Create the default users that are missing; returns the ones created."""
+    created = []
+    async with AsyncSessionLocal() as db:
+        for name, email, password, role in DEFAULT_USERS:
+            if await db.scalar(select(User.id).where(User.email == email)):
+                continue
+            db.add(User(
+                name=name,
+                email=email,
+                password_hash=await get_password_hash(password),
+                role=role,
                 is_active=1
-            )
-            db.add(admin_user)
-            db.commit()
-            print("✅ Admin user created!")
-            print("Email: admin@bank.com")
-            print("Password: admin123")
+            ))
+            await stats.user_created(db, role)
+            created.append((email, password))
+        await db.commit()
+    return created
+
+async def init_db():
+    try:
+        versions = run_migrations(engine)
+        if versions:
+            print(f"✅ Applied migrations: {', '.join(map(str, versions))}")
         else:
-            print("ℹ️  Admin user already exists")
-        
-        # Create a sample staff user
-        staff = db.query(User).filter(User.email == "staff@bank.com").first()
-        if not staff:
-            staff_user = User(
-                name="Staff User",
-                email="staff@bank.com",
-                password_hash=get_password_hash("staff123"),
-                role=UserRole.STAFF,
-                is_active=1
-            )
-            db.add(staff_user)
-            db.commit()
-            print("✅ Staff user created!")
-            print("Email: staff@bank.com")
-            print("Password: staff123")
-    except Exception as e:
-        print(f"Error: {e}")
-        db.rollback()
+            print("ℹ️  Schema is up to date")
+
+        created = await seed_default_users()
+        for email, password in created:
+            print(f"✅ Created {email} (password: {password})")
+        if not created:
+            print("ℹ️  Default admin and staff users already exist")
     finally:
-        db.close()
+        await async_engine.dispose()
 
 if __name__ == "__main__":
-    init_db()
+    asyncio.run(init_db())
@@ -0,0 +1,152 @@
+"""
+Hot/cold split of the ledger.
+
+Almost every read is for recent activity, so transactions (the hot table)
+only keeps the last LEDGER_HOT_DAYS days. archive_ledger() moves older
+rows, and the whole history of CLOSED accounts, into transactions_archive
+with their ids intact, LEDGER_ARCHIVE_BATCH rows per transaction. Run it
+periodically, e.g. from cron: python ledger_archive.py
+
+Readers learn what the archive may hold from two watermarks:
+
+- hot_cutoff: every transaction older than this is archived (or about
+  to be), so a read reaching back past it must include the archive;
+- closed_horizon: the newest timestamp among archived rows of closed
+  accounts, which can be younger than hot_cutoff.
+
+The job publishes new watermarks first, waits LEDGER_ARCHIVE_GRACE_SECONDS
+so every process's cached copy (see watermarks()) has caught up, and only
+then moves rows. A row is moved with an INSERT and a DELETE in one
+transaction, so a reader that includes the archive sees it exactly once.
+transaction_queries.py does the fan-out.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
+from sqlalchemy import and_, delete, insert, or_, select
+from sqlalchemy.engine import Connection, Engine
+import os
+import time
+
+from models import Account, AccountStatus, ArchivedTransaction, ArchiveWatermark, Transaction
+
+HOT_DAYS = int(os.getenv("LEDGER_HOT_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("LEDGER_ARCHIVE_BATCH", "5000"))
+WATERMARK_CACHE_SECONDS = float(os.getenv("LEDGER_WATERMARK_CACHE_SECONDS", "5"))
+GRACE_SECONDS = float(os.getenv("LEDGER_ARCHIVE_GRACE_SECONDS", str(2 * WATERMARK_CACHE_SECONDS)))
+
+HOT_CUTOFF = "hot_cutoff"
+CLOSED_HORIZON = "closed_horizon"
+
+LEDGER_COLUMNS = ("id", "from_account_id", "to_account_id", "amount", "transaction_type", "timestamp", "description")
+
+@dataclass(frozen=True)
+class Watermarks:
+    hot_cutoff: Optional[datetime] = None
+    closed_horizon: Optional[datetime] = None
+
+    def archive_needed(self, since: Optional[datetime], closed_accounts: bool = True) -> bool:
+        """
+        Whether rows from since onwards (None: all history) may be in the
+        archive. closed_accounts=False when the read is limited to accounts
+        that are not closed.
+        """
+        if self.hot_cutoff is not None and (since is None or since < self.hot_cutoff):
+            return True
+        return (
+            closed_accounts
+            and self.closed_horizon is not None
+            and (since is None or since <= self.closed_horizon)
+        )
+
+def read_watermarks(db) -> Watermarks:
+    """Current watermarks, read with a sync Session or Connection."""
+    return Watermarks(**dict(db.execute(select(ArchiveWatermark.name, ArchiveWatermark.boundary)).all()))
+
+_cached: Optional[Watermarks] = None
+_cached_at = 0.0
+
+async def watermarks(db) -> Watermarks:
+    """Watermarks for request handlers, cached for LEDGER_WATERMARK_CACHE_SECONDS."""
+    global _cached, _cached_at
+    if _cached is None or time.monotonic() - _cached_at > WATERMARK_CACHE_SECONDS:
+        _cached = Watermarks(**dict((await db.execute(select(ArchiveWatermark.name, ArchiveWatermark.boundary))).all()))
+        _cached_at = time.monotonic()
+    return _cached
+
+def closed_account_among(account_ids: Sequence[int]):
+    return select(Account.id).where(Account.id.in_(account_ids), Account.status == AccountStatus.CLOSED).limit(1)
+
+async def includes_closed(db, account_ids: Sequence[int]) -> bool:
+    return await db.scalar(closed_account_among(account_ids)) is not None
+
+# ================= ARCHIVE JOB =================
+
+def closed_only():
+    """Transactions whose every account is closed."""
+    closed = select(Account.id).where(Account.status == AccountStatus.CLOSED)
+    return and_(
+        or_(Transaction.from_account_id.is_(None), Transaction.from_account_id.in_(closed)),
+        or_(Transaction.to_account_id.is_(None), Transaction.to_account_id.in_(closed)),
+    )
+
+def publish(conn: Connection, name: str, boundary: Optional[datetime]) -> bool:
+    """Move a watermark forward (never back); returns whether it changed."""
+    current = conn.scalar(select(ArchiveWatermark.boundary).where(ArchiveWatermark.name == name))
+    if boundary is None or (current is not None and current >= boundary):
+        return False
+    if current is None:
+        conn.execute(insert(ArchiveWatermark).values(name=name, boundary=boundary))
+    else:
+        conn.execute(ArchiveWatermark.__table__.update().where(ArchiveWatermark.name == name).values(boundary=boundary))
+    return True
+
+def move_rows(bind: Engine, criterion, batch_size: int) -> int:
+    """Move matching transactions to the archive, one batch per transaction."""
+    hot = Transaction.__table__
+    moved = 0
+    while True:
+        with bind.begin() as conn:
+            ids = conn.scalars(select(hot.c.id).where(criterion).order_by(hot.c.id).limit(batch_size)).all()
+            if not ids:
+                return moved
+            conn.execute(insert(ArchivedTransaction.__table__).from_select(
+                LEDGER_COLUMNS,
+                select(*(hot.c[name] for name in LEDGER_COLUMNS)).where(hot.c.id.in_(ids)),
+            ))
+            conn.execute(delete(hot).where(hot.c.id.in_(ids)))
+        moved += len(ids)
+
+def archive_ledger(bind: Optional[Engine] = None, hot_days: int = HOT_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+                   grace_seconds: float = GRACE_SECONDS, now: Optional[datetime] = None) -> dict:
+    """Archive transactions older than hot_days and those of closed accounts."""
+    if bind is None:
+        from database import engine as bind
+    cutoff = (now or datetime.utcnow()) - timedelta(days=hot_days)
+    with bind.begin() as conn:
+        # Closed accounts' rows up to now; later ones wait for the next run
+        closed_newest = conn.scalar(select(Transaction.timestamp).where(closed_only())
+                                    .order_by(Transaction.timestamp.desc()).limit(1))
+        changed = publish(conn, HOT_CUTOFF, cutoff)
+        changed = publish(conn, CLOSED_HORIZON, closed_newest) or changed
+    if changed and grace_seconds > 0:
+        time.sleep(grace_seconds)
+    moved_aged = move_rows(bind, Transaction.timestamp < cutoff, batch_size)
+    moved_closed = 0
+    if closed_newest is not None:
+        moved_closed = move_rows(bind, and_(closed_only(), Transaction.timestamp <= closed_newest), batch_size)
+    return {
+        "hot_cutoff": cutoff.isoformat(),
+        "moved_aged": moved_aged,
+        "moved_closed": moved_closed,
+    }
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Move cold ledger rows to transactions_archive.")
+    parser.add_argument("--hot-days", type=int, default=HOT_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+    print(json.dumps(archive_ledger(hot_days=args.hot_days, batch_size=args.batch_size)))
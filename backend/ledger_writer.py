@@ -0,0 +1,199 @@
+"""
+Group-commit ledger writer.
+
+With SQLite every committed deposit, withdrawal or transfer costs an
+fsync, which caps throughput no matter how cheap the statements are.
+When LEDGER_WRITER is set, services.py hands those mutations to a single
+writer task instead of committing them in the request's own session.
+The writer takes up to LEDGER_WRITER_MAX_BATCH queued mutations, waiting
+at most LEDGER_WRITER_FLUSH_INTERVAL_MS for more to arrive after the
+first, applies each inside its own SAVEPOINT and commits the lot in one
+transaction. Every caller then gets its own result or error: a mutation
+that fails (insufficient balance, inactive account, ...) is rolled back
+to its savepoint without affecting the rest of the batch.
+
+The writer uses its own engine. On SQLite it opens transactions with
+BEGIN IMMEDIATE, so it holds the write lock from the start and pysqlite's
+own transaction handling (which breaks SAVEPOINT) is switched off for
+those connections only.
+
+The writer is per process; batch transfers and customer onboarding keep
+committing on their own, since they already write many rows per commit.
+"""
+from fastapi import HTTPException, status
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+import asyncio
+import os
+import time
+
+LEDGER_WRITER_ENABLED = os.getenv("LEDGER_WRITER", "").lower() in ("1", "true", "yes", "on")
+MAX_BATCH = int(os.getenv("LEDGER_WRITER_MAX_BATCH", "100"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("LEDGER_WRITER_FLUSH_INTERVAL_MS", "2")) / 1000
+
+# (apply function, request data, error prefix, caller's future)
+Mutation = Tuple[Callable[..., Awaitable[Any]], Any, str, asyncio.Future]
+
+def create_writer_engine(url: Optional[str] = None):
+    from database import ASYNC_DATABASE_URL, async_engine, count_statements, create_async_db_engine
+    url = url or ASYNC_DATABASE_URL
+    if not url.startswith("sqlite") and url == ASYNC_DATABASE_URL:
+        return async_engine
+
+    writer_engine = create_async_db_engine(url=url)
+    # Timed like the request engines, so slow batches reach the slow-query log
+    count_statements(writer_engine.sync_engine)
+    if not url.startswith("sqlite"):
+        return writer_engine
+
+    @event.listens_for(writer_engine.sync_engine, "connect")
+    def _no_driver_transactions(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN itself so SAVEPOINT works
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(writer_engine.sync_engine, "begin")
+    def _begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return writer_engine
+
+def fail(batch: List[Mutation], status_code: int, reason: str):
+    for _, _, failure, future in batch:
+        if not future.done():
+            future.set_exception(HTTPException(status_code=status_code, detail=f"{failure}: {reason}"))
+
+class LedgerWriter:
+    def __init__(self, bind=None, max_batch: int = MAX_BATCH, flush_interval: float = FLUSH_INTERVAL_SECONDS):
+        self.bind = bind
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._owns_bind = bind is None
+        self._sessions = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.mutations = 0
+        self.failed_batches = 0
+        self.batch_size_max = 0
+        self.batch_seconds_total = 0.0
+
+    def _start(self):
+        if self._sessions is None:
+            if self.bind is None:
+                self.bind = create_writer_engine()
+            self._sessions = async_sessionmaker(self.bind, autoflush=False, expire_on_commit=False)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="ledger-writer")
+
+    async def submit(self, apply: Callable[..., Awaitable[Any]], data: Any, failure: str = "Transaction failed"):
+        """Queue apply(db, data) for the next batch and wait until it is committed."""
+        if self._task is None or self._task.done():
+            self._start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((apply, data, failure, future))
+        return await future
+
+    async def _collect(self) -> List[Mutation]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        from database import query_counter
+        # The task inherits the context of the request that started it;
+        # its statements belong to no request.
+        query_counter.set(None)
+        while True:
+            batch = await self._collect()
+            try:
+                await self._apply_batch(batch)
+            finally:
+                # Only left unresolved if the writer was cancelled mid-batch
+                fail(batch, status.HTTP_503_SERVICE_UNAVAILABLE, "server is shutting down")
+
+    async def _apply_batch(self, batch: List[Mutation]):
+        outcomes = []
+        started = time.perf_counter()
+        try:
+            async with self._sessions() as db:
+                for apply, data, failure, _ in batch:
+                    try:
+                        async with db.begin_nested():
+                            result = await apply(db, data)
+                        # Detach this mutation's objects, so a later mutation of
+                        # the same account loads its own copy instead of setting
+                        # its balance on the one this caller gets back
+                        for instance in result:
+                            db.expunge(instance)
+                        outcomes.append((result, None))
+                    except HTTPException as e:
+                        outcomes.append((None, e))
+                    except Exception as e:
+                        outcomes.append((None, HTTPException(
+                            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"{failure}: {str(e)}"
+                        )))
+                await db.commit()
+        except Exception as e:
+            self.failed_batches += 1
+            fail(batch, status.HTTP_500_INTERNAL_SERVER_ERROR, str(e))
+            return
+        self.batches += 1
+        self.mutations += len(batch)
+        self.batch_size_max = max(self.batch_size_max, len(batch))
+        self.batch_seconds_total += time.perf_counter() - started
+        for (_, _, _, future), (result, error) in zip(batch, outcomes):
+            # A caller that went away (client disconnect) leaves a cancelled future
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        pending = []
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        fail(pending, status.HTTP_503_SERVICE_UNAVAILABLE, "server is shutting down")
+        if self._owns_bind and self.bind is not None:
+            from database import async_engine
+            if self.bind is not async_engine:
+                await self.bind.dispose()
+
+    def snapshot(self) -> dict:
+        batches = self.batches or 1
+        return {
+            "max_batch": self.max_batch,
+            "flush_interval_ms": self.flush_interval * 1000,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "mutations": self.mutations,
+            "batch_size_avg": self.mutations / batches,
+            "batch_size_max": self.batch_size_max,
+            "batch_seconds_avg": self.batch_seconds_total / batches,
+        }
+
+# None unless LEDGER_WRITER is set; services.py commits in the request's
+# own session then.
+writer: Optional[LedgerWriter] = LedgerWriter() if LEDGER_WRITER_ENABLED else None
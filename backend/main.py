@@ -1,68 +1,74 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta
-from typing import List
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager
+from datetime import date, datetime, timedelta
+from typing import List, Optional
 import io
+import json
+import tempfile
 
-from database import get_db, engine, Base
+from database import get_write_db, get_read_db, engine, async_engine, AsyncSessionLocal, effective_settings
+from migrations import pending_migrations
 from models import User, Customer, Account, Transaction, UserRole, TransactionType, AccountStatus, Session
 from schemas import (
     LoginRequest, Token, UserCreate, UserResponse, CustomerResponse,
     AccountResponse, TransactionResponse, CreateCustomerRequest,
     DepositWithdrawRequest, TransferRequest, CreateStaffRequest,
     UpdateUserStatusRequest, DashboardStats, OpenAccountRequest,
-    RegisterRequest, StaffApproveCustomerRequest, SessionSummary
+    RegisterRequest, StaffApproveCustomerRequest, SessionSummary, TransactionPage,
+    BatchMode, BatchTransferRequest, BatchTransferResponse, BalanceAsOfResponse
 )
 from auth import (
     authenticate_user, create_access_token, get_current_user,
     get_password_hash, require_admin, require_staff, require_customer
 )
 from services import (
-    create_customer_with_account, deposit_money, withdraw_money, transfer_money
+    create_customer_with_account, deposit_money, withdraw_money, transfer_money, transfer_batch,
+    balance_as_of
 )
+from account_numbers import next_account_number
+from transaction_queries import (
+    last_transaction_id, list_transactions, paginate_transactions, period_criteria, period_end, period_start
+)
+import bulk_import
+import hashing
+import idempotency
+import ledger_writer
+import replicas
+import request_metrics
+import slow_queries
+import stats
+import statement_renderer
+from statement_cache import cache as statement_cache, statement_key
+from principal_cache import Principal, cache as principal_cache
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
-from auth import get_password_hash
-
-def seed_default_users():
-    db = next(get_db())
-
-    # Admin
-    admin = db.query(User).filter(User.email == "admin@bank.com").first()
-    if not admin:
-        admin = User(
-            name="Bank Admin",
-            email="admin@bank.com",
-            password_hash=get_password_hash("admin123"),
-            role=UserRole.ADMIN,
-            is_active=1
-        )
-        db.add(admin)
-
-    # Staff
-    staff = db.query(User).filter(User.email == "staff@bank.com").first()
-    if not staff:
-        staff = User(
-            name="Bank Staff",
-            email="staff@bank.com",
-            password_hash=get_password_hash("staff123"),
-            role=UserRole.STAFF,
-            is_active=1
-        )
-        db.add(staff)
-
-    db.commit()
-    print("Default Admin & Staff users ensured")
-    
 app = FastAPI(title="Banking API", version="1.0.0")
 
 @app.on_event("startup")
-def startup_event():
-    seed_default_users()
+async def startup_event():
+    # Schema changes and default users are set up by init_db.py, not here
+    pending = pending_migrations(engine)
+    if pending:
+        raise RuntimeError(
+            f"Database schema is missing migrations {', '.join(map(str, pending))}; run `python init_db.py` first"
+        )
+    print("Database settings:", json.dumps(effective_settings()))
+    replicas.router.start()
+    stats.compactor.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    statement_renderer.shutdown_pool()
+    hashing.shutdown_pool()
+    if ledger_writer.writer is not None:
+        await ledger_writer.writer.stop()
+    await replicas.router.stop()
+    await stats.compactor.stop()
+    statement_cache.clear()
+    await async_engine.dispose()
 
 
 
@@ -73,13 +79,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Query-Count"],
 )
 
+# Outermost, so its latency covers CORS and error handling too
+app.add_middleware(request_metrics.MetricsMiddleware)
+
+@app.exception_handler(hashing.HashingBusy)
+async def hashing_busy_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Authentication service is busy, please retry shortly"},
+        headers={"Retry-After": str(hashing.RETRY_AFTER_SECONDS)}
+    )
+
 # ==================== AUTHENTICATION ====================
 
 @app.post("/api/auth/login", response_model=Token)
-async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
-    user = authenticate_user(db, login_data.email, login_data.password)
+async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_write_db)):
+    user = await authenticate_user(db, login_data.email, login_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -89,7 +107,7 @@ async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     # Record login session
     db_session = Session(user_id=user.id, login_time=datetime.utcnow())
     db.add(db_session)
-    db.commit()
+    await db.commit()
 
     access_token_expires = timedelta(minutes=30)
     access_token = create_access_token(
@@ -100,13 +118,13 @@ async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/api/auth/me", response_model=UserResponse)
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(current_user: Principal = Depends(get_current_user)):
     return current_user
 
 
 @app.post("/api/auth/register", response_model=UserResponse)
-async def register_user(data: RegisterRequest, db: Session = Depends(get_db)):
-    existing = db.query(User).filter(User.email == data.email).first()
+async def register_user(data: RegisterRequest, db: AsyncSession = Depends(get_write_db)):
+    existing = await db.scalar(select(User).where(User.email == data.email))
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -116,14 +134,14 @@ async def register_user(data: RegisterRequest, db: Session = Depends(get_db)):
     user = User(
         name=data.name,
         email=data.email,
-        password_hash=get_password_hash(data.password),
+        password_hash=await get_password_hash(data.password),
         role=UserRole.CUSTOMER,
         is_active=0,  # pending approval
         created_by_id=None,
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
 
     customer = Customer(
         user_id=user.id,
@@ -131,27 +149,29 @@ async def register_user(data: RegisterRequest, db: Session = Depends(get_db)):
         address=data.address or "",
     )
     db.add(customer)
-    db.commit()
-    db.refresh(user)
+    await stats.user_created(db, UserRole.CUSTOMER)
+    await db.commit()
+    await db.refresh(user)
 
     return user
 
 
 @app.post("/api/auth/logout")
-async def logout_user(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def logout_user(current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_write_db)):
     # Find the latest open session for this user
-    session = (
-        db.query(Session)
-        .filter(Session.user_id == current_user.id, Session.logout_time.is_(None))
+    session = await db.scalar(
+        select(Session)
+        .where(Session.user_id == current_user.id, Session.logout_time.is_(None))
         .order_by(Session.login_time.desc())
-        .first()
+        .limit(1)
     )
     if session:
         now = datetime.utcnow()
         session.logout_time = now
         if session.login_time:
             session.duration_seconds = (now - session.login_time).total_seconds()
-        db.commit()
+        await db.commit()
+    principal_cache.invalidate_user(current_user.id)
 
     return {"message": "Logged out"}
 
@@ -159,118 +179,100 @@ async def logout_user(current_user: User = Depends(get_current_user), db: Sessio
 
 @app.get("/api/customer/accounts", response_model=List[AccountResponse])
 async def get_my_accounts(
-    current_user: User = Depends(require_customer),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_customer),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    customer = db.query(Customer).filter(Customer.user_id == current_user.id).first()
-    if not customer:
+    if current_user.customer_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Customer profile not found"
         )
     
-    accounts = db.query(Account).filter(Account.customer_id == customer.id).all()
+    accounts = (await db.scalars(select(Account).where(Account.customer_id == current_user.customer_id))).all()
     return accounts
 
-@app.get("/api/customer/transactions", response_model=List[TransactionResponse])
+@app.get("/api/customer/transactions", response_model=TransactionPage)
 async def get_my_transactions(
-    current_user: User = Depends(require_customer),
-    db: Session = Depends(get_db),
-    limit: int = 50
+    current_user: Principal = Depends(require_customer),
+    db: AsyncSession = Depends(get_write_db),
+    limit: int = 50,
+    cursor: Optional[str] = None
 ):
-    customer = db.query(Customer).filter(Customer.user_id == current_user.id).first()
-    if not customer:
+    if current_user.customer_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Customer profile not found"
         )
     
-    accounts = db.query(Account.id).filter(Account.customer_id == customer.id).subquery()
-    
-    transactions = db.query(Transaction).filter(
-        (Transaction.from_account_id.in_(db.query(accounts.c.id))) |
-        (Transaction.to_account_id.in_(db.query(accounts.c.id)))
-    ).order_by(Transaction.timestamp.desc()).limit(limit).all()
+    account_ids = (await db.scalars(select(Account.id).where(Account.customer_id == current_user.customer_id))).all()
     
-    # Add account numbers to response
-    result = []
-    for txn in transactions:
-        txn_dict = {
-            "id": txn.id,
-            "from_account_id": txn.from_account_id,
-            "to_account_id": txn.to_account_id,
-            "amount": txn.amount,
-            "transaction_type": txn.transaction_type,
-            "timestamp": txn.timestamp,
-            "description": txn.description,
-            "from_account_number": txn.from_account.account_number if txn.from_account else None,
-            "to_account_number": txn.to_account.account_number if txn.to_account else None,
-        }
-        result.append(TransactionResponse(**txn_dict))
-    
-    return result
+    return await paginate_transactions(db, account_ids=account_ids, limit=limit, cursor=cursor)
 
 @app.post("/api/customer/transfer")
 async def customer_transfer(
     transfer_data: TransferRequest,
-    current_user: User = Depends(require_customer),
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None),
+    current_user: Principal = Depends(require_customer),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    customer = db.query(Customer).filter(Customer.user_id == current_user.id).first()
-    if not customer:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Customer profile not found"
-        )
-    
-    # Verify the account belongs to the customer
-    from_account = db.query(Account).filter(
-        Account.id == transfer_data.from_account_id,
-        Account.customer_id == customer.id
-    ).first()
-    
-    if not from_account:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Account does not belong to you"
-        )
-    
-    from_acc, to_acc, txn = transfer_money(db, transfer_data)
+    async def transfer():
+        if current_user.customer_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Customer profile not found"
+            )
+        
+        # Verify the account belongs to the customer
+        from_account = await db.scalar(select(Account).where(
+            Account.id == transfer_data.from_account_id,
+            Account.customer_id == current_user.customer_id
+        ))
+        
+        if not from_account:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Account does not belong to you"
+            )
+        
+        from_acc, to_acc, txn = await transfer_money(db, transfer_data)
+        
+        return {
+            "message": "Transfer successful",
+            "transaction": TransactionResponse(
+                id=txn.id,
+                from_account_id=txn.from_account_id,
+                to_account_id=txn.to_account_id,
+                amount=txn.amount,
+                transaction_type=txn.transaction_type,
+                timestamp=txn.timestamp,
+                description=txn.description,
+                from_account_number=from_acc.account_number,
+                to_account_number=to_acc.account_number
+            ),
+            "new_balance": from_acc.balance
+        }
     
-    return {
-        "message": "Transfer successful",
-        "transaction": TransactionResponse(
-            id=txn.id,
-            from_account_id=txn.from_account_id,
-            to_account_id=txn.to_account_id,
-            amount=txn.amount,
-            transaction_type=txn.transaction_type,
-            timestamp=txn.timestamp,
-            description=txn.description,
-            from_account_number=from_acc.account_number,
-            to_account_number=to_acc.account_number
-        ),
-        "new_balance": from_acc.balance
-    }
+    return await idempotency.store.run(idempotency_key, f"transfer:{current_user.id}", transfer_data, transfer)
 
 @app.get("/api/customer/statement/{account_id}")
 async def get_bank_statement(
     account_id: int,
-    current_user: User = Depends(require_customer),
-    db: Session = Depends(get_db),
-    format: str = "json"
+    current_user: Principal = Depends(require_customer),
+    db: AsyncSession = Depends(get_read_db),
+    format: str = "json",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
 ):
-    customer = db.query(Customer).filter(Customer.user_id == current_user.id).first()
-    if not customer:
+    if current_user.customer_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Customer profile not found"
         )
     
-    account = db.query(Account).filter(
+    account = await db.scalar(select(Account).where(
         Account.id == account_id,
-        Account.customer_id == customer.id
-    ).first()
+        Account.customer_id == current_user.customer_id
+    ))
     
     if not account:
         raise HTTPException(
@@ -278,111 +280,155 @@ async def get_bank_statement(
             detail="Account not found"
         )
     
-    transactions = db.query(Transaction).filter(
-        (Transaction.from_account_id == account_id) |
-        (Transaction.to_account_id == account_id)
-    ).order_by(Transaction.timestamp.desc()).all()
-    
-    transactions_data = [
-        TransactionResponse(
-            id=txn.id,
-            from_account_id=txn.from_account_id,
-            to_account_id=txn.to_account_id,
-            amount=txn.amount,
-            transaction_type=txn.transaction_type,
-            timestamp=txn.timestamp,
-            description=txn.description,
-            from_account_number=txn.from_account.account_number if txn.from_account else None,
-            to_account_number=txn.to_account.account_number if txn.to_account else None,
-        )
-        for txn in transactions
-    ]
+    period = period_criteria(start_date, end_date)
     
     if format == "pdf":
+        headers = {
+            "Content-Disposition": f"attachment; filename=statement_{account.account_number}.pdf"
+        }
+        header = statement_renderer.statement_header(account, date.today())
+        last_id = await last_transaction_id(db, [account.id], *period, since=period_start(start_date))
+        key = statement_key(account.id, last_id, start_date, end_date, header)
+        cached = statement_cache.get(key)
+        if cached is not None:
+            return StreamingResponse(cached, media_type="application/pdf", headers=headers)
+        
+        # Rendering happens in the statement process pool so the event loop
+        # keeps serving other requests meanwhile.
         try:
-            from pdf_generator import generate_bank_statement
-            account_dict = {
-                "account_number": account.account_number,
-                "account_type": account.account_type.value,
-                "balance": float(account.balance),
-                "status": account.status.value
-            }
-            transactions_dict = [
-                {
-                    "timestamp": txn.timestamp.isoformat() if hasattr(txn.timestamp, 'isoformat') else str(txn.timestamp),
-                    "transaction_type": txn.transaction_type.value,
-                    "from_account_number": txn.from_account.account_number if txn.from_account else None,
-                    "to_account_number": txn.to_account.account_number if txn.to_account else None,
-                    "amount": float(txn.amount),
-                    "description": txn.description or ""
-                }
-                for txn in transactions
-            ]
-            pdf_buffer = generate_bank_statement(account_dict, transactions_dict)
-            pdf_buffer.seek(0)
-            return StreamingResponse(
-                pdf_buffer,
-                media_type="application/pdf",
-                headers={
-                    "Content-Disposition": f"attachment; filename=statement_{account.account_number}.pdf"
-                }
+            pdf_path = await statement_renderer.render_statement(
+                account.id, header, start_date, end_date, database_url=db.info.get("database_url")
+            )
+        except statement_renderer.RendererBusy:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Statement service is busy, please retry shortly",
+                headers={"Retry-After": str(statement_renderer.RETRY_AFTER_SECONDS)}
             )
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to generate PDF: {str(e)}"
             )
+        return StreamingResponse(
+            statement_cache.put_file(key, pdf_path),
+            media_type="application/pdf",
+            headers=headers
+        )
+    
+    transactions_data = await list_transactions(db, *period, account_ids=[account_id], since=period_start(start_date))
+    opening_balance = await balance_as_of(db, account.id, period_start(start_date) or datetime.min)
+    closing_balance = await balance_as_of(db, account.id, period_end(end_date)) if end_date else account.balance
     
     return {
         "account": AccountResponse.model_validate(account),
+        "opening_balance": opening_balance,
+        "closing_balance": closing_balance,
         "transactions": transactions_data
     }
 
+@app.get("/api/customer/accounts/{account_id}/balance", response_model=BalanceAsOfResponse)
+async def get_my_balance_as_of(
+    account_id: int,
+    as_of: datetime,
+    current_user: Principal = Depends(require_customer),
+    db: AsyncSession = Depends(get_read_db)
+):
+    owned = await db.scalar(select(Account.id).where(
+        Account.id == account_id,
+        Account.customer_id == current_user.customer_id
+    ))
+    if owned is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Account not found"
+        )
+    
+    return BalanceAsOfResponse(account_id=account_id, as_of=as_of, balance=await balance_as_of(db, account_id, as_of))
+
 # ==================== STAFF ENDPOINTS ====================
 
 @app.post("/api/staff/customers", response_model=UserResponse)
 async def create_customer(
     customer_data: CreateCustomerRequest,
-    current_user: User = Depends(require_staff),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_staff),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    user, customer, account = create_customer_with_account(db, customer_data, current_user.id)
+    user, customer, account = await create_customer_with_account(db, customer_data, current_user.id)
     return user
 
+@app.post("/api/staff/customers/import")
+async def import_customers(
+    request: Request,
+    current_user: Principal = Depends(require_staff),
+    format: Optional[str] = None
+):
+    fmt = format or bulk_import.format_for(request.headers.get("content-type"))
+    if fmt not in bulk_import.FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Send text/csv or application/x-ndjson, or pass format=csv|ndjson"
+        )
+    
+    # Spool the upload to disk so rows can be parsed lazily without
+    # holding the whole file in memory.
+    upload = tempfile.TemporaryFile()
+    async for chunk in request.stream():
+        upload.write(chunk)
+    upload.seek(0)
+    # utf-8-sig drops the byte order mark spreadsheet exports start with
+    rows = bulk_import.parse_rows(io.TextIOWrapper(upload, encoding="utf-8-sig", newline=""), fmt)
+    
+    async def report():
+        # The import outlives the request dependencies, so it opens its own session
+        try:
+            async with AsyncSessionLocal() as db:
+                async for event in bulk_import.import_customers(db, rows, current_user.id):
+                    yield json.dumps(event) + "\n"
+        finally:
+            upload.close()
+    
+    return StreamingResponse(report(), media_type="application/x-ndjson")
+
 @app.get("/api/staff/customers", response_model=List[CustomerResponse])
 async def get_all_customers(
-    current_user: User = Depends(require_staff),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_staff),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    customers = db.query(Customer).join(User).filter(User.role == UserRole.CUSTOMER).all()
+    customers = (await db.scalars(
+        select(Customer)
+        .join(User)
+        .where(User.role == UserRole.CUSTOMER)
+        .options(contains_eager(Customer.user))
+    )).all()
     return customers
 
 
 @app.get("/api/staff/customers/pending", response_model=List[CustomerResponse])
 async def get_pending_customers(
-    current_user: User = Depends(require_staff),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_staff),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    customers = (
-        db.query(Customer)
+    customers = (await db.scalars(
+        select(Customer)
         .join(User)
-        .filter(
+        .where(
             User.role == UserRole.CUSTOMER,
             User.is_active == 0,
             User.created_by_id.is_(None),
         )
-        .all()
-    )
+        .options(contains_eager(Customer.user))
+    )).all()
     return customers
 
 
 @app.post("/api/staff/customers/approve")
 async def approve_or_reject_customer(
     payload: StaffApproveCustomerRequest,
-    current_user: User = Depends(require_staff),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_staff),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    user = db.query(User).filter(User.id == payload.user_id, User.role == UserRole.CUSTOMER).first()
+    user = await db.scalar(select(User).where(User.id == payload.user_id, User.role == UserRole.CUSTOMER))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -391,91 +437,123 @@ async def approve_or_reject_customer(
 
     if payload.approve:
         user.is_active = 1
-        db.commit()
+        await db.commit()
+        principal_cache.invalidate_user(user.id)
         return {"message": "Customer approved"}
     else:
         # Delete related customer and any accounts for cleanup
-        customer = db.query(Customer).filter(Customer.user_id == user.id).first()
+        customer = await db.scalar(select(Customer).where(Customer.user_id == user.id))
         if customer:
-            db.query(Account).filter(Account.customer_id == customer.id).delete()
-            db.delete(customer)
-        db.delete(user)
-        db.commit()
+            removed_accounts, removed_balance = (await db.execute(
+                select(func.count(Account.id), func.coalesce(func.sum(Account.balance), 0.0))
+                .where(Account.customer_id == customer.id)
+            )).one()
+            await db.execute(delete(Account).where(Account.customer_id == customer.id))
+            await db.delete(customer)
+            await stats.bump(db, total_accounts=-removed_accounts, total_balance=-removed_balance)
+        await db.delete(user)
+        await stats.bump(db, total_users=-1, total_customers=-1)
+        await db.commit()
+        principal_cache.invalidate_user(payload.user_id)
         return {"message": "Customer rejected and removed"}
 
 @app.post("/api/staff/deposit")
 async def staff_deposit(
     deposit_data: DepositWithdrawRequest,
-    current_user: User = Depends(require_staff),
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None),
+    current_user: Principal = Depends(require_staff),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    account, txn = deposit_money(db, deposit_data)
-    return {
-        "message": "Deposit successful",
-        "account": AccountResponse.model_validate(account),
-        "transaction": TransactionResponse(
-            id=txn.id,
-            from_account_id=txn.from_account_id,
-            to_account_id=txn.to_account_id,
-            amount=txn.amount,
-            transaction_type=txn.transaction_type,
-            timestamp=txn.timestamp,
-            description=txn.description,
-            from_account_number=None,
-            to_account_number=account.account_number
-        )
-    }
+    async def deposit():
+        account, txn = await deposit_money(db, deposit_data)
+        return {
+            "message": "Deposit successful",
+            "account": AccountResponse.model_validate(account),
+            "transaction": TransactionResponse(
+                id=txn.id,
+                from_account_id=txn.from_account_id,
+                to_account_id=txn.to_account_id,
+                amount=txn.amount,
+                transaction_type=txn.transaction_type,
+                timestamp=txn.timestamp,
+                description=txn.description,
+                from_account_number=None,
+                to_account_number=account.account_number
+            )
+        }
+    
+    return await idempotency.store.run(idempotency_key, f"deposit:{current_user.id}", deposit_data, deposit)
 
 @app.post("/api/staff/withdraw")
 async def staff_withdraw(
     withdraw_data: DepositWithdrawRequest,
-    current_user: User = Depends(require_staff),
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None),
+    current_user: Principal = Depends(require_staff),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    account, txn = withdraw_money(db, withdraw_data)
-    return {
-        "message": "Withdrawal successful",
-        "account": AccountResponse.model_validate(account),
-        "transaction": TransactionResponse(
-            id=txn.id,
-            from_account_id=txn.from_account_id,
-            to_account_id=txn.to_account_id,
-            amount=txn.amount,
-            transaction_type=txn.transaction_type,
-            timestamp=txn.timestamp,
-            description=txn.description,
-            from_account_number=account.account_number,
-            to_account_number=None
-        )
-    }
+    async def withdraw():
+        account, txn = await withdraw_money(db, withdraw_data)
+        return {
+            "message": "Withdrawal successful",
+            "account": AccountResponse.model_validate(account),
+            "transaction": TransactionResponse(
+                id=txn.id,
+                from_account_id=txn.from_account_id,
+                to_account_id=txn.to_account_id,
+                amount=txn.amount,
+                transaction_type=txn.transaction_type,
+                timestamp=txn.timestamp,
+                description=txn.description,
+                from_account_number=account.account_number,
+                to_account_number=None
+            )
+        }
+    
+    return await idempotency.store.run(idempotency_key, f"withdraw:{current_user.id}", withdraw_data, withdraw)
+
+@app.post("/api/staff/transfers/batch", response_model=BatchTransferResponse)
+async def staff_batch_transfer(
+    batch: BatchTransferRequest,
+    current_user: Principal = Depends(require_staff),
+    db: AsyncSession = Depends(get_write_db)
+):
+    result = await transfer_batch(db, batch)
+    if not result.committed and batch.mode == BatchMode.ALL_OR_NOTHING:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content=result.model_dump(mode="json"))
+    return result
 
 @app.get("/api/staff/accounts/{customer_id}", response_model=List[AccountResponse])
 async def get_customer_accounts(
     customer_id: int,
-    current_user: User = Depends(require_staff),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_staff),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    accounts = db.query(Account).filter(Account.customer_id == customer_id).all()
+    accounts = (await db.scalars(select(Account).where(Account.customer_id == customer_id))).all()
     return accounts
 
+@app.get("/api/staff/accounts/{account_id}/balance", response_model=BalanceAsOfResponse)
+async def get_balance_as_of(
+    account_id: int,
+    as_of: datetime,
+    current_user: Principal = Depends(require_staff),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return BalanceAsOfResponse(account_id=account_id, as_of=as_of, balance=await balance_as_of(db, account_id, as_of))
+
 @app.post("/api/staff/accounts", response_model=AccountResponse)
 async def open_account(
     account_data: OpenAccountRequest,
-    current_user: User = Depends(require_staff),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_staff),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    from services import generate_account_number
-    
-    customer = db.query(Customer).filter(Customer.id == account_data.customer_id).first()
+    customer = await db.get(Customer, account_data.customer_id)
     if not customer:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Customer not found"
         )
     
-    account_number = generate_account_number()
-    while db.query(Account).filter(Account.account_number == account_number).first():
-        account_number = generate_account_number()
+    account_number = await next_account_number()
     
     db_account = Account(
         customer_id=customer.id,
@@ -489,15 +567,21 @@ async def open_account(
     if account_data.initial_balance > 0:
         db_transaction = Transaction(
             from_account_id=None,
-            to_account_id=db_account.id,
+            to_account=db_account,
             amount=account_data.initial_balance,
             transaction_type=TransactionType.DEPOSIT,
             description="Initial deposit"
         )
         db.add(db_transaction)
     
-    db.commit()
-    db.refresh(db_account)
+    await stats.bump(
+        db,
+        total_accounts=1,
+        total_balance=account_data.initial_balance,
+        total_transactions=1 if account_data.initial_balance > 0 else 0,
+    )
+    await db.commit()
+    await db.refresh(db_account)
     
     return db_account
 
@@ -506,10 +590,10 @@ async def open_account(
 @app.post("/api/admin/staff", response_model=UserResponse)
 async def create_staff(
     staff_data: CreateStaffRequest,
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    existing_user = db.query(User).filter(User.email == staff_data.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == staff_data.email))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -519,29 +603,30 @@ async def create_staff(
     db_user = User(
         name=staff_data.name,
         email=staff_data.email,
-        password_hash=get_password_hash(staff_data.password),
+        password_hash=await get_password_hash(staff_data.password),
         role=UserRole.STAFF,
         is_active=1,
         created_by_id=current_user.id
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await stats.user_created(db, UserRole.STAFF)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @app.get("/api/admin/users", response_model=List[UserResponse])
 async def get_all_users(
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    users = db.query(User).all()
+    users = (await db.scalars(select(User))).all()
     return users
 
 @app.put("/api/admin/users/status")
 async def update_user_status(
     status_data: UpdateUserStatusRequest,
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_write_db)
 ):
     if status_data.user_id == current_user.id:
         raise HTTPException(
@@ -549,7 +634,7 @@ async def update_user_status(
             detail="Cannot change your own status"
         )
     
-    user = db.query(User).filter(User.id == status_data.user_id).first()
+    user = await db.get(User, status_data.user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -557,69 +642,35 @@ async def update_user_status(
         )
     
     user.is_active = status_data.is_active
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    principal_cache.invalidate_user(user.id)
+    await db.refresh(user)
     return {"message": "User status updated", "user": UserResponse.model_validate(user)}
 
-@app.get("/api/admin/transactions", response_model=List[TransactionResponse])
+@app.get("/api/admin/transactions", response_model=TransactionPage)
 async def get_all_transactions(
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db),
-    limit: int = 100
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_read_db),
+    limit: int = 100,
+    cursor: Optional[str] = None
 ):
-    transactions = db.query(Transaction).order_by(Transaction.timestamp.desc()).limit(limit).all()
-    
-    result = []
-    for txn in transactions:
-        result.append(TransactionResponse(
-            id=txn.id,
-            from_account_id=txn.from_account_id,
-            to_account_id=txn.to_account_id,
-            amount=txn.amount,
-            transaction_type=txn.transaction_type,
-            timestamp=txn.timestamp,
-            description=txn.description,
-            from_account_number=txn.from_account.account_number if txn.from_account else None,
-            to_account_number=txn.to_account.account_number if txn.to_account else None,
-        ))
-    
-    return result
+    return await paginate_transactions(db, limit=limit, cursor=cursor)
 
 @app.get("/api/admin/dashboard", response_model=DashboardStats)
 async def get_admin_dashboard(
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    total_users = db.query(func.count(User.id)).scalar()
-    total_customers = db.query(func.count(User.id)).filter(User.role == UserRole.CUSTOMER).scalar()
-    total_staff = db.query(func.count(User.id)).filter(User.role == UserRole.STAFF).scalar()
-    total_accounts = db.query(func.count(Account.id)).scalar()
-    total_balance = db.query(func.sum(Account.balance)).scalar() or 0.0
-    total_transactions = db.query(func.count(Transaction.id)).scalar()
+    totals = await stats.read_stats(db)
     
-    recent_transactions = db.query(Transaction).order_by(Transaction.timestamp.desc()).limit(10).all()
-
-    recent_txns_list = []
-    for txn in recent_transactions:
-        recent_txns_list.append(TransactionResponse(
-            id=txn.id,
-            from_account_id=txn.from_account_id,
-            to_account_id=txn.to_account_id,
-            amount=txn.amount,
-            transaction_type=txn.transaction_type,
-            timestamp=txn.timestamp,
-            description=txn.description,
-            from_account_number=txn.from_account.account_number if txn.from_account else None,
-            to_account_number=txn.to_account.account_number if txn.to_account else None,
-        ))
+    recent_txns_list = await list_transactions(db, limit=10)
 
-    recent_sessions_q = (
-        db.query(Session, User)
+    recent_sessions_q = (await db.execute(
+        select(Session, User)
         .join(User, Session.user_id == User.id)
         .order_by(Session.login_time.desc())
         .limit(10)
-        .all()
-    )
+    )).all()
     recent_sessions = [
         SessionSummary(
             id=sess.id,
@@ -633,16 +684,75 @@ async def get_admin_dashboard(
     ]
 
     return DashboardStats(
-        total_users=total_users,
-        total_customers=total_customers,
-        total_staff=total_staff,
-        total_accounts=total_accounts,
-        total_balance=float(total_balance),
-        total_transactions=total_transactions,
+        total_users=int(totals["total_users"]),
+        total_customers=int(totals["total_customers"]),
+        total_staff=int(totals["total_staff"]),
+        total_accounts=int(totals["total_accounts"]),
+        total_balance=float(totals["total_balance"]),
+        total_transactions=int(totals["total_transactions"]),
         recent_transactions=recent_txns_list,
         recent_sessions=recent_sessions,
     )
 
+@app.post("/api/admin/stats/recompute")
+async def recompute_dashboard_stats(
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_write_db)
+):
+    totals = await db.run_sync(stats.recompute)
+    await db.commit()
+    return {"message": "Dashboard stats recomputed", "stats": totals}
+
+@app.get("/api/admin/statements/metrics")
+async def get_statement_metrics(current_user: Principal = Depends(require_admin)):
+    return {
+        **statement_renderer.metrics.snapshot(),
+        "cache": statement_cache.snapshot(),
+    }
+
+@app.get("/api/admin/hashing/metrics")
+async def get_hashing_metrics(current_user: Principal = Depends(require_admin)):
+    return hashing.metrics.snapshot()
+
+@app.get("/api/admin/idempotency/metrics")
+async def get_idempotency_metrics(current_user: Principal = Depends(require_admin)):
+    return idempotency.store.snapshot()
+
+@app.get("/api/admin/replicas/metrics")
+async def get_replica_metrics(current_user: Principal = Depends(require_admin)):
+    return replicas.router.snapshot()
+
+@app.get("/api/admin/ledger-writer/metrics")
+async def get_ledger_writer_metrics(current_user: Principal = Depends(require_admin)):
+    if ledger_writer.writer is None:
+        return {"enabled": False}
+    return {"enabled": True, **ledger_writer.writer.snapshot()}
+
+@app.get("/api/admin/slow-queries")
+async def get_slow_queries(current_user: Principal = Depends(require_admin)):
+    return {**slow_queries.log.snapshot(), "queries": slow_queries.log.recent()}
+
+@app.delete("/api/admin/slow-queries")
+async def clear_slow_queries(current_user: Principal = Depends(require_admin)):
+    slow_queries.log.clear()
+    return {"message": "Slow-query log cleared"}
+
+@app.get("/api/admin/metrics")
+async def get_prometheus_metrics(current_user: Principal = Depends(require_admin)):
+    components = {
+        "hashing": hashing.metrics.snapshot(),
+        "principal_cache": principal_cache.snapshot(),
+        "statements": statement_renderer.metrics.snapshot(),
+        "statement_cache": statement_cache.snapshot(),
+        "idempotency": idempotency.store.snapshot(),
+        "replicas": replicas.router.snapshot(),
+        "slow_queries": slow_queries.log.snapshot(),
+        "stats_compactor": stats.compactor.snapshot(),
+    }
+    if ledger_writer.writer is not None:
+        components["ledger_writer"] = ledger_writer.writer.snapshot()
+    return Response(request_metrics.render(components), media_type=request_metrics.CONTENT_TYPE)
+
 # Health check
 @app.get("/api/health")
 async def health_check():
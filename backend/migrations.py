@@ -0,0 +1,134 @@
+"""
+Versioned schema migrations.
+
+Base.metadata.create_all only creates missing tables; it never adds an
+index or column to a table that already exists. Schema changes are
+therefore listed here as numbered steps, and the applied versions are
+recorded in the schema_migrations table.
+
+Each step is written to be idempotent so a fresh database and an existing
+banking.db converge on the same schema.
+
+Usage: python migrations.py
+"""
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, insert, inspect, select
+from sqlalchemy.engine import Connection, Engine
+from database import Base, engine
+from models import NumberSequence  # importing models registers the tables on Base.metadata
+import account_numbers
+import stats
+
+migration_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# ================= HELPERS =================
+
+def create_tables(conn: Connection, *names: str):
+    tables = [Base.metadata.tables[name] for name in names]
+    Base.metadata.create_all(bind=conn, tables=tables, checkfirst=True)
+
+def create_indexes(conn: Connection, table_name: str, *index_names: str):
+    table = Base.metadata.tables[table_name]
+    existing = {ix["name"] for ix in inspect(conn).get_indexes(table_name)}
+    for index in table.indexes:
+        if index.name in index_names and index.name not in existing:
+            index.create(bind=conn)
+
+# ================= MIGRATIONS =================
+
+def initial_schema(conn: Connection):
+    create_tables(conn, "users", "customers", "accounts", "transactions", "sessions")
+
+def ledger_indexes(conn: Connection):
+    create_indexes(
+        conn, "transactions",
+        "ix_transactions_from_account_timestamp",
+        "ix_transactions_to_account_timestamp",
+    )
+    create_indexes(conn, "accounts", "ix_accounts_customer_id")
+
+def dashboard_counters(conn: Connection):
+    create_tables(conn, "bank_stats")
+    stats.recompute(conn, include_archive=False, include_deltas=False)
+
+def account_number_sequence(conn: Connection):
+    create_tables(conn, "number_sequences")
+    exists = conn.scalar(
+        select(NumberSequence.name).where(NumberSequence.name == account_numbers.SEQUENCE_NAME)
+    )
+    if not exists:
+        conn.execute(insert(NumberSequence).values(
+            name=account_numbers.SEQUENCE_NAME,
+            next_value=account_numbers.SEQUENCE_START,
+        ))
+
+def idempotency_keys(conn: Connection):
+    create_tables(conn, "idempotency_keys")
+
+def ledger_archive(conn: Connection):
+    create_tables(conn, "transactions_archive", "archive_watermarks")
+
+def balance_snapshots(conn: Connection):
+    create_tables(conn, "balance_snapshots")
+
+def dashboard_counter_deltas(conn: Connection):
+    create_tables(conn, "bank_stat_deltas")
+
+MIGRATIONS = [
+    (1, "Initial schema", initial_schema),
+    (2, "Composite ledger indexes", ledger_indexes),
+    (3, "Dashboard counters", dashboard_counters),
+    (4, "Account number sequence", account_number_sequence),
+    (5, "Idempotency keys", idempotency_keys),
+    (6, "Ledger archive", ledger_archive),
+    (7, "Daily balance snapshots", balance_snapshots),
+    (8, "Dashboard counter deltas", dashboard_counter_deltas),
+]
+
+# ================= RUNNER =================
+
+def applied_versions(conn: Connection) -> set:
+    migration_metadata.create_all(bind=conn, checkfirst=True)
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+def run_migrations(bind: Engine = engine) -> list:
+    """Apply every pending migration in order, each in its own transaction."""
+    applied = []
+    with bind.begin() as conn:
+        done = applied_versions(conn)
+    for version, description, upgrade in MIGRATIONS:
+        if version in done:
+            continue
+        with bind.begin() as conn:
+            upgrade(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.utcnow(),
+            ))
+        applied.append(version)
+    return applied
+
+def pending_migrations(bind: Engine = engine) -> list:
+    """Versions not applied yet. Read-only: unlike run_migrations it creates nothing."""
+    with bind.connect() as conn:
+        if not inspect(conn).has_table(schema_migrations.name):
+            done = set()
+        else:
+            done = set(conn.execute(select(schema_migrations.c.version)).scalars())
+    return [version for version, _, _ in MIGRATIONS if version not in done]
+
+if __name__ == "__main__":
+    versions = run_migrations()
+    if versions:
+        print(f"Applied migrations: {', '.join(map(str, versions))}")
+    else:
+        print("Schema is up to date")
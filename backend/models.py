@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum as SQLEnum
+from sqlalchemy import BigInteger, Column, Date, Integer, String, Float, DateTime, ForeignKey, Index, Text, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -66,7 +66,7 @@ class Account(Base):
     __tablename__ = "accounts"
 
     id = Column(Integer, primary_key=True, index=True)
-    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, index=True)
     account_number = Column(String(20), unique=True, index=True, nullable=False)
     balance = Column(Float, default=0.0, nullable=False)
     account_type = Column(SQLEnum(AccountType), nullable=False, default=AccountType.SAVINGS)
@@ -82,6 +82,14 @@ class Account(Base):
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Per-account history is read newest first from either side of the ledger
+        Index("ix_transactions_from_account_timestamp", "from_account_id", "timestamp"),
+        Index("ix_transactions_to_account_timestamp", "to_account_id", "timestamp"),
+    )
+    # Fetch the server-side timestamp on INSERT (RETURNING where available)
+    # so callers can return a new transaction without refreshing it
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     from_account_id = Column(Integer, ForeignKey("accounts.id"), nullable=True)
@@ -96,6 +104,39 @@ class Transaction(Base):
     to_account = relationship("Account", foreign_keys=[to_account_id], back_populates="transactions_to")
 
 
+class ArchivedTransaction(Base):
+    """Cold ledger rows moved out of transactions by ledger_archive.py; ids are kept."""
+    __tablename__ = "transactions_archive"
+    __table_args__ = (
+        Index("ix_transactions_archive_from_account_timestamp", "from_account_id", "timestamp"),
+        Index("ix_transactions_archive_to_account_timestamp", "to_account_id", "timestamp"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    from_account_id = Column(Integer, ForeignKey("accounts.id"), nullable=True)
+    to_account_id = Column(Integer, ForeignKey("accounts.id"), nullable=True)
+    amount = Column(Float, nullable=False)
+    transaction_type = Column(SQLEnum(TransactionType), nullable=False)
+    timestamp = Column(DateTime(timezone=True), nullable=False, index=True)
+    description = Column(String(255), nullable=True)
+
+class ArchiveWatermark(Base):
+    """Boundaries published by the archive job before it moves rows; see ledger_archive.py."""
+    __tablename__ = "archive_watermarks"
+
+    name = Column(String(50), primary_key=True)
+    boundary = Column(DateTime(timezone=True), nullable=False)
+
+
+class BalanceSnapshot(Base):
+    """End-of-day balance of an account on a day it had activity; see balance_snapshots.py."""
+    __tablename__ = "balance_snapshots"
+
+    account_id = Column(Integer, ForeignKey("accounts.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    balance = Column(Float, nullable=False)
+
+
 # ================= USER SESSION =================
 
 class Session(Base):
@@ -108,3 +149,43 @@ class Session(Base):
     duration_seconds = Column(Float, nullable=True)
 
     user = relationship("User")
+
+
+# ================= BANK STATS =================
+
+class BankStat(Base):
+    """Running totals shown on the admin dashboard, kept in step by stats.py."""
+    __tablename__ = "bank_stats"
+
+    name = Column(String(50), primary_key=True)
+    value = Column(Float, nullable=False, default=0.0)
+
+class BankStatDelta(Base):
+    """A change to a BankStat not yet folded into it; stats.compact() folds and deletes these."""
+    __tablename__ = "bank_stat_deltas"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50), nullable=False)
+    value = Column(Float, nullable=False)
+
+# ================= NUMBER SEQUENCES =================
+
+class NumberSequence(Base):
+    """Next unreserved value of a named counter; account_numbers.py hands it out in blocks."""
+    __tablename__ = "number_sequences"
+
+    name = Column(String(50), primary_key=True)
+    next_value = Column(BigInteger, nullable=False)
+
+# ================= IDEMPOTENCY KEYS =================
+
+class IdempotencyKey(Base):
+    """Outcome of a request sent with an Idempotency-Key header; see idempotency.py."""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(64), primary_key=True)  # sha256 of endpoint, user and client key
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=True)  # NULL while the request is still running
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
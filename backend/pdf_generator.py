@@ -6,12 +6,18 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT
 from io import BytesIO
 from datetime import datetime
+from functools import lru_cache
 
-def generate_bank_statement(account, transactions):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    story = []
-    
+# Transactions per table; roughly one printed page at the row font size, so
+# the layout engine never has to split one huge table.
+ROWS_PER_TABLE = 40
+
+TRANSACTION_HEADER = ['Date', 'Type', 'From Account', 'To Account', 'Amount', 'Description']
+TRANSACTION_COL_WIDTHS = [1*inch, 0.8*inch, 1.2*inch, 1.2*inch, 1*inch, 1.8*inch]
+
+@lru_cache(maxsize=None)
+def statement_styles():
+    """Paragraph and table styles, built once per process."""
     styles = getSampleStyleSheet()
     title_style = ParagraphStyle(
         'CustomTitle',
@@ -21,22 +27,7 @@ def generate_bank_statement(account, transactions):
         spaceAfter=30,
         alignment=TA_CENTER
     )
-    
-    # Title
-    story.append(Paragraph("Bank Statement", title_style))
-    story.append(Spacer(1, 0.3*inch))
-    
-    # Account Information
-    account_info = [
-        ['Account Number:', account['account_number']],
-        ['Account Type:', account['account_type'].capitalize()],
-        ['Current Balance:', f"${account['balance']:.2f}"],
-        ['Status:', account['status'].capitalize()],
-        ['Statement Date:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')]
-    ]
-    
-    account_table = Table(account_info, colWidths=[2*inch, 4*inch])
-    account_table.setStyle(TableStyle([
+    account_table_style = TableStyle([
         ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e6f2ff')),
         ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
         ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
@@ -44,55 +35,8 @@ def generate_bank_statement(account, transactions):
         ('FONTSIZE', (0, 0), (-1, -1), 10),
         ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
         ('GRID', (0, 0), (-1, -1), 1, colors.grey)
-    ]))
-    
-    story.append(account_table)
-    story.append(Spacer(1, 0.5*inch))
-    
-    # Transactions Header
-    story.append(Paragraph("Transaction History", styles['Heading2']))
-    story.append(Spacer(1, 0.2*inch))
-    
-    # Transactions Table
-    transaction_data = [['Date', 'Type', 'From Account', 'To Account', 'Amount', 'Description']]
-    
-    for txn in transactions:
-        try:
-            timestamp = txn['timestamp']
-            if isinstance(timestamp, str):
-                # Try parsing ISO format
-                if 'Z' in timestamp:
-                    dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                elif '+' in timestamp or timestamp.count('-') > 2:
-                    dt = datetime.fromisoformat(timestamp.replace('+00:00', ''))
-                else:
-                    dt = datetime.fromisoformat(timestamp)
-                date_str = dt.strftime('%Y-%m-%d %H:%M')
-            elif isinstance(timestamp, datetime):
-                date_str = timestamp.strftime('%Y-%m-%d %H:%M')
-            else:
-                date_str = str(timestamp)
-        except Exception as e:
-            date_str = str(txn.get('timestamp', 'N/A'))
-        
-        txn_type_str = txn['transaction_type']
-        if isinstance(txn_type_str, str):
-            txn_type = txn_type_str.capitalize()
-        else:
-            txn_type = txn_type_str.value.capitalize()
-        
-        from_acc = str(txn.get('from_account_number') or 'N/A')
-        to_acc = str(txn.get('to_account_number') or 'N/A')
-        amount = f"${float(txn['amount']):.2f}"
-        description = str(txn.get('description') or '')
-        
-        transaction_data.append([date_str, txn_type, from_acc, to_acc, amount, description])
-    
-    if len(transaction_data) == 1:
-        transaction_data.append(['No transactions found', '', '', '', '', ''])
-    
-    txn_table = Table(transaction_data, colWidths=[1*inch, 0.8*inch, 1.2*inch, 1.2*inch, 1*inch, 1.8*inch])
-    txn_table.setStyle(TableStyle([
+    ])
+    txn_table_style = TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1a4d7a')),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
         ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
@@ -103,11 +47,123 @@ def generate_bank_statement(account, transactions):
         ('FONTSIZE', (0, 1), (-1, -1), 8),
         ('GRID', (0, 0), (-1, -1), 1, colors.grey),
         ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey])
-    ]))
-    
-    story.append(txn_table)
-    
-    # Build PDF
-    doc.build(story)
+    ])
+    return title_style, styles['Heading2'], account_table_style, txn_table_style
+
+def transaction_row(txn):
+    try:
+        timestamp = txn['timestamp']
+        if isinstance(timestamp, str):
+            # Try parsing ISO format
+            if 'Z' in timestamp:
+                dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+            elif '+' in timestamp or timestamp.count('-') > 2:
+                dt = datetime.fromisoformat(timestamp.replace('+00:00', ''))
+            else:
+                dt = datetime.fromisoformat(timestamp)
+            date_str = dt.strftime('%Y-%m-%d %H:%M')
+        elif isinstance(timestamp, datetime):
+            date_str = timestamp.strftime('%Y-%m-%d %H:%M')
+        else:
+            date_str = str(timestamp)
+    except Exception as e:
+        date_str = str(txn.get('timestamp', 'N/A'))
+
+    txn_type_str = txn['transaction_type']
+    if isinstance(txn_type_str, str):
+        txn_type = txn_type_str.capitalize()
+    else:
+        txn_type = txn_type_str.value.capitalize()
+
+    from_acc = str(txn.get('from_account_number') or 'N/A')
+    to_acc = str(txn.get('to_account_number') or 'N/A')
+    amount = f"${float(txn['amount']):.2f}"
+    description = str(txn.get('description') or '')
+
+    return [date_str, txn_type, from_acc, to_acc, amount, description]
+
+def transaction_table(rows):
+    _, _, _, txn_table_style = statement_styles()
+    txn_table = Table([TRANSACTION_HEADER] + rows, colWidths=TRANSACTION_COL_WIDTHS, repeatRows=1)
+    txn_table.setStyle(txn_table_style)
+    return txn_table
+
+def statement_story(account, transactions):
+    """Yield the statement flowables, one page-sized transaction table at a time."""
+    title_style, heading_style, account_table_style, _ = statement_styles()
+
+    # Title
+    yield Paragraph("Bank Statement", title_style)
+    yield Spacer(1, 0.3*inch)
+
+    # Account Information
+    account_info = [
+        ['Account Number:', account['account_number']],
+        ['Account Type:', account['account_type'].capitalize()],
+        ['Current Balance:', f"${account['balance']:.2f}"],
+        ['Status:', account['status'].capitalize()],
+        ['Statement Date:', account['statement_date']]
+    ]
+
+    account_table = Table(account_info, colWidths=[2*inch, 4*inch])
+    account_table.setStyle(account_table_style)
+
+    yield account_table
+    yield Spacer(1, 0.5*inch)
+
+    # Transactions Header
+    yield Paragraph("Transaction History", heading_style)
+    yield Spacer(1, 0.2*inch)
+
+    # Transactions Tables
+    rows = []
+    empty = True
+    for txn in transactions:
+        empty = False
+        rows.append(transaction_row(txn))
+        if len(rows) == ROWS_PER_TABLE:
+            yield transaction_table(rows)
+            rows = []
+
+    if empty:
+        rows.append(['No transactions found', '', '', '', '', ''])
+    if rows:
+        yield transaction_table(rows)
+
+class LazyStory(list):
+    """
+    A story list that pulls flowables from an iterator as the document
+    template consumes them, so only a few pages of flowables are alive
+    at any time.
+    """
+
+    def __init__(self, flowables, lookahead=4):
+        super().__init__()
+        self._source = iter(flowables)
+        self._lookahead = lookahead
+
+    def _fill(self):
+        while self._source is not None and super().__len__() < self._lookahead:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self):
+        self._fill()
+        return super().__len__()
+
+    def __getitem__(self, index):
+        self._fill()
+        return super().__getitem__(index)
+
+def render_bank_statement(account, transactions, output):
+    """Render a statement into a writable binary file object."""
+    doc = SimpleDocTemplate(output, pagesize=letter)
+    doc.build(LazyStory(statement_story(account, transactions)))
+    return output
+
+def generate_bank_statement(account, transactions):
+    buffer = render_bank_statement(account, transactions, BytesIO())
     buffer.seek(0)
     return buffer
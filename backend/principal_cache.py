@@ -0,0 +1,101 @@
+"""
+Cache of authenticated principals.
+
+get_current_user resolves a token subject (the user's email) to a
+Principal: a detached snapshot of the user row plus the id of their
+customer profile. Entries live for PRINCIPAL_CACHE_TTL seconds in an LRU
+of at most PRINCIPAL_CACHE_SIZE subjects, so most authenticated requests
+need no identity queries at all.
+
+Handlers that change a user's status, delete a user or log one out call
+invalidate_user() so the change applies to the very next request on the
+same worker. The cache is per process and nothing tells the other
+workers: with several uvicorn workers, a deactivated or demoted user
+keeps the access of their cached principal there until the entry
+expires. That is why the TTL defaults to a few seconds, which still
+saves the identity queries for bursts of requests from one client.
+Raise it only for single-worker deployments, or set it to 0 to disable
+the cache.
+"""
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+import os
+import time
+
+from models import UserRole
+
+CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL", "5"))
+CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+class Principal:
+    """The authenticated user as seen by request handlers."""
+    __slots__ = ("id", "name", "email", "role", "is_active", "created_at", "customer_id")
+
+    def __init__(self, id: int, name: str, email: str, role: UserRole, is_active: int,
+                 created_at: datetime, customer_id: Optional[int] = None):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.role = role
+        self.is_active = is_active
+        self.created_at = created_at
+        self.customer_id = customer_id
+
+    @classmethod
+    def from_user(cls, user, customer_id: Optional[int] = None) -> "Principal":
+        return cls(user.id, user.name, user.email, user.role, user.is_active, user.created_at, customer_id)
+
+class PrincipalCache:
+    def __init__(self, ttl_seconds: float = CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Principal]]" = OrderedDict()
+        self._by_user_id: Dict[int, str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, subject: str) -> Optional[Principal]:
+        entry = self._entries.get(subject)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._drop(subject)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(subject)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, subject: str, principal: Principal):
+        self._drop(subject)
+        if self.ttl_seconds <= 0:
+            return
+        self._entries[subject] = (time.monotonic() + self.ttl_seconds, principal)
+        self._by_user_id[principal.id] = subject
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, subject: str):
+        entry = self._entries.pop(subject, None)
+        if entry is not None and self._by_user_id.get(entry[1].id) == subject:
+            del self._by_user_id[entry[1].id]
+
+    def invalidate_user(self, user_id: int):
+        subject = self._by_user_id.get(user_id)
+        if subject is not None:
+            self._drop(subject)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_user_id.clear()
+
+    def snapshot(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+cache = PrincipalCache()
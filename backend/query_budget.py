@@ -0,0 +1,156 @@
+"""
+Query budgets and plan checks for the API endpoints.
+
+Seeds a scratch SQLite database with --accounts customers (one account
+each) and --transactions transfers spread over the last 120 days, with
+their balance snapshots, then calls each endpoint in BUDGETS through TestClient and checks that:
+
+- it issues at most its budgeted number of SQL statements (the
+  X-Query-Count header), so an N+1 query fails no matter how small the
+  seeded data is;
+- none of the statements it issued scans transactions, transactions_archive
+  or accounts: every SELECT, UPDATE and DELETE is re-run under EXPLAIN
+  QUERY PLAN.
+
+The ledger queries in query_plans.py are checked as well. Exits non-zero
+on any problem, so it can gate CI. Run it from backend/; DATABASE_URL
+is replaced by the scratch database.
+
+Usage: python query_budget.py [--accounts 2000] [--transactions 50000]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date, timedelta
+from typing import List, Tuple
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix="query-budget-")
+os.environ["DATABASE_URL"] = f"sqlite:///{SCRATCH_DIR}/budget.db"
+os.environ["DATABASE_REPLICA_URLS"] = ""
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, update
+
+from database import async_engine, engine
+from hashing import pwd_context
+from migrations import run_migrations
+from models import User
+from query_plans import check_query_plans, full_scans
+from benchmarks.common import seed_accounts, seed_transactions
+import balance_snapshots
+import init_db
+import main
+import stats
+
+PASSWORD = "budget-pw"
+TODAY = date.today()
+
+# name: (role, method, path, JSON body, maximum statements)
+BUDGETS = {
+    "me": ("customer", "GET", "/api/auth/me", None, 0),
+    "my accounts": ("customer", "GET", "/api/customer/accounts", None, 1),
+    "my transactions": ("customer", "GET", "/api/customer/transactions?limit=10", None, 2),
+    "my transactions, next page": ("customer", "GET", "/api/customer/transactions?limit=10&cursor={cursor}", None, 2),
+    "statement": ("customer", "GET", "/api/customer/statement/1", None, 5),
+    "statement, last 30 days": ("customer", "GET", f"/api/customer/statement/1?start_date={TODAY - timedelta(days=30)}&end_date={TODAY}", None, 6),
+    "my balance as of": ("customer", "GET", f"/api/customer/accounts/1/balance?as_of={TODAY - timedelta(days=10)}T12:00:00", None, 3),
+    "customer transfer": ("customer", "POST", "/api/customer/transfer", {"from_account_id": 1, "to_account_number": "000000000002", "amount": 1}, 6),
+    "staff customers": ("staff", "GET", "/api/staff/customers", None, 1),
+    "staff pending customers": ("staff", "GET", "/api/staff/customers/pending", None, 1),
+    "staff customer accounts": ("staff", "GET", "/api/staff/accounts/1", None, 1),
+    "staff balance as of": ("staff", "GET", f"/api/staff/accounts/1/balance?as_of={TODAY - timedelta(days=10)}T12:00:00", None, 2),
+    "staff deposit": ("staff", "POST", "/api/staff/deposit", {"account_id": 1, "amount": 5}, 3),
+    "staff withdraw": ("staff", "POST", "/api/staff/withdraw", {"account_id": 1, "amount": 5}, 3),
+    "admin users": ("admin", "GET", "/api/admin/users", None, 1),
+    "admin transactions": ("admin", "GET", "/api/admin/transactions?limit=50", None, 1),
+    "admin dashboard": ("admin", "GET", "/api/admin/dashboard", None, 3),
+}
+
+CREDENTIALS = {
+    # Customer 1, owner of account 1
+    "customer": ("user0@bench.example.com", PASSWORD),
+    "staff": ("staff@bank.com", "staff123"),
+    "admin": ("admin@bank.com", "admin123"),
+}
+
+EXPLAINED = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+class StatementCapture:
+    """Records the statements the app's engines execute while active."""
+    def __init__(self):
+        self.statements: List[Tuple[str, tuple]] = []
+        self.active = False
+        for db_engine in (engine, async_engine.sync_engine):
+            event.listen(db_engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active and not executemany and statement.lstrip().upper().startswith(EXPLAINED):
+            self.statements.append((statement, parameters))
+
+def seed(accounts: int, transactions: int):
+    run_migrations(engine)
+    seed_accounts(engine, accounts)
+    seed_transactions(engine, transactions, accounts)
+    with engine.begin() as conn:
+        conn.execute(update(User).where(User.id == 1).values(password_hash=pwd_context().hash(PASSWORD)))
+        # Spread the ledger over the last 120 days, oldest first
+        conn.exec_driver_sql(
+            "UPDATE transactions SET timestamp = datetime('now', '-' || "
+            f"(({transactions} - id) * 120 * 86400 / {transactions}) || ' seconds')"
+        )
+        stats.recompute(conn)
+    balance_snapshots.run(engine, since=TODAY - timedelta(days=120))
+    # The default staff and admin users, after the customers so customer 1 is user 1
+    asyncio.run(init_db.init_db())
+
+def check_endpoints(client: TestClient, capture: StatementCapture) -> List[str]:
+    problems = []
+    headers = {}
+    for role, (email, password) in CREDENTIALS.items():
+        response = client.post("/api/auth/login", json={"email": email, "password": password})
+        headers[role] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        # Warm the principal cache so budgets do not depend on call order
+        client.get("/api/auth/me", headers=headers[role])
+
+    cursor = client.get("/api/customer/transactions?limit=10", headers=headers["customer"]).json()["next_cursor"]
+    for name, (role, method, path, body, budget) in BUDGETS.items():
+        capture.statements, capture.active = [], True
+        response = client.request(method, path.format(cursor=cursor), json=body, headers=headers[role])
+        capture.active = False
+        statements = int(response.headers["X-Query-Count"])
+        print(f"{name:32} {response.status_code} {statements:3d} / {budget} statements")
+        if response.status_code >= 400:
+            problems.append(f"{name}: {response.status_code} {response.text[:200]}")
+        if statements > budget:
+            problems.append(f"{name}: {statements} SQL statements, budget is {budget}")
+        with engine.connect() as conn:
+            for statement, parameters in capture.statements:
+                plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+                for step in full_scans(plan):
+                    problems.append(f"{name}: full table scan ({step.strip()}) in {' '.join(statement.split())[:200]}")
+    return problems
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check per-endpoint SQL budgets and query plans.")
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--transactions", type=int, default=50000)
+    args = parser.parse_args()
+
+    try:
+        seed(args.accounts, args.transactions)
+        capture = StatementCapture()
+        with TestClient(main.app) as client:
+            problems = check_endpoints(client, capture)
+        with engine.connect() as conn:
+            problems += check_query_plans(conn)
+    finally:
+        engine.dispose()
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+    if problems:
+        print("\n".join(problems))
+        sys.exit(1)
+    print("✅ Every endpoint is within its query budget and uses indexes")
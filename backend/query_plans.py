@@ -0,0 +1,84 @@
+"""
+EXPLAIN QUERY PLAN checks for the ledger queries.
+
+Verifies that the per-account transaction listings and the accounts-by-
+customer lookup are served from indexes instead of scanning the
+transactions or accounts tables.
+
+Run against the configured database, which it only reads: like the API,
+it refuses to run while migrations are pending (apply them with
+init_db.py). query_budget.py runs the same checks on a scratch database.
+
+Usage: python query_plans.py
+"""
+import re
+import sys
+from typing import List
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+from database import engine
+from migrations import pending_migrations
+from models import Account, ArchivedTransaction
+from transaction_queries import keyset_after, transaction_listing
+
+FULL_SCAN = re.compile(r"^SCAN (transactions|transactions_archive|accounts)(_\d+)?$")
+
+def explain_query_plan(conn: Connection, stmt) -> List[str]:
+    """Return the SQLite query plan of a statement, one line per step."""
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.construct_params()
+    positional = tuple(params[name] for name in compiled.positiontup)
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", positional)
+    return [row[-1] for row in rows]
+
+def full_scans(plan: List[str]) -> List[str]:
+    return [step for step in plan if FULL_SCAN.match(step.strip())]
+
+LEDGER_QUERIES = {
+    "statement": (
+        transaction_listing(account_ids=[1]),
+        ["ix_transactions_from_account_timestamp", "ix_transactions_to_account_timestamp"],
+    ),
+    "customer feed page": (
+        transaction_listing(*keyset_after(100), account_ids=[1, 2], limit=51),
+        ["ix_transactions_from_account_timestamp", "ix_transactions_to_account_timestamp"],
+    ),
+    "archived statement": (
+        transaction_listing(account_ids=[1], ledger=ArchivedTransaction),
+        ["ix_transactions_archive_from_account_timestamp", "ix_transactions_archive_to_account_timestamp"],
+    ),
+    "accounts by customer": (
+        select(Account.id).where(Account.customer_id == 1),
+        ["ix_accounts_customer_id"],
+    ),
+}
+
+def check_query_plans(conn: Connection) -> List[str]:
+    """Return a list of problems; empty when every query uses its indexes."""
+    problems = []
+    for name, (stmt, expected_indexes) in LEDGER_QUERIES.items():
+        plan = explain_query_plan(conn, stmt)
+        text = "\n".join(plan)
+        for step in full_scans(plan):
+            problems.append(f"{name}: full table scan ({step.strip()})")
+        for index in expected_indexes:
+            if index not in text:
+                problems.append(f"{name}: index {index} not used")
+    return problems
+
+if __name__ == "__main__":
+    if engine.dialect.name != "sqlite":
+        sys.exit("EXPLAIN QUERY PLAN checks only run against SQLite")
+    pending = pending_migrations(engine)
+    if pending:
+        sys.exit(f"Database schema is missing migrations {', '.join(map(str, pending))}; run `python init_db.py` first")
+    with engine.connect() as conn:
+        for name, (stmt, _) in LEDGER_QUERIES.items():
+            print(f"-- {name}")
+            for step in explain_query_plan(conn, stmt):
+                print(f"   {step}")
+        problems = check_query_plans(conn)
+    if problems:
+        print("\n".join(problems))
+        sys.exit(1)
+    print("✅ All ledger queries use their indexes")
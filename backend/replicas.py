@@ -0,0 +1,179 @@
+"""
+Read replicas for the reporting endpoints.
+
+Handlers that only read and can tolerate slightly stale data (admin
+dashboard, user and transaction listings, statements) take their session
+from database.get_read_db. It picks, round robin, a replica from
+DATABASE_REPLICA_URLS whose replication lag is at most
+DATABASE_REPLICA_MAX_LAG_SECONDS, and falls back to the primary when no
+replica qualifies. Lag is measured at most every
+DATABASE_REPLICA_LAG_CHECK_INTERVAL seconds per replica:
+
+- PostgreSQL: time since the last replayed transaction, or 0 when the
+  replica has replayed everything it received;
+- MySQL: Seconds_Behind_Source from SHOW REPLICA STATUS;
+- SQLite: for local testing, a SQLite replica of a SQLite primary is a
+  second file that this process refreshes every
+  DATABASE_REPLICA_SYNC_INTERVAL seconds with the SQLite backup API; its
+  lag is the age of the last completed copy.
+
+A replica whose lag cannot be measured (stopped replication, unreachable
+server, SQLite file not copied yet) is skipped.
+"""
+from contextlib import asynccontextmanager
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from typing import AsyncIterator, List, Optional
+import asyncio
+import sqlite3
+import time
+
+from database import AsyncSessionLocal, async_database_url, count_statements, create_async_db_engine
+from settings import DatabaseSettings, settings
+
+POSTGRES_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+def sqlite_path(url: str) -> Optional[str]:
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite" or parsed.database in (None, "", ":memory:"):
+        return None
+    return parsed.database
+
+def sqlite_backup(source_path: str, target_path: str):
+    """Copy the whole source database into target in one step."""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+class Replica:
+    def __init__(self, url: str, primary_url: str):
+        self.url = url
+        self.engine = create_async_db_engine(url=async_database_url(url))
+        count_statements(self.engine.sync_engine)
+        self.sessions = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+        # Set when this replica is a file copy of a SQLite primary
+        self.copy_from = sqlite_path(primary_url) if sqlite_path(url) else None
+        self.synced_at: Optional[float] = None
+        self.lag_seconds: Optional[float] = None
+        self.checked_at = 0.0
+        self.lag_errors = 0
+        self.sync_errors = 0
+        self.reads = 0
+
+    @property
+    def name(self) -> str:
+        return make_url(self.url).render_as_string(hide_password=True)
+
+    def sync(self):
+        """Refresh a SQLite file replica. Runs in a worker thread."""
+        started = time.time()
+        sqlite_backup(self.copy_from, sqlite_path(self.url))
+        self.synced_at = started
+
+    async def measure_lag(self) -> Optional[float]:
+        if self.copy_from is not None:
+            return None if self.synced_at is None else time.time() - self.synced_at
+        dialect = self.engine.dialect.name
+        async with self.engine.connect() as conn:
+            if dialect == "postgresql":
+                return float(await conn.scalar(POSTGRES_LAG))
+            if dialect == "mysql":
+                status = (await conn.execute(text("SHOW REPLICA STATUS"))).mappings().first()
+                if status is None:
+                    return 0.0  # not replicating, so it is a primary
+                lag = status.get("Seconds_Behind_Source")
+                return None if lag is None else float(lag)
+        return 0.0
+
+    async def refresh_lag(self, interval: float):
+        if time.monotonic() - self.checked_at < interval:
+            return
+        self.checked_at = time.monotonic()
+        try:
+            self.lag_seconds = await self.measure_lag()
+        except Exception:
+            self.lag_errors += 1
+            self.lag_seconds = None
+
+    def snapshot(self) -> dict:
+        return {
+            "url": self.name,
+            "lag_seconds": self.lag_seconds,
+            "reads": self.reads,
+            "lag_errors": self.lag_errors,
+            "sync_errors": self.sync_errors,
+        }
+
+class ReplicaRouter:
+    def __init__(self, config: DatabaseSettings = settings):
+        self.config = config
+        self.replicas: List[Replica] = [Replica(url, config.url) for url in config.replica_url_list]
+        self._next = 0
+        self._sync_task: Optional[asyncio.Task] = None
+        self.primary_reads = 0
+
+    async def pick(self) -> Optional[Replica]:
+        """Next replica within the lag bound, or None for the primary."""
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next % len(self.replicas)]
+            self._next += 1
+            await replica.refresh_lag(self.config.replica_lag_check_interval)
+            if replica.lag_seconds is not None and replica.lag_seconds <= self.config.replica_max_lag_seconds:
+                return replica
+        return None
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        replica = await self.pick() if self.replicas else None
+        if replica is None:
+            self.primary_reads += 1
+            async with AsyncSessionLocal() as db:
+                yield db
+            return
+        replica.reads += 1
+        async with replica.sessions() as db:
+            db.info["database_url"] = replica.url
+            yield db
+
+    async def _sync_loop(self, replicas: List[Replica]):
+        while True:
+            for replica in replicas:
+                try:
+                    await asyncio.to_thread(replica.sync)
+                except Exception:
+                    replica.sync_errors += 1
+            await asyncio.sleep(self.config.replica_sync_interval)
+
+    def start(self):
+        """Start refreshing SQLite file replicas, if any."""
+        file_replicas = [replica for replica in self.replicas if replica.copy_from is not None]
+        if file_replicas and self._sync_task is None:
+            self._sync_task = asyncio.get_running_loop().create_task(self._sync_loop(file_replicas), name="replica-sync")
+
+    async def stop(self):
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def snapshot(self) -> dict:
+        return {
+            "max_lag_seconds": self.config.replica_max_lag_seconds,
+            "primary_reads": self.primary_reads,
+            "replicas": [replica.snapshot() for replica in self.replicas],
+        }
+
+router = ReplicaRouter()
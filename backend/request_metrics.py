@@ -0,0 +1,162 @@
+"""
+Per-endpoint request metrics in the Prometheus text format.
+
+MetricsMiddleware wraps the whole app as a plain ASGI middleware. For each
+request it records, keyed by method and route template (the path with
+{placeholders}, so /api/customer/statement/7 and /8 share a series):
+
+- a latency histogram (banking_http_request_duration_seconds),
+- responses by status code (banking_http_requests_total),
+- SQL statements issued and seconds spent executing them, counted by the
+  engine events in database.py (banking_http_db_statements_total,
+  banking_http_db_seconds_total),
+
+plus the number of requests in flight. It also sets the X-Query-Count
+response header. Recording is a few dict lookups and additions on
+preallocated series, with no locking: everything runs on the event loop.
+
+Requests that match no route (404s, CORS preflights) are recorded under
+route="unmatched". main.py serves render() at /api/admin/metrics along
+with the snapshots of the hashing pool, caches, renderer, replicas,
+idempotency store and ledger writer.
+"""
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+import time
+
+from database import QueryCounter, query_counter
+
+CONTENT_TYPE = "text/plain; version=0.0.4"  # Response appends the charset
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED = "unmatched"
+PREFIX = "banking_"
+
+class RouteSeries:
+    __slots__ = ("buckets", "count", "seconds", "statements", "db_seconds", "statuses")
+
+    def __init__(self):
+        # Per-bucket (not cumulative) counts; the last slot is +Inf
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.statuses: Dict[int, int] = {}
+
+class RequestMetrics:
+    def __init__(self):
+        self.series: Dict[Tuple[str, str], RouteSeries] = {}
+        self.in_flight = 0
+
+    def observe(self, method: str, route: str, status_code: int, seconds: float, counter: QueryCounter):
+        series = self.series.get((method, route))
+        if series is None:
+            series = self.series[(method, route)] = RouteSeries()
+        series.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        series.count += 1
+        series.seconds += seconds
+        series.statements += counter.statements
+        series.db_seconds += counter.db_seconds
+        series.statuses[status_code] = series.statuses.get(status_code, 0) + 1
+
+    def lines(self) -> Iterable[str]:
+        name = PREFIX + "http_requests_in_flight"
+        yield f"# HELP {name} Requests being handled."
+        yield f"# TYPE {name} gauge"
+        yield f"{name} {self.in_flight}"
+
+        series = sorted(self.series.items())
+        name = PREFIX + "http_requests_total"
+        yield f"# HELP {name} Responses by route and status code."
+        yield f"# TYPE {name} counter"
+        for (method, route), s in series:
+            for status_code, count in sorted(s.statuses.items()):
+                yield f"{name}{labels(method=method, route=route, status=str(status_code))} {count}"
+
+        name = PREFIX + "http_request_duration_seconds"
+        yield f"# HELP {name} Request latency by route."
+        yield f"# TYPE {name} histogram"
+        for (method, route), s in series:
+            cumulative = 0
+            for bound, count in zip((*map(str, LATENCY_BUCKETS), "+Inf"), s.buckets):
+                cumulative += count
+                yield f"{name}_bucket{labels(method=method, route=route, le=bound)} {cumulative}"
+            yield f"{name}_sum{labels(method=method, route=route)} {s.seconds!r}"
+            yield f"{name}_count{labels(method=method, route=route)} {s.count}"
+
+        for suffix, attribute, help_text in (
+            ("http_db_statements_total", "statements", "SQL statements issued by requests, by route."),
+            ("http_db_seconds_total", "db_seconds", "Seconds spent executing SQL for requests, by route."),
+        ):
+            name = PREFIX + suffix
+            yield f"# HELP {name} {help_text}"
+            yield f"# TYPE {name} counter"
+            for (method, route), s in series:
+                yield f"{name}{labels(method=method, route=route)} {getattr(s, attribute)!r}"
+
+metrics = RequestMetrics()
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        counter = QueryCounter(scope)
+        token = query_counter.set(counter)
+        status_code = 500
+
+        async def send_with_count(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                # Lets listing endpoints be checked for a constant query count
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", ()), (b"x-query-count", str(counter.statements).encode())]
+            await send(message)
+
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.in_flight -= 1
+            query_counter.reset(token)
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            metrics.observe(scope["method"], route.path if route is not None else UNMATCHED, status_code, elapsed, counter)
+
+# ================= EXPOSITION =================
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def labels(**values: str) -> str:
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in values.items()) + "}"
+
+def snapshot_lines(component: str, snapshot: dict, extra: Optional[Dict[str, str]] = None) -> Iterable[str]:
+    """
+    Numeric values of a component's snapshot() as untyped samples,
+    banking_<component>_<key>. Nested dicts extend the name; lists of dicts
+    (e.g. replicas) become one labelled sample per item.
+    """
+    for key, value in snapshot.items():
+        name = f"{component}_{key}"
+        if isinstance(value, dict):
+            yield from snapshot_lines(name, value, extra)
+        elif isinstance(value, list):
+            for index, item in enumerate(value):
+                if isinstance(item, dict):
+                    label = str(item.get("url", item.get("name", index)))
+                    yield from snapshot_lines(name, item, {**(extra or {}), "item": label})
+        elif isinstance(value, (bool, int, float)):
+            yield f"{PREFIX}{name}{labels(**extra) if extra else ''} {float(value)!r}"
+
+def render(components: Dict[str, dict]) -> str:
+    lines: List[str] = list(metrics.lines())
+    for component, snapshot in components.items():
+        lines.extend(snapshot_lines(component, snapshot))
+    return "\n".join(lines) + "\n"
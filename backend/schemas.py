@@ -1,7 +1,11 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, model_validator
 from typing import Optional, List
 from datetime import datetime
 from models import UserRole, AccountType, AccountStatus, TransactionType
+import enum
+import os
+
+BATCH_TRANSFER_MAX_ITEMS = int(os.getenv("BATCH_TRANSFER_MAX_ITEMS", "10000"))
 
 # Auth Schemas
 class Token(BaseModel):
@@ -99,12 +103,34 @@ class TransactionResponse(TransactionBase):
     class Config:
         from_attributes = True
 
+class TransactionPage(BaseModel):
+    items: List[TransactionResponse]
+    next_cursor: Optional[str] = None
+
+class BalanceAsOfResponse(BaseModel):
+    account_id: int
+    as_of: datetime
+    balance: float
+
 # Staff Operations
 class CreateCustomerRequest(UserBase, CustomerBase):
     password: str
     account_type: AccountType = AccountType.SAVINGS
     initial_balance: float = 0.0
 
+class ImportCustomerRow(UserBase, CustomerBase):
+    # Either a plain password or an existing bcrypt hash from the source system
+    password: Optional[str] = None
+    password_hash: Optional[str] = None
+    account_type: AccountType = AccountType.SAVINGS
+    initial_balance: float = Field(0.0, ge=0)
+
+    @model_validator(mode="after")
+    def check_password(self):
+        if not self.password and not self.password_hash:
+            raise ValueError("password or password_hash is required")
+        return self
+
 class DepositWithdrawRequest(BaseModel):
     account_id: int
     amount: float
@@ -116,6 +142,27 @@ class TransferRequest(BaseModel):
     amount: float
     description: Optional[str] = None
 
+class BatchMode(str, enum.Enum):
+    ALL_OR_NOTHING = "all_or_nothing"
+    BEST_EFFORT = "best_effort"
+
+class BatchTransferRequest(BaseModel):
+    mode: BatchMode = BatchMode.ALL_OR_NOTHING
+    transfers: List[TransferRequest] = Field(..., min_length=1, max_length=BATCH_TRANSFER_MAX_ITEMS)
+
+class BatchTransferResult(BaseModel):
+    index: int
+    success: bool
+    transaction_id: Optional[int] = None
+    error: Optional[str] = None
+
+class BatchTransferResponse(BaseModel):
+    mode: BatchMode
+    committed: bool
+    succeeded: int
+    failed: int
+    results: List[BatchTransferResult]
+
 # Admin Operations
 class CreateStaffRequest(BaseModel):
     name: str
@@ -1,35 +1,47 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 from fastapi import HTTPException, status
-from models import User, Customer, Account, Transaction, UserRole, TransactionType, AccountStatus
-from schemas import CreateCustomerRequest, DepositWithdrawRequest, TransferRequest
+from models import User, Customer, Account, Transaction, UserRole, TransactionType, AccountStatus, BalanceSnapshot
+from schemas import (
+    CreateCustomerRequest, DepositWithdrawRequest, TransferRequest,
+    BatchMode, BatchTransferRequest, BatchTransferResponse, BatchTransferResult
+)
 from auth import get_password_hash
-import random
-import string
+from account_numbers import next_account_number
+from balance_snapshots import day_start, net_change
+import ledger_writer
+import stats
+from statement_cache import cache as statement_cache
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
 
-def generate_account_number() -> str:
-    return ''.join(random.choices(string.digits, k=12))
+# Accounts locked or looked up per statement when applying a batch
+LOCK_CHUNK_SIZE = 500
 
-def create_customer_with_account(db: Session, customer_data: CreateCustomerRequest, created_by_user_id: int = None):
+async def create_customer_with_account(db: AsyncSession, customer_data: CreateCustomerRequest, created_by_user_id: int = None):
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == customer_data.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == customer_data.email))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User with this email already exists"
         )
     
+    # Reserve the account number before this transaction starts writing
+    account_number = await next_account_number()
+    
     # Create user
     db_user = User(
         name=customer_data.name,
         email=customer_data.email,
-        password_hash=get_password_hash(customer_data.password),
+        password_hash=await get_password_hash(customer_data.password),
         role=UserRole.CUSTOMER,
         is_active=1,
         created_by_id=created_by_user_id
     )
     db.add(db_user)
-    db.flush()
+    await db.flush()
     
     # Create customer
     db_customer = Customer(
@@ -38,14 +50,9 @@ def create_customer_with_account(db: Session, customer_data: CreateCustomerReque
         address=customer_data.address
     )
     db.add(db_customer)
-    db.flush()
+    await db.flush()
     
     # Create account
-    account_number = generate_account_number()
-    # Ensure account number is unique
-    while db.query(Account).filter(Account.account_number == account_number).first():
-        account_number = generate_account_number()
-    
     db_account = Account(
         customer_id=db_customer.id,
         account_number=account_number,
@@ -59,185 +66,377 @@ def create_customer_with_account(db: Session, customer_data: CreateCustomerReque
     if customer_data.initial_balance > 0:
         db_transaction = Transaction(
             from_account_id=None,
-            to_account_id=db_account.id,
+            to_account=db_account,
             amount=customer_data.initial_balance,
             transaction_type=TransactionType.DEPOSIT,
             description="Initial deposit"
         )
         db.add(db_transaction)
     
-    db.commit()
-    db.refresh(db_user)
-    db.refresh(db_customer)
-    db.refresh(db_account)
+    await stats.user_created(db, UserRole.CUSTOMER)
+    await stats.bump(
+        db,
+        total_accounts=1,
+        total_balance=customer_data.initial_balance,
+        total_transactions=1 if customer_data.initial_balance > 0 else 0,
+    )
+    await db.commit()
+    await db.refresh(db_user)
+    await db.refresh(db_customer)
+    await db.refresh(db_account)
     
     return db_user, db_customer, db_account
 
-def deposit_money(db: Session, deposit_data: DepositWithdrawRequest):
-    account = db.query(Account).filter(Account.id == deposit_data.account_id).first()
+def supports_update_returning(db: AsyncSession) -> bool:
+    return db.get_bind().dialect.update_returning
+
+def balance_update(account_id: int, delta: float):
+    """
+    UPDATE adding delta to an active account's balance; a debit only
+    matches if it leaves the balance non-negative.
+    """
+    stmt = (
+        update(Account)
+        .where(Account.id == account_id, Account.status == AccountStatus.ACTIVE)
+        .values(balance=Account.balance + delta)
+        .execution_options(synchronize_session=False)
+    )
+    if delta < 0:
+        stmt = stmt.where(Account.balance >= -delta)
+    return stmt
+
+async def change_balance(db: AsyncSession, account_id: int, delta: float) -> Optional[Account]:
+    """
+    Apply balance_update() in one conditional UPDATE. Returns the updated
+    account, or None when no row matched the conditions.
+    """
+    stmt = balance_update(account_id, delta)
+    if supports_update_returning(db):
+        row = (await db.execute(stmt.returning(Account, Account.balance))).first()
+        if row is None:
+            return None
+        # populate_existing is not applied to UPDATE ... RETURNING, so an
+        # Account the session already holds (e.g. loaded for an ownership
+        # check) would keep its old balance; set the returned one on it
+        account, balance = row
+        set_committed_value(account, "balance", float(balance))
+        return account
+    # No RETURNING (MySQL): read the row back; our UPDATE still holds its lock
+    if (await db.execute(stmt)).rowcount == 0:
+        return None
+    return await db.get(Account, account_id, populate_existing=True)
+
+async def balance_change_error(db: AsyncSession, account_id: int, label: str = "Account") -> HTTPException:
+    """Explain why change_balance matched no row."""
+    account = await db.get(Account, account_id, populate_existing=True)
     if not account:
-        raise HTTPException(
+        return HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Account not found"
+            detail=f"{label} not found"
         )
-    
     if account.status != AccountStatus.ACTIVE:
-        raise HTTPException(
+        return HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Account is not active"
+            detail=f"{label} is not active"
         )
-    
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Insufficient balance"
+    )
+
+# ==================== LEDGER MUTATIONS ====================
+# apply_* functions validate and write one mutation without committing;
+# the result's last element is always the new Transaction. The public
+# wrappers commit it themselves, or hand it to the group-commit ledger
+# writer when that is enabled.
+
+async def apply_deposit(db: AsyncSession, deposit_data: DepositWithdrawRequest):
     if deposit_data.amount <= 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Amount must be greater than 0"
         )
     
-    try:
-        # Update balance
-        account.balance += deposit_data.amount
-        
-        # Create transaction record
-        db_transaction = Transaction(
-            from_account_id=None,
-            to_account_id=account.id,
-            amount=deposit_data.amount,
-            transaction_type=TransactionType.DEPOSIT,
-            description=deposit_data.description or "Deposit"
-        )
-        db.add(db_transaction)
-        db.commit()
-        db.refresh(account)
-        db.refresh(db_transaction)
-        
-        return account, db_transaction
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Transaction failed: {str(e)}"
-        )
-
-def withdraw_money(db: Session, withdraw_data: DepositWithdrawRequest):
-    account = db.query(Account).filter(Account.id == withdraw_data.account_id).first()
+    account = await change_balance(db, deposit_data.account_id, deposit_data.amount)
     if not account:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Account not found"
-        )
-    
-    if account.status != AccountStatus.ACTIVE:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Account is not active"
-        )
+        raise await balance_change_error(db, deposit_data.account_id)
     
+    # Create transaction record
+    db_transaction = Transaction(
+        from_account_id=None,
+        to_account_id=account.id,
+        amount=deposit_data.amount,
+        transaction_type=TransactionType.DEPOSIT,
+        description=deposit_data.description or "Deposit"
+    )
+    db.add(db_transaction)
+    await stats.bump(db, total_balance=deposit_data.amount, total_transactions=1)
+    await db.flush()
+    return account, db_transaction
+
+async def apply_withdraw(db: AsyncSession, withdraw_data: DepositWithdrawRequest):
     if withdraw_data.amount <= 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Amount must be greater than 0"
         )
     
-    if account.balance < withdraw_data.amount:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Insufficient balance"
-        )
+    # Balance check and debit in one statement, so concurrent withdrawals
+    # can neither overdraw the account nor overwrite each other
+    account = await change_balance(db, withdraw_data.account_id, -withdraw_data.amount)
+    if not account:
+        raise await balance_change_error(db, withdraw_data.account_id)
     
-    try:
-        # Update balance
-        account.balance -= withdraw_data.amount
-        
-        # Create transaction record
-        db_transaction = Transaction(
-            from_account_id=account.id,
-            to_account_id=None,
-            amount=withdraw_data.amount,
-            transaction_type=TransactionType.WITHDRAW,
-            description=withdraw_data.description or "Withdrawal"
-        )
-        db.add(db_transaction)
-        db.commit()
-        db.refresh(account)
-        db.refresh(db_transaction)
-        
-        return account, db_transaction
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Transaction failed: {str(e)}"
-        )
+    # Create transaction record
+    db_transaction = Transaction(
+        from_account_id=account.id,
+        to_account_id=None,
+        amount=withdraw_data.amount,
+        transaction_type=TransactionType.WITHDRAW,
+        description=withdraw_data.description or "Withdrawal"
+    )
+    db.add(db_transaction)
+    await stats.bump(db, total_balance=-withdraw_data.amount, total_transactions=1)
+    await db.flush()
+    return account, db_transaction
 
-def transfer_money(db: Session, transfer_data: TransferRequest):
-    from_account = db.query(Account).filter(Account.id == transfer_data.from_account_id).first()
-    to_account = db.query(Account).filter(Account.account_number == transfer_data.to_account_number).first()
-    
-    if not from_account:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Source account not found"
-        )
+async def apply_transfer(db: AsyncSession, transfer_data: TransferRequest):
+    to_account_id = await db.scalar(select(Account.id).where(Account.account_number == transfer_data.to_account_number))
     
-    if not to_account:
+    if not to_account_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Destination account not found"
         )
     
-    if from_account.id == to_account.id:
+    if transfer_data.from_account_id == to_account_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cannot transfer to the same account"
         )
     
-    if from_account.status != AccountStatus.ACTIVE:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Source account is not active"
-        )
-    
-    if to_account.status != AccountStatus.ACTIVE:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Destination account is not active"
-        )
-    
     if transfer_data.amount <= 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Amount must be greater than 0"
         )
     
-    if from_account.balance < transfer_data.amount:
+    # Debit and credit as conditional updates, lower account id first so
+    # opposing transfers take their row locks in the same order
+    changes = sorted([
+        (transfer_data.from_account_id, -transfer_data.amount, "Source account"),
+        (to_account_id, transfer_data.amount, "Destination account"),
+    ])
+    updated = {}
+    for account_id, delta, label in changes:
+        account = await change_balance(db, account_id, delta)
+        if not account:
+            raise await balance_change_error(db, account_id, label)
+        updated[account_id] = account
+    from_account = updated[transfer_data.from_account_id]
+    to_account = updated[to_account_id]
+    
+    # Create transaction record
+    db_transaction = Transaction(
+        from_account_id=from_account.id,
+        to_account_id=to_account.id,
+        amount=transfer_data.amount,
+        transaction_type=TransactionType.TRANSFER,
+        description=transfer_data.description or f"Transfer to {to_account.account_number}"
+    )
+    db.add(db_transaction)
+    await stats.bump(db, total_transactions=1)
+    await db.flush()
+    return from_account, to_account, db_transaction
+
+def mutation_committed(db_transaction: Transaction):
+    for account_id in (db_transaction.from_account_id, db_transaction.to_account_id):
+        if account_id is not None:
+            statement_cache.invalidate_account(account_id)
+
+async def commit_mutation(db: AsyncSession, apply, data, failure: str):
+    if ledger_writer.writer is not None:
+        result = await ledger_writer.writer.submit(apply, data, failure)
+    else:
+        try:
+            result = await apply(db, data)
+            await db.commit()
+        except HTTPException:
+            await db.rollback()
+            raise
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"{failure}: {str(e)}"
+            )
+    mutation_committed(result[-1])
+    return result
+
+async def deposit_money(db: AsyncSession, deposit_data: DepositWithdrawRequest):
+    return await commit_mutation(db, apply_deposit, deposit_data, "Transaction failed")
+
+async def withdraw_money(db: AsyncSession, withdraw_data: DepositWithdrawRequest):
+    return await commit_mutation(db, apply_withdraw, withdraw_data, "Transaction failed")
+
+async def transfer_money(db: AsyncSession, transfer_data: TransferRequest):
+    return await commit_mutation(db, apply_transfer, transfer_data, "Transfer failed")
+
+# ==================== BALANCE HISTORY ====================
+
+async def balance_as_of(db: AsyncSession, account_id: int, as_of: datetime) -> float:
+    """Balance of an account after every transaction before as_of."""
+    if as_of.tzinfo is not None:
+        as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+    # Nearest snapshot before as_of's day, then replay forwards from the
+    # end of its day (just as_of's day once the snapshot job is current)
+    before = (await db.execute(
+        select(BalanceSnapshot.day, BalanceSnapshot.balance)
+        .where(BalanceSnapshot.account_id == account_id, BalanceSnapshot.day < as_of.date())
+        .order_by(BalanceSnapshot.day.desc())
+        .limit(1)
+    )).first()
+    if before is not None:
+        start = day_start(before.day + timedelta(days=1))
+        return before.balance + await db.scalar(net_change(account_id, start, as_of))
+    # Otherwise replay backwards from the next snapshot, or the live balance
+    after = (await db.execute(
+        select(BalanceSnapshot.day, BalanceSnapshot.balance)
+        .where(BalanceSnapshot.account_id == account_id, BalanceSnapshot.day >= as_of.date())
+        .order_by(BalanceSnapshot.day)
+        .limit(1)
+    )).first()
+    if after is not None:
+        end = day_start(after.day + timedelta(days=1))
+        return after.balance - await db.scalar(net_change(account_id, as_of, end))
+    balance = await db.scalar(
+        select(Account.balance - net_change(account_id, as_of).scalar_subquery()).where(Account.id == account_id)
+    )
+    if balance is None:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Insufficient balance"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Account not found"
         )
-    
+    return balance
+
+# ==================== BATCH TRANSFERS ====================
+
+async def lock_accounts(db: AsyncSession, account_ids: Iterable[int]):
+    """
+    Lock accounts in ascending id order, so two batches touching the same
+    accounts always acquire their row locks in the same order and cannot
+    deadlock. SQLite has no row locks (it serializes writers instead), so
+    this is skipped there; the balance checks never depend on it.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        return
+    ordered = sorted(set(account_ids))
+    for start in range(0, len(ordered), LOCK_CHUNK_SIZE):
+        chunk = ordered[start:start + LOCK_CHUNK_SIZE]
+        await db.execute(select(Account.id).where(Account.id.in_(chunk)).order_by(Account.id).with_for_update())
+
+async def apply_batch_item(db: AsyncSession, from_account_id: int, to_account_id: Optional[int],
+                           amount: float) -> Optional[str]:
+    """
+    Move one batch item's money with the conditional balance_update()
+    UPDATEs, lower account id first as in apply_transfer. Returns why it
+    could not be applied, or None. A failed item leaves no change behind:
+    if the second update fails, the first one is reversed.
+    """
+    if to_account_id is None:
+        return "Destination account not found"
+    if from_account_id == to_account_id:
+        return "Cannot transfer to the same account"
+    if amount <= 0:
+        return "Amount must be greater than 0"
+    changes = sorted([
+        (from_account_id, -amount, "Source account"),
+        (to_account_id, amount, "Destination account"),
+    ])
+    applied = []
+    for account_id, delta, label in changes:
+        # Only the match count is needed, so skip RETURNING and loading the row
+        if (await db.execute(balance_update(account_id, delta))).rowcount == 0:
+            error = (await balance_change_error(db, account_id, label)).detail
+            for applied_id, applied_delta in applied:
+                # Undoing our own change on a row this transaction holds; a
+                # credit is undone by a debit the balance can always cover
+                if (await db.execute(balance_update(applied_id, -applied_delta))).rowcount == 0:
+                    raise RuntimeError(f"Could not reverse the change to account {applied_id}")
+            return error
+        applied.append((account_id, delta))
+    return None
+
+async def transfer_batch(db: AsyncSession, batch: BatchTransferRequest) -> BatchTransferResponse:
+    """
+    Validate and apply many transfers in one database transaction.
+
+    Each item is applied in order with the same conditional UPDATEs as a
+    single transfer, so a later item sees the debits of earlier ones and
+    concurrent transfers can neither overdraw an account nor be
+    overwritten. In all-or-nothing mode any failure rolls the whole batch
+    back; in best-effort mode the valid items are committed and the
+    failures reported.
+    """
+    numbers = sorted({item.to_account_number for item in batch.transfers})
+    ids_by_number = {}
+    for start in range(0, len(numbers), LOCK_CHUNK_SIZE):
+        ids_by_number.update((await db.execute(
+            select(Account.account_number, Account.id)
+            .where(Account.account_number.in_(numbers[start:start + LOCK_CHUNK_SIZE]))
+        )).all())
+
+    results: List[BatchTransferResult] = []
+    applied = []
     try:
-        # Atomic transaction: debit and credit
-        from_account.balance -= transfer_data.amount
-        to_account.balance += transfer_data.amount
-        
-        # Create transaction record
-        db_transaction = Transaction(
-            from_account_id=from_account.id,
-            to_account_id=to_account.id,
-            amount=transfer_data.amount,
-            transaction_type=TransactionType.TRANSFER,
-            description=transfer_data.description or f"Transfer to {to_account.account_number}"
+        await lock_accounts(db, [item.from_account_id for item in batch.transfers] + list(ids_by_number.values()))
+        for index, item in enumerate(batch.transfers):
+            to_account_id = ids_by_number.get(item.to_account_number)
+            error = await apply_batch_item(db, item.from_account_id, to_account_id, item.amount)
+            if error:
+                results.append(BatchTransferResult(index=index, success=False, error=error))
+                continue
+            db_transaction = Transaction(
+                from_account_id=item.from_account_id,
+                to_account_id=to_account_id,
+                amount=item.amount,
+                transaction_type=TransactionType.TRANSFER,
+                description=item.description or f"Transfer to {item.to_account_number}"
+            )
+            applied.append((index, db_transaction))
+            results.append(BatchTransferResult(index=index, success=True))
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Batch transfer failed: {str(e)}"
         )
-        db.add(db_transaction)
-        db.commit()
-        db.refresh(from_account)
-        db.refresh(to_account)
-        db.refresh(db_transaction)
-        
-        return from_account, to_account, db_transaction
+
+    failed = len(results) - len(applied)
+    committed = bool(applied) and (failed == 0 or batch.mode == BatchMode.BEST_EFFORT)
+    if not committed:
+        await db.rollback()
+        for index, _ in applied:
+            results[index].success = False
+            results[index].error = "Not applied: batch rolled back"
+        return BatchTransferResponse(mode=batch.mode, committed=False, succeeded=0,
+                                     failed=len(results), results=results)
+
+    try:
+        db.add_all(db_transaction for _, db_transaction in applied)
+        await stats.bump(db, total_transactions=len(applied))
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Transfer failed: {str(e)}"
+            detail=f"Batch transfer failed: {str(e)}"
         )
+    touched = set()
+    for index, db_transaction in applied:
+        results[index].transaction_id = db_transaction.id
+        touched.update((db_transaction.from_account_id, db_transaction.to_account_id))
+    for account_id in touched:
+        statement_cache.invalidate_account(account_id)
+    return BatchTransferResponse(mode=batch.mode, committed=True, succeeded=len(applied),
+                                 failed=failed, results=results)
@@ -0,0 +1,98 @@
+"""
+Database settings.
+
+Read from DATABASE_* environment variables (or .env). DATABASE_URL picks
+the profile:
+
+- sqlite:///... : every connection is tuned with PRAGMAs: WAL journal,
+  synchronous=NORMAL (durable across application crashes; an OS crash can
+  lose the last commits but never corrupts the file), a memory map and a
+  page cache, and a busy timeout so writers wait for the lock instead of
+  failing with "database is locked".
+- mysql+pymysql://... or postgresql://... (psycopg2, with asyncpg for
+  the request handlers): a QueuePool of
+  DATABASE_POOL_SIZE connections plus DATABASE_MAX_OVERFLOW burst
+  connections, recycled after DATABASE_POOL_RECYCLE seconds.
+
+DATABASE_REPLICA_URLS lists read replicas for the reporting endpoints;
+see replicas.py.
+
+The request handlers use the async driver for the same database (see
+database.async_database_url).
+"""
+from typing import List
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from sqlalchemy.engine import make_url
+
+class DatabaseSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="DATABASE_", env_file=".env", extra="ignore")
+
+    url: str = "sqlite:///./banking.db"
+    echo: bool = False
+
+    # Connection pool (both profiles; SQLite in-memory databases use a single connection)
+    pool_size: int = 10
+    max_overflow: int = 20
+    pool_timeout: float = 30
+    pool_recycle: int = 300
+    pool_pre_ping: bool = True
+
+    # SQLite PRAGMAs, applied to every new connection
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64 * 1024  # negative means KiB, so 64 MiB
+    sqlite_busy_timeout_ms: int = 5000
+
+    # Read replicas for get_read_db, comma-separated URLs. A SQLite replica
+    # of a SQLite primary is a local file refreshed with the backup API.
+    replica_urls: str = ""
+    replica_max_lag_seconds: float = 5
+    replica_lag_check_interval: float = 1
+    replica_sync_interval: float = 2
+
+    @property
+    def is_sqlite(self) -> bool:
+        return make_url(self.url).get_backend_name() == "sqlite"
+
+    @property
+    def is_sqlite_memory(self) -> bool:
+        return self.is_sqlite and make_url(self.url).database in (None, "", ":memory:")
+
+    @property
+    def replica_url_list(self) -> List[str]:
+        return [url.strip() for url in self.replica_urls.split(",") if url.strip()]
+
+    def sqlite_pragmas(self) -> dict:
+        return {
+            "journal_mode": self.sqlite_journal_mode,
+            "synchronous": self.sqlite_synchronous,
+            "mmap_size": self.sqlite_mmap_size,
+            "cache_size": self.sqlite_cache_size,
+            "busy_timeout": self.sqlite_busy_timeout_ms,
+        }
+
+    def report(self) -> dict:
+        """Configured settings with the password masked."""
+        report = {
+            "url": make_url(self.url).render_as_string(hide_password=True),
+            "echo": self.echo,
+        }
+        if self.is_sqlite:
+            report["pragmas"] = self.sqlite_pragmas()
+        if not self.is_sqlite_memory:
+            report["pool"] = {
+                "size": self.pool_size,
+                "max_overflow": self.max_overflow,
+                "timeout": self.pool_timeout,
+                "recycle": self.pool_recycle,
+                "pre_ping": self.pool_pre_ping,
+            }
+        if self.replica_url_list:
+            report["replicas"] = {
+                "urls": [make_url(url).render_as_string(hide_password=True) for url in self.replica_url_list],
+                "max_lag_seconds": self.replica_max_lag_seconds,
+            }
+        return report
+
+settings = DatabaseSettings()
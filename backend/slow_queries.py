@@ -0,0 +1,110 @@
+"""
+Slow-query log.
+
+Every engine hooked by database.count_statements times its statements.
+One that runs for at least SLOW_QUERY_MS is recorded with:
+
+- its SQL and the shape of its bound parameters (types only; values can
+  be emails, password hashes or amounts and are not kept),
+- its duration and the database it ran on,
+- the route of the request that issued it (None for startup, migrations,
+  the ledger writer and other background work),
+- its plan (EXPLAIN QUERY PLAN on SQLite, EXPLAIN elsewhere), captured
+  right away on the same connection so it is the plan that was used.
+
+The SLOW_QUERY_LOG_SIZE most recent entries are kept in memory per
+process and served at /api/admin/slow-queries. Statement render workers
+run in their own processes, so their queries are not in this log.
+SLOW_QUERY_EXPLAIN=0 turns plan capture off.
+"""
+from collections import deque
+from datetime import datetime
+from typing import Any, Optional
+import os
+import threading
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
+EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1") == "1"
+
+# Statements whose plan can be explained without side effects
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+def parameter_shape(parameters: Any) -> Any:
+    """Types of the bound parameters, in the structure they were passed."""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+def request_route(scope: Optional[dict]) -> Optional[str]:
+    if scope is None:
+        return None
+    route = scope.get("route")
+    return f"{scope['method']} {route.path if route is not None else scope['path']}"
+
+def explain(conn, statement: str, parameters: Any) -> list:
+    """The statement's plan, read through a separate DBAPI cursor so no events fire."""
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [" | ".join(str(column) for column in row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, size: int = LOG_SIZE, capture_plans: bool = EXPLAIN):
+        self.threshold = threshold_ms / 1000
+        self.capture_plans = capture_plans
+        # Appended to from worker threads too
+        self.entries: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.explain_errors = 0
+
+    def record(self, conn, statement: str, parameters: Any, executemany: bool, seconds: float,
+               scope: Optional[dict] = None):
+        plan = None
+        if self.capture_plans and not executemany and statement.lstrip().upper().startswith(EXPLAINABLE):
+            try:
+                plan = explain(conn, statement, parameters)
+            except Exception as e:
+                self.explain_errors += 1
+                plan = [f"unavailable: {e}"]
+        entry = {
+            "at": datetime.utcnow().isoformat(),
+            "duration_ms": round(seconds * 1000, 3),
+            "route": request_route(scope),
+            "database": conn.engine.url.render_as_string(hide_password=True),
+            "sql": statement,
+            "parameters": (
+                {"rows": len(parameters), "shape": parameter_shape(parameters[0]) if parameters else None}
+                if executemany else parameter_shape(parameters)
+            ),
+            "plan": plan,
+        }
+        with self._lock:
+            self.entries.append(entry)
+            self.recorded += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def snapshot(self) -> dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "capacity": self.entries.maxlen,
+            "entries": len(self.entries),
+            "recorded": self.recorded,
+            "explain_errors": self.explain_errors,
+        }
+
+    def recent(self) -> list:
+        """Entries, newest first."""
+        with self._lock:
+            return list(reversed(self.entries))
+
+log = SlowQueryLog()
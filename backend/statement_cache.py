@@ -0,0 +1,214 @@
+"""
+Cache of rendered PDF statements.
+
+A statement is identified by its account, the newest transaction id that
+touches the account in the requested date range, that range, and the
+header the PDF prints: the account's current balance and status and the
+statement date. Any posting in the period changes the newest id, and any
+posting outside it (or a block) changes the header, so a stale entry can
+never be served; writes in services.py also drop the account's entries
+right away to free space.
+
+Entries live in an in-memory LRU capped in bytes. When STATEMENT_CACHE_DIR
+is set, entries evicted from memory (or too large for it) move to an
+on-disk LRU tier with its own byte cap. File names are the SHA-256 of the
+key, and each worker process keeps its own subdirectory.
+"""
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterator, Optional, Set, Tuple
+import hashlib
+import os
+import shutil
+import threading
+
+MEMORY_MAX_BYTES = int(os.getenv("STATEMENT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+DISK_DIR = os.getenv("STATEMENT_CACHE_DIR")
+DISK_MAX_BYTES = int(os.getenv("STATEMENT_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+STREAM_CHUNK_BYTES = 64 * 1024
+
+StatementKey = Tuple[int, int, Optional[date], Optional[date], float, str, str]
+
+def statement_key(account_id: int, last_transaction_id: Optional[int],
+                  start_date: Optional[date], end_date: Optional[date], header: dict) -> StatementKey:
+    """header is the statement_renderer.statement_header() the PDF is rendered with."""
+    return (account_id, last_transaction_id or 0, start_date, end_date,
+            header["balance"], header["status"], header["statement_date"])
+
+def key_digest(key: StatementKey) -> str:
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+def iter_bytes(data: bytes) -> Iterator[bytes]:
+    for offset in range(0, len(data), STREAM_CHUNK_BYTES):
+        yield data[offset:offset + STREAM_CHUNK_BYTES]
+
+def iter_open_file(f) -> Iterator[bytes]:
+    with f:
+        while True:
+            chunk = f.read(STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+class StatementCache:
+    def __init__(self, memory_max_bytes: int = MEMORY_MAX_BYTES, disk_dir: Optional[str] = DISK_DIR,
+                 disk_max_bytes: int = DISK_MAX_BYTES):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_dir = os.path.join(disk_dir, str(os.getpid())) if disk_dir else None
+        self._memory: "OrderedDict[StatementKey, bytes]" = OrderedDict()
+        self._disk: "OrderedDict[StatementKey, Tuple[str, int]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._by_account: Dict[int, Set[StatementKey]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- lookups ----------
+
+    def get(self, key: StatementKey) -> Optional[Iterator[bytes]]:
+        """Return a chunk iterator over the cached PDF, or None on a miss."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return iter_bytes(data)
+            entry = self._disk.get(key)
+            if entry is not None:
+                try:
+                    # Opened under the lock so a concurrent eviction cannot
+                    # remove the file first; unlinking an open file is safe.
+                    f = open(entry[0], "rb")
+                except FileNotFoundError:
+                    self._drop_disk(key)
+                else:
+                    self._disk.move_to_end(key)
+                    self.hits += 1
+                    return iter_open_file(f)
+            self.misses += 1
+            return None
+
+    # ---------- inserts ----------
+
+    def put_file(self, key: StatementKey, path: str) -> Iterator[bytes]:
+        """
+        Take ownership of a freshly rendered PDF file, cache it if a tier has
+        room for it, and return a chunk iterator for the current response.
+        """
+        size = os.path.getsize(path)
+        with self._lock:
+            if size <= self.memory_max_bytes:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.unlink(path)
+                self._store_memory(key, data)
+                return iter_bytes(data)
+            if self.disk_dir and size <= self.disk_max_bytes:
+                stored = self._store_disk_file(key, path, size)
+                return iter_open_file(open(stored, "rb"))
+        return self._iter_and_remove(path)
+
+    def _iter_and_remove(self, path: str) -> Iterator[bytes]:
+        try:
+            yield from iter_open_file(open(path, "rb"))
+        finally:
+            os.unlink(path)
+
+    def _track(self, key: StatementKey):
+        self._by_account.setdefault(key[0], set()).add(key)
+
+    def _untrack(self, key: StatementKey):
+        keys = self._by_account.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_account[key[0]]
+
+    def _store_memory(self, key: StatementKey, data: bytes):
+        self._drop_memory(key)
+        if key in self._disk:
+            self._drop_disk(key)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        self._track(key)
+        while self._memory_bytes > self.memory_max_bytes:
+            old_key, old_data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old_data)
+            if self.disk_dir and len(old_data) <= self.disk_max_bytes:
+                self._store_disk_bytes(old_key, old_data)
+            else:
+                self._untrack(old_key)
+
+    def _disk_path(self, key: StatementKey) -> str:
+        os.makedirs(self.disk_dir, exist_ok=True)
+        return os.path.join(self.disk_dir, f"{key_digest(key)}.pdf")
+
+    def _store_disk_bytes(self, key: StatementKey, data: bytes):
+        path = self._disk_path(key)
+        with open(path, "wb") as f:
+            f.write(data)
+        self._add_disk(key, path, len(data))
+
+    def _store_disk_file(self, key: StatementKey, source: str, size: int) -> str:
+        path = self._disk_path(key)
+        shutil.move(source, path)
+        self._add_disk(key, path, size)
+        return path
+
+    def _add_disk(self, key: StatementKey, path: str, size: int):
+        if key in self._disk:
+            self._disk_bytes -= self._disk.pop(key)[1]
+        self._disk[key] = (path, size)
+        self._disk_bytes += size
+        self._track(key)
+        while self._disk_bytes > self.disk_max_bytes:
+            self._drop_disk(next(iter(self._disk)))
+
+    # ---------- removal ----------
+
+    def _drop_memory(self, key: StatementKey):
+        data = self._memory.pop(key, None)
+        if data is not None:
+            self._memory_bytes -= len(data)
+
+    def _drop_disk(self, key: StatementKey):
+        entry = self._disk.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry[1]
+            try:
+                os.unlink(entry[0])
+            except FileNotFoundError:
+                pass
+        self._untrack(key)
+
+    def invalidate_account(self, account_id: int):
+        with self._lock:
+            for key in list(self._by_account.pop(account_id, ())):
+                self._drop_memory(key)
+                self._drop_disk(key)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for key in list(self._disk):
+                self._drop_disk(key)
+            self._by_account.clear()
+            if self.disk_dir:
+                shutil.rmtree(self.disk_dir, ignore_errors=True)
+
+    def snapshot(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "memory_max_bytes": self.memory_max_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+            "disk_max_bytes": self.disk_max_bytes if self.disk_dir else 0,
+        }
+
+cache = StatementCache()
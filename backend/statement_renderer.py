@@ -0,0 +1,166 @@
+"""
+Statement rendering off the event loop.
+
+ReportLab is pure-Python CPU work, so PDF statements are rendered in a
+small process pool instead of inside the request handler. Each worker
+reads the account's transactions from the database itself and writes the
+PDF to a temp file; the web process only streams that file back. The
+account header (balance, status, statement date) is built by the web
+process with statement_header() and passed in, so the PDF shows exactly
+what its statement cache key was computed from.
+
+Admission is bounded: at most STATEMENT_RENDER_WORKERS jobs run and
+STATEMENT_RENDER_QUEUE more may wait. Beyond that render_statement()
+raises RendererBusy and the endpoint answers 503 with Retry-After.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+from typing import Optional, Tuple
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+RENDER_WORKERS = int(os.getenv("STATEMENT_RENDER_WORKERS", "2"))
+RENDER_QUEUE_SIZE = int(os.getenv("STATEMENT_RENDER_QUEUE", "8"))
+RETRY_AFTER_SECONDS = int(os.getenv("STATEMENT_RETRY_AFTER", "5"))
+
+class RendererBusy(Exception):
+    """Raised when the render queue is full."""
+
+class RenderMetrics:
+    def __init__(self):
+        self.in_flight = 0
+        self.rendered = 0
+        self.failed = 0
+        self.rejected = 0
+        self.render_seconds_total = 0.0
+        self.render_seconds_max = 0.0
+        self.wait_seconds_total = 0.0
+
+    def snapshot(self) -> dict:
+        completed = self.rendered or 1
+        return {
+            "workers": RENDER_WORKERS,
+            "queue_capacity": RENDER_QUEUE_SIZE,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - RENDER_WORKERS),
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "render_seconds_avg": self.render_seconds_total / completed,
+            "render_seconds_max": self.render_seconds_max,
+            "wait_seconds_avg": self.wait_seconds_total / completed,
+        }
+
+metrics = RenderMetrics()
+_pool: Optional[ProcessPoolExecutor] = None
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn keeps the worker free of the parent's DB connections and threads
+        _pool = ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+# ================= WORKER SIDE =================
+
+_sessions = {}
+
+def worker_session(database_url: Optional[str] = None):
+    """Session on database_url (a read replica), or on the primary by default."""
+    from sqlalchemy.orm import sessionmaker
+    from database import SessionLocal, create_db_engine
+    if database_url is None:
+        return SessionLocal()
+    if database_url not in _sessions:
+        _sessions[database_url] = sessionmaker(autocommit=False, autoflush=False,
+                                               bind=create_db_engine(url=database_url))
+    return _sessions[database_url]()
+
+def statement_header(account, issued_on: date) -> dict:
+    """The account details printed at the top of a statement."""
+    return {
+        "account_number": account.account_number,
+        "account_type": account.account_type.value,
+        "balance": float(account.balance),
+        "status": account.status.value,
+        "statement_date": issued_on.isoformat(),
+    }
+
+def render_statement_file(account_id: int, header: dict, start_date: Optional[date] = None,
+                          end_date: Optional[date] = None, database_url: Optional[str] = None) -> Tuple[str, float]:
+    """Render an account statement to a temp file. Runs in a pool worker."""
+    from pdf_generator import render_bank_statement
+    from transaction_queries import iter_transactions, period_criteria, period_start
+
+    started = time.perf_counter()
+    db = worker_session(database_url)
+    fd, path = tempfile.mkstemp(prefix="statement_", suffix=".pdf")
+    try:
+        transactions_dict = (
+            {
+                "timestamp": txn.timestamp.isoformat() if hasattr(txn.timestamp, 'isoformat') else str(txn.timestamp),
+                "transaction_type": txn.transaction_type.value,
+                "from_account_number": txn.from_account_number,
+                "to_account_number": txn.to_account_number,
+                "amount": float(txn.amount),
+                "description": txn.description or ""
+            }
+            for txn in iter_transactions(db, *period_criteria(start_date, end_date), account_ids=[account_id],
+                                         since=period_start(start_date))
+        )
+        with os.fdopen(fd, "wb") as output:
+            render_bank_statement(header, transactions_dict, output)
+    except Exception:
+        os.unlink(path)
+        raise
+    finally:
+        db.close()
+    return path, time.perf_counter() - started
+
+# ================= WEB PROCESS SIDE =================
+
+async def render_statement(account_id: int, header: dict, start_date: Optional[date] = None,
+                           end_date: Optional[date] = None, database_url: Optional[str] = None) -> str:
+    """
+    Render a statement in the pool and return the path of the PDF file. The
+    worker reads from database_url when given, so a statement requested on a
+    replica session is rendered from that replica.
+    """
+    if metrics.in_flight >= RENDER_WORKERS + RENDER_QUEUE_SIZE:
+        metrics.rejected += 1
+        raise RendererBusy()
+    metrics.in_flight += 1
+    submitted = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        path, render_seconds = await loop.run_in_executor(
+            get_pool(), render_statement_file, account_id, header, start_date, end_date, database_url
+        )
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool for the next request.
+        metrics.failed += 1
+        shutdown_pool()
+        raise
+    except Exception:
+        metrics.failed += 1
+        raise
+    finally:
+        metrics.in_flight -= 1
+    metrics.rendered += 1
+    metrics.render_seconds_total += render_seconds
+    metrics.render_seconds_max = max(metrics.render_seconds_max, render_seconds)
+    metrics.wait_seconds_total += max(0.0, time.perf_counter() - submitted - render_seconds)
+    return path
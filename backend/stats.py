@@ -0,0 +1,150 @@
+"""
+Incrementally maintained dashboard counters.
+
+Every write path that changes a dashboard total calls bump() before its
+commit, so the counter changes commit in the same DB transaction as the
+rows they describe. bump() only appends delta rows to bank_stat_deltas;
+it never updates the shared bank_stats rows, so concurrent deposits and
+transfers do not all queue on (or conflict over) the same row.
+
+The dashboard reads every total with one statement: the bank_stats base
+values plus the sum of the pending deltas. The Compactor task folds the
+deltas into bank_stats every STATS_COMPACT_INTERVAL seconds (0 disables
+it) off the request path, which keeps the delta table small.
+recompute() rebuilds the counters from the source tables and repairs any
+drift. compact() and recompute() are synchronous so migrations can call
+them directly; async code runs them through AsyncSession.run_sync.
+"""
+from typing import Dict, Optional
+import asyncio
+import os
+from sqlalchemy import delete, func, insert, select, union_all, update
+from database import AsyncSessionLocal
+from models import Account, ArchivedTransaction, BankStat, BankStatDelta, Transaction, User, UserRole
+
+COMPACT_INTERVAL_SECONDS = float(os.getenv("STATS_COMPACT_INTERVAL", "30"))
+
+STAT_NAMES = (
+    "total_users",
+    "total_customers",
+    "total_staff",
+    "total_accounts",
+    "total_balance",
+    "total_transactions",
+)
+
+async def bump(db, **deltas: float):
+    """Add deltas to counters as part of the caller's open transaction."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    unknown = set(deltas) - set(STAT_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown stats: {', '.join(sorted(unknown))}")
+    await db.execute(insert(BankStatDelta).values([{"name": name, "value": delta} for name, delta in deltas.items()]))
+
+async def user_created(db, role: UserRole):
+    await bump(
+        db,
+        total_users=1,
+        total_customers=1 if role == UserRole.CUSTOMER else 0,
+        total_staff=1 if role == UserRole.STAFF else 0,
+    )
+
+async def read_stats(db) -> Dict[str, float]:
+    rows = union_all(
+        select(BankStat.name, BankStat.value),
+        select(BankStatDelta.name, BankStatDelta.value),
+    ).subquery()
+    values = dict((await db.execute(
+        select(rows.c.name, func.sum(rows.c.value)).group_by(rows.c.name)
+    )).all())
+    return {name: values.get(name, 0.0) for name in STAT_NAMES}
+
+def compact(db) -> int:
+    """Fold pending deltas into bank_stats and delete them; returns how many were folded."""
+    # Lock the counters first where the database supports it (SQLite ignores
+    # FOR UPDATE), so a concurrent compaction waits and then reads fresh rows
+    db.execute(select(BankStat.name).with_for_update()).all()
+    last_id = db.execute(select(func.max(BankStatDelta.id))).scalar()
+    if last_id is None:
+        return 0
+    # The fold is done in SQL rather than from sums read beforehand. On SQLite
+    # the UPDATE is the transaction's first write: it waits for the write lock
+    # and reads the deltas only once it holds it, so a compaction that loses
+    # the race finds them deleted and adds nothing
+    pending = select(func.coalesce(func.sum(BankStatDelta.value), 0.0)).where(
+        BankStatDelta.name == BankStat.name, BankStatDelta.id <= last_id
+    ).scalar_subquery()
+    db.execute(update(BankStat).values(value=BankStat.value + pending))
+    return db.execute(delete(BankStatDelta).where(BankStatDelta.id <= last_id)).rowcount
+
+def recompute(db, include_archive: bool = True, include_deltas: bool = True) -> Dict[str, float]:
+    """
+    Rebuild every counter from the source tables. include_archive=False and
+    include_deltas=False are for migrations that run before
+    transactions_archive and bank_stat_deltas exist.
+    """
+    archived = db.execute(select(func.count(ArchivedTransaction.id))).scalar() if include_archive else 0
+    values = {
+        "total_users": db.execute(select(func.count(User.id))).scalar(),
+        "total_customers": db.execute(select(func.count(User.id)).where(User.role == UserRole.CUSTOMER)).scalar(),
+        "total_staff": db.execute(select(func.count(User.id)).where(User.role == UserRole.STAFF)).scalar(),
+        "total_accounts": db.execute(select(func.count(Account.id))).scalar(),
+        "total_balance": db.execute(select(func.sum(Account.balance))).scalar() or 0.0,
+        "total_transactions": db.execute(select(func.count(Transaction.id))).scalar() + archived,
+    }
+    if include_deltas:
+        db.execute(delete(BankStatDelta))
+    db.execute(delete(BankStat))
+    db.execute(insert(BankStat), [{"name": name, "value": value} for name, value in values.items()])
+    return values
+
+class Compactor:
+    """Background task that runs compact() on the primary database."""
+    def __init__(self, interval_seconds: float = COMPACT_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self.runs = 0
+        self.folded = 0
+        self.errors = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> int:
+        async with AsyncSessionLocal() as db:
+            folded = await db.run_sync(compact)
+            await db.commit()
+        self.runs += 1
+        self.folded += folded
+        return folded
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.run_once()
+            except Exception:
+                # Another worker compacting at the same time; retried next round
+                self.errors += 1
+
+    def start(self):
+        if self.interval_seconds > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop(), name="stats-compactor")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> dict:
+        return {
+            "interval_seconds": self.interval_seconds,
+            "runs": self.runs,
+            "folded": self.folded,
+            "errors": self.errors,
+        }
+
+compactor = Compactor()
@@ -0,0 +1,234 @@
+"""
+Shared query layer for transaction listings.
+
+Every listing endpoint needs the account numbers on both sides of a
+transaction. Selecting them through two aliased outer joins keeps each
+listing at a single SELECT instead of two lazy loads per row.
+
+Feeds are paged with keyset cursors on (timestamp, id), so a deep page
+costs the same index range scan as the first one.
+
+Per-account listings are written as a UNION of a from-side and a to-side
+branch instead of `from_account_id = ? OR to_account_id = ?`, so each
+branch can walk its own (account, timestamp) index.
+
+Rows older than the hot window live in transactions_archive (see
+ledger_archive.py). Every query is built for one ledger table; the
+listing helpers read the hot table first and merge in the archive only
+when the watermarks say the requested range may reach it. Criteria are
+written against Transaction and translated for the archive by on_ledger.
+
+Request handlers call the async helpers with an AsyncSession;
+iter_transactions takes a sync Session for the statement render workers.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Iterator, List, Optional, Sequence
+import base64
+import binascii
+import heapq
+import itertools
+import json
+import os
+from fastapi import HTTPException, status
+from sqlalchemy import Column, func, select, tuple_, union, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.sql import Subquery
+from sqlalchemy.sql.visitors import replacement_traverse
+from models import Account, ArchivedTransaction, Transaction
+from schemas import TransactionResponse, TransactionPage
+import ledger_archive
+
+MAX_PAGE_SIZE = int(os.getenv("TRANSACTIONS_MAX_PAGE_SIZE", "200"))
+
+FromAccount = aliased(Account)
+ToAccount = aliased(Account)
+
+# Name of the subquery that finds a cursor row in either table; on_ledger
+# leaves it alone.
+ANCHOR_SUBQUERY = "ledger_anchor"
+
+def on_ledger(ledger, criteria) -> list:
+    """Criteria written against Transaction, rewritten for ledger's table."""
+    if ledger is Transaction:
+        return list(criteria)
+    hot, cold = Transaction.__table__, ledger.__table__
+
+    def replace(element):
+        if isinstance(element, Subquery) and element.name == ANCHOR_SUBQUERY:
+            return element
+        if isinstance(element, Column) and element.table is hot:
+            return cold.c[element.name]
+        return None
+
+    return [replacement_traverse(criterion, {}, replace) for criterion in criteria]
+
+def newest_first(stmt, ledger=Transaction):
+    return stmt.order_by(ledger.timestamp.desc(), ledger.id.desc())
+
+def merge_newest_first(*listings: Iterable, limit: Optional[int] = None) -> Iterator:
+    """Merge listings that are each newest first into one newest-first stream."""
+    merged = heapq.merge(*listings, key=lambda txn: (txn.timestamp, txn.id), reverse=True)
+    return itertools.islice(merged, limit)
+
+def account_transaction_ids(account_ids: Sequence[int], *criteria, limit: Optional[int] = None, ledger=Transaction):
+    """Ids of transactions touching any of the accounts, one index branch per side."""
+    criteria = on_ledger(ledger, criteria)
+    branches = []
+    for column in (ledger.from_account_id, ledger.to_account_id):
+        branch = newest_first(select(ledger.id, ledger.timestamp).where(column.in_(account_ids), *criteria), ledger)
+        if limit is not None:
+            branch = branch.limit(limit)
+        branches.append(select(branch.subquery()))
+    # UNION rather than UNION ALL: a transfer between two of the same
+    # customer's accounts matches both branches.
+    return union(*branches).subquery()
+
+def period_start(start_date: Optional[date] = None) -> Optional[datetime]:
+    return datetime.combine(start_date, time.min) if start_date is not None else None
+
+def period_end(end_date: Optional[date] = None) -> Optional[datetime]:
+    return datetime.combine(end_date + timedelta(days=1), time.min) if end_date is not None else None
+
+def period_criteria(start_date: Optional[date] = None, end_date: Optional[date] = None) -> list:
+    """Criteria for transactions from start_date through end_date inclusive."""
+    criteria = []
+    if start_date is not None:
+        criteria.append(Transaction.timestamp >= period_start(start_date))
+    if end_date is not None:
+        criteria.append(Transaction.timestamp < period_end(end_date))
+    return criteria
+
+async def archive_needed(db: AsyncSession, account_ids: Optional[Sequence[int]], since: Optional[datetime]) -> bool:
+    """Whether a read of the accounts' transactions from since onwards must include the archive."""
+    marks = await ledger_archive.watermarks(db)
+    if account_ids is None or marks.closed_horizon is None:
+        return marks.archive_needed(since)
+    if marks.archive_needed(since, closed_accounts=False):
+        return True
+    return marks.archive_needed(since) and await ledger_archive.includes_closed(db, account_ids)
+
+async def last_transaction_id(db: AsyncSession, account_ids: Sequence[int], *criteria,
+                              since: Optional[datetime] = None) -> Optional[int]:
+    """Highest transaction id touching any of the accounts; since is the start of the criteria's period."""
+    ledgers = [Transaction]
+    if await archive_needed(db, account_ids, since):
+        ledgers.append(ArchivedTransaction)
+    ids = []
+    for ledger in ledgers:
+        matching = account_transaction_ids(account_ids, *criteria, ledger=ledger)
+        ids.append((await db.execute(select(func.max(matching.c.id)))).scalar())
+    return max((txn_id for txn_id in ids if txn_id is not None), default=None)
+
+def transaction_listing(*criteria, account_ids: Optional[Sequence[int]] = None, limit: Optional[int] = None,
+                        ledger=Transaction):
+    """Build a SELECT of transactions plus both account numbers, newest first."""
+    stmt = select(
+        ledger,
+        FromAccount.account_number.label("from_account_number"),
+        ToAccount.account_number.label("to_account_number"),
+    )
+    if account_ids is not None:
+        matching = account_transaction_ids(account_ids, *criteria, limit=limit, ledger=ledger)
+        stmt = stmt.join(matching, ledger.id == matching.c.id)
+    else:
+        stmt = stmt.where(*on_ledger(ledger, criteria))
+    stmt = newest_first(
+        stmt.outerjoin(FromAccount, ledger.from_account_id == FromAccount.id)
+        .outerjoin(ToAccount, ledger.to_account_id == ToAccount.id),
+        ledger,
+    )
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+def to_response(txn: Transaction, from_account_number: Optional[str], to_account_number: Optional[str]) -> TransactionResponse:
+    return TransactionResponse(
+        id=txn.id,
+        from_account_id=txn.from_account_id,
+        to_account_id=txn.to_account_id,
+        amount=txn.amount,
+        transaction_type=txn.transaction_type,
+        timestamp=txn.timestamp,
+        description=txn.description,
+        from_account_number=from_account_number,
+        to_account_number=to_account_number,
+    )
+
+async def list_transactions(db: AsyncSession, *criteria, account_ids: Optional[Sequence[int]] = None,
+                            limit: Optional[int] = None, since: Optional[datetime] = None) -> List[TransactionResponse]:
+    """
+    List transactions newest first; since is the start of the criteria's
+    period, if any. When the hot table alone fills the limit, the archive
+    is only consulted for rows newer than the oldest one returned.
+    """
+    stmt = transaction_listing(*criteria, account_ids=account_ids, limit=limit)
+    items = [to_response(*row) for row in await db.execute(stmt)]
+    if limit is not None and len(items) >= limit:
+        since = items[-1].timestamp if since is None else max(since, items[-1].timestamp)
+    if not await archive_needed(db, account_ids, since):
+        return items
+    stmt = transaction_listing(*criteria, account_ids=account_ids, limit=limit, ledger=ArchivedTransaction)
+    archived = [to_response(*row) for row in await db.execute(stmt)]
+    return list(merge_newest_first(items, archived, limit=limit))
+
+def iter_transactions(db: Session, *criteria, account_ids: Optional[Sequence[int]] = None,
+                      chunk_size: int = 500, since: Optional[datetime] = None) -> Iterator[TransactionResponse]:
+    """Stream a listing from the database in chunks instead of loading it whole."""
+    marks = ledger_archive.read_watermarks(db)
+    closed = account_ids is None or (
+        marks.closed_horizon is not None
+        and db.scalar(ledger_archive.closed_account_among(account_ids)) is not None
+    )
+    ledgers = [Transaction]
+    if marks.archive_needed(since, closed_accounts=closed):
+        ledgers.append(ArchivedTransaction)
+    listings = []
+    for ledger in ledgers:
+        stmt = transaction_listing(*criteria, account_ids=account_ids, ledger=ledger).execution_options(yield_per=chunk_size)
+        listings.append(to_response(*row) for row in db.execute(stmt))
+    yield from merge_newest_first(*listings)
+
+def encode_cursor(txn_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": txn_id}).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        txn_id = json.loads(base64.urlsafe_b64decode(padded))["id"]
+        if not isinstance(txn_id, int):
+            raise ValueError(cursor)
+        return txn_id
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def keyset_after(after_id: int) -> list:
+    """Criteria selecting the rows that sort after the cursor row."""
+    # The anchor timestamp is read back from the row itself rather than
+    # carried in the token, so it always compares in the stored format.
+    # The row may have been archived since the cursor was issued.
+    rows = union_all(*(
+        select(ledger.timestamp).where(ledger.id == after_id) for ledger in (Transaction, ArchivedTransaction)
+    )).subquery(ANCHOR_SUBQUERY)
+    anchor = select(rows.c.timestamp).limit(1).scalar_subquery()
+    return [
+        Transaction.timestamp <= anchor,
+        tuple_(Transaction.timestamp, Transaction.id) < tuple_(anchor, after_id),
+    ]
+
+async def paginate_transactions(db: AsyncSession, *criteria, account_ids: Optional[Sequence[int]] = None,
+                                limit: int, cursor: Optional[str] = None) -> TransactionPage:
+    """Return one page of a transaction feed and the cursor for the next one."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        criteria = (*criteria, *keyset_after(decode_cursor(cursor)))
+    # Fetch one extra row to learn whether another page exists.
+    items = await list_transactions(db, *criteria, account_ids=account_ids, limit=limit + 1)
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1].id)
+    return TransactionPage(items=items, next_cursor=next_cursor)
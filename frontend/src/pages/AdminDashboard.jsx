@@ -49,7 +49,7 @@ function AdminDashboard() {
   const fetchTransactions = async () => {
     try {
       const response = await api.get('/admin/transactions?limit=50')
-      setTransactions(response.data)
+      setTransactions(response.data.items)
     } catch (err) {
       console.error('Failed to fetch transactions:', err)
     }
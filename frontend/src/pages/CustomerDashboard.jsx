@@ -39,7 +39,7 @@ function CustomerDashboard() {
   const fetchTransactions = async () => {
     try {
       const response = await api.get('/customer/transactions?limit=20')
-      setTransactions(response.data)
+      setTransactions(response.data.items)
     } catch (err) {
       console.error('Failed to fetch transactions:', err)
     }